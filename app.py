@@ -1,77 +1,180 @@
 # app.py - Gradio interface for CrediTrust Complaint Analyzer
 import gradio as gr
+import asyncio
 import sys
 import os
+import threading
 
 # Add src folder to path
 sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
 
 try:
     from rag_pipeline import RAGSystem
+    from vector_index import load_index
+    from serving import MicroBatcher, ServiceOverloaded
     print("✅ RAG system imported successfully")
 except ImportError as e:
     print(f"❌ Import error: {e}")
     print("Make sure you have the required packages installed")
     raise
 
+# Retrieval config: 'exact' (full float32; fastest and exact at this size)
+# or 'ivf' (ANN, for much larger corpora). 'sq8'/'pq' only save memory: they
+# are slower than exact and lose recall (PQ re-ranks by default to limit
+# the loss), so use them only when the float32 matrix does not fit in RAM
+INDEX_TYPE = 'exact'
+INDEX_PARAMS = {}
+
+# Fuse dense results with BM25 keyword matches (fee names, "overdraft", ...)
+HYBRID_RETRIEVAL = True
+
+# Query embeddings persist here so warm caches survive restarts and are
+# shared by every worker process
+QUERY_CACHE_PATH = 'vector_store/query_cache.sqlite'
+
 # Initialize RAG system
 def initialize_system():
     """Initialize the RAG system"""
     try:
-        embeddings_path = 'vector_store/sample_embeddings.parquet'
+        # Prefer the memory-mapped store (near-instant, shared across workers)
+        embeddings_path = 'vector_store/complaints_store'
+        if not os.path.exists(embeddings_path):
+            embeddings_path = 'vector_store/sample_embeddings.parquet'
         if not os.path.exists(embeddings_path):
             raise FileNotFoundError(f"Embeddings file not found: {embeddings_path}")
         
-        rag = RAGSystem(embeddings_path)
+        # Use a persisted ANN index if one was built (see vector_index.py)
+        index_path = 'vector_store/ivf_index.npz'
+        index = load_index(index_path) if os.path.exists(index_path) else None
+        if index is not None:
+            print(f"✅ Loaded ANN index: {index_path}")
+        
+        # The embedding model loads in a background thread while the UI comes up
+        rag = RAGSystem(embeddings_path, index=index, index_type=INDEX_TYPE, index_params=INDEX_PARAMS,
+                        query_cache_path=QUERY_CACHE_PATH, hybrid=HYBRID_RETRIEVAL,
+                        load_model='background')
         print("✅ RAG system initialized")
         return rag
     except Exception as e:
         print(f"❌ Failed to initialize RAG system: {e}")
         raise
 
-# Initialize
-rag_system = initialize_system()
+# The store, index and BM25 build happen on first use (or in the
+# background once the app starts), not at import time, so the UI comes up
+# while they load
+_rag_system = None
+_batcher = None
+_system_error = None
+_system_lock = threading.Lock()
+_loader = None
+
+def get_system():
+    """(rag_system, batcher), created once; concurrent callers wait for the first"""
+    global _rag_system, _batcher, _system_error
+    with _system_lock:
+        if _rag_system is None:
+            try:
+                rag = initialize_system()
+            except Exception as e:
+                _system_error = e
+                raise
+            _system_error = None
+            # Concurrent questions are embedded and scored together in micro-batches
+            _batcher = MicroBatcher(rag, max_batch_size=32, max_wait_ms=5, max_queue=256)
+            _rag_system = rag
+    return _rag_system, _batcher
 
-def analyze_complaint(question):
-    """Main function to analyze complaints"""
+async def get_system_async():
+    """get_system() without blocking the event loop while the store opens"""
+    if _rag_system is None:
+        return await asyncio.to_thread(get_system)
+    return _rag_system, _batcher
+
+def start_system():
+    """Start opening the store in a background thread (once)"""
+    global _loader
+    if _loader is None:
+        _loader = threading.Thread(target=_load_system_quietly, name='system-loader', daemon=True)
+        _loader.start()
+
+def _load_system_quietly():
+    try:
+        get_system()
+    except Exception:
+        pass  # shown by system_status; retried on the next question
+
+ALL_PRODUCTS = "All products"
+
+def product_choices(rag):
+    """Products available for filtering, read from the vector store metadata"""
+    return [ALL_PRODUCTS] + sorted(rag.store.filter_index.values('product'))
+
+def system_status():
+    """One-line readiness note for the UI"""
+    if _rag_system is None:
+        if _system_error is not None:
+            return f"🔴 Could not open the complaint store: {_system_error}"
+        return "🟡 Opening the complaint store..."
+    status = _rag_system.status()
+    if status['ready']:
+        return f"🟢 Ready: {status['chunks']} complaint excerpts indexed"
+    if status['model'].startswith('failed'):
+        return f"🔴 Embedding model {status['model']}"
+    return "🟡 Loading the embedding model; the first question may take a few seconds"
+
+def format_sources(chunks):
+    """Top 3 sources for the JSON panel"""
+    formatted_sources = []
+    for i, chunk in enumerate(chunks[:3]):
+        formatted_sources.append({
+            "rank": i + 1,
+            "product": chunk['product'],
+            "similarity": f"{chunk['similarity']:.3f}",
+            "text": chunk['text'][:200] + "..." if len(chunk['text']) > 200 else chunk['text']
+        })
+    return formatted_sources
+
+async def analyze_complaint(question, product=None):
+    """Main function to analyze complaints
+    
+    Yields (answer so far, sources): the top match and product distribution
+    appear as soon as retrieval finishes, the rest of the analysis follows.
+    """
     try:
         # Validate input
         if not question or len(question.strip()) < 3:
-            return "Please enter a valid question (at least 3 characters).", []
+            yield "Please enter a valid question (at least 3 characters).", []
+            return
         
         print(f"Processing question: {question}")
         
-        # Retrieve relevant chunks
-        chunks = rag_system.retrieve_chunks(question, k=5)
+        # Restrict the search to one product if selected
+        filters = {'product': product} if product and product != ALL_PRODUCTS else None
         
-        if not chunks:
-            return "No relevant complaints found for your question. Try a different question.", []
+        # Waits for the store on the very first question only
+        _, batcher = await get_system_async()
         
-        # Generate answer
-        answer, sources = rag_system.generate_answer(question, chunks)
-        
-        # Format sources for display
-        formatted_sources = []
-        for i, chunk in enumerate(chunks[:3]):  # Show top 3 sources
-            formatted_sources.append({
-                "rank": i + 1,
-                "product": chunk['product'],
-                "similarity": f"{chunk['similarity']:.3f}",
-                "text": chunk['text'][:200] + "..." if len(chunk['text']) > 200 else chunk['text']
-            })
-        
-        return answer, formatted_sources
+        # Retrieve relevant chunks and stream the answer (cached for repeat questions)
+        async for answer, chunks in batcher.answer_stream(question, k=5, filters=filters):
+            if not chunks:
+                yield "No relevant complaints found for your question. Try a different question.", []
+                return
+            yield answer, format_sources(chunks)
+    
+    except ServiceOverloaded:
+        yield "The system is busy right now. Please try again in a moment.", []
     
     except Exception as e:
         error_msg = f"Error processing question: {str(e)}"
         print(error_msg)
-        return error_msg, []
+        yield error_msg, []
 
 # Create Gradio interface
 with gr.Blocks(title="CrediTrust Complaint Analyzer", theme=gr.themes.Soft()) as demo:
     gr.Markdown("# 🏦 CrediTrust Financial Complaint Analyzer")
     gr.Markdown("### AI-Powered Analysis of Customer Complaints")
     gr.Markdown("Ask questions about complaints across Credit Cards, Personal Loans, Savings Accounts, and Money Transfers.")
+    status_output = gr.Markdown(system_status)
     
     with gr.Row():
         with gr.Column(scale=2):
@@ -82,6 +185,11 @@ with gr.Blocks(title="CrediTrust Complaint Analyzer", theme=gr.themes.Soft()) as
                 lines=3,
                 max_lines=3
             )
+            product_input = gr.Dropdown(
+                choices=[ALL_PRODUCTS],  # filled in by the load hook below
+                value=ALL_PRODUCTS,
+                label="Product filter"
+            )
             
             with gr.Row():
                 submit_btn = gr.Button("🔍 Analyze Complaints", variant="primary", size="lg")
@@ -130,22 +238,33 @@ with gr.Blocks(title="CrediTrust Complaint Analyzer", theme=gr.themes.Soft()) as
     )
     
     # Button actions
-    def process_and_display(question):
-        answer, sources = analyze_complaint(question)
-        return answer, sources
+    async def process_and_display(question, product):
+        async for answer, sources in analyze_complaint(question, product):
+            yield answer, sources, system_status()
     
     submit_btn.click(
         fn=process_and_display,
-        inputs=question_input,
-        outputs=[answer_output, sources_output]
+        inputs=[question_input, product_input],
+        outputs=[answer_output, sources_output, status_output]
     )
     
+    # Open the store (if not already started) and fill in the product list
+    async def on_load():
+        start_system()
+        try:
+            rag, _ = await get_system_async()
+        except Exception:
+            return gr.update(), system_status()
+        return gr.update(choices=product_choices(rag)), system_status()
+    
+    demo.load(fn=on_load, outputs=[product_input, status_output])
+    
     def clear_all():
-        return "", "*Your analysis will appear here...*", []
+        return "", ALL_PRODUCTS, "*Your analysis will appear here...*", []
     
     clear_btn.click(
         fn=clear_all,
-        outputs=[question_input, answer_output, sources_output]
+        outputs=[question_input, product_input, answer_output, sources_output]
     )
 
 # Launch application
@@ -154,6 +273,11 @@ if __name__ == "__main__":
     print("🌐 Opening web interface at http://localhost:7860")
     print("⏳ Please wait a moment for the interface to load...")
     
+    # Open the store while the server starts
+    start_system()
+    
+    # Let concurrent requests reach the batcher instead of queueing one at a time
+    demo.queue(default_concurrency_limit=64)
     demo.launch(
         server_name="0.0.0.0",
         server_port=7860,
@@ -0,0 +1,277 @@
+# aggregates.py - Precomputed complaint counts by product x company x month x issues
+#
+# Every complaint falls into one cell of the cube. A cell key packs four
+# dictionary codes into one uint64:
+#
+#   bits 52-63  product       (code 0 = missing)
+#   bits 32-51  company
+#   bits 16-31  month         (months since 1970-01, plus 1; 0 = unknown)
+#   bits  0-15  issue mask    (issue_tagger bitmask of the whole narrative)
+#
+# The cube is two sorted columns, cell keys and counts, so a count or trend
+# question is a few vectorized comparisons over the (much smaller) set of
+# cells rather than a scan of the corpus. A complaint -> cell column makes
+# updates exact: re-ingesting a complaint moves it to its new cell and
+# removing one decrements its cell.
+import json
+import os
+import re
+import numpy as np
+import pandas as pd
+from issue_tagger import default_tagger, IssueTagger, TOKEN_PATTERN
+
+AGGREGATES_NAME = 'aggregates.npz'
+
+PRODUCT_SHIFT, COMPANY_SHIFT, MONTH_SHIFT = 52, 32, 16
+PRODUCT_BITS, COMPANY_BITS, MONTH_BITS, ISSUE_BITS = 12, 20, 16, 16
+DIMENSIONS = ('product', 'company', 'month', 'issue')
+
+
+def _mask(bits):
+    return np.uint64((1 << bits) - 1)
+
+
+def month_code(value):
+    """Months since 1970-01 plus one for a date-like value (0 if missing)"""
+    if pd.isna(value):
+        return 0
+    return int(np.datetime64(str(value)[:7], 'M').astype(np.int64)) + 1
+
+
+def month_label(code):
+    return str(np.datetime64(int(code) - 1, 'M'))
+
+
+def product_aliases(name):
+    """Phrases that refer to a catalog product, for matching questions against
+
+    CFPB names list several products in one ("Credit card or prepaid card"),
+    so each part is an alias of its own, in singular and plural form.
+    """
+    aliases = set()
+    for part in re.split(r",|\bor\b", name.lower()):
+        tokens = TOKEN_PATTERN.findall(part)
+        if tokens and tokens[0] == 'other':
+            tokens = tokens[1:]  # "other personal consumer reports"
+        if not tokens:
+            continue
+        last = tokens[-1]
+        forms = {last, last[:-1] if last.endswith('s') and len(last) > 3 else last + 's'}
+        aliases.update(' '.join(tokens[:-1] + [form]) for form in forms)
+    return sorted(aliases)
+
+
+class AggregateCube:
+    """Complaint counts per (product, company, month, issue mask) cell"""
+
+    def __init__(self, products=(None,), companies=(None,), keys=None, counts=None,
+                 complaint_ids=None, complaint_cells=None):
+        self.products = list(products)     # code -> name; code 0 is missing
+        self.companies = list(companies)
+        self._codes = {'product': {name: code for code, name in enumerate(self.products)},
+                       'company': {name: code for code, name in enumerate(self.companies)}}
+        self.keys = np.empty(0, dtype=np.uint64) if keys is None else keys
+        self.counts = np.empty(0, dtype=np.int64) if counts is None else counts
+        self.complaint_ids = np.empty(0, dtype=np.int64) if complaint_ids is None else complaint_ids
+        self.complaint_cells = np.empty(0, dtype=np.uint64) if complaint_cells is None else complaint_cells
+        self._columns = None
+        self.tagger = default_tagger()
+        self._product_tagger = None
+
+    def __len__(self):
+        """Number of complaints counted"""
+        return int(self.counts.sum())
+
+    # --- building -----------------------------------------------------------
+
+    def _code(self, dimension, value, bits):
+        if pd.isna(value):
+            return 0
+        codes = self._codes[dimension]
+        code = codes.get(value)
+        if code is None:
+            names = self.products if dimension == 'product' else self.companies
+            code = codes[value] = len(names)
+            if code >= 1 << bits:
+                raise ValueError(f"Too many distinct {dimension} values for the cube ({1 << bits})")
+            names.append(value)
+        return code
+
+    def cell_keys(self, df):
+        """Cell key of every complaint in a raw complaints frame"""
+        n = len(df)
+        companies = df['Company'] if 'Company' in df.columns else [None] * n
+        dates = df['Date received'] if 'Date received' in df.columns else [None] * n
+        products = np.fromiter((self._code('product', p, PRODUCT_BITS) for p in df['Product']),
+                               dtype=np.uint64, count=n)
+        companies = np.fromiter((self._code('company', c, COMPANY_BITS) for c in companies),
+                                dtype=np.uint64, count=n)
+        months = np.fromiter((month_code(d) for d in dates), dtype=np.uint64, count=n)
+        issues = self.tagger.tag_many(df['Consumer complaint narrative'].fillna('').astype(str).tolist())
+        return (products << np.uint64(PRODUCT_SHIFT) | companies << np.uint64(COMPANY_SHIFT)
+                | months << np.uint64(MONTH_SHIFT) | issues.astype(np.uint64))
+
+    def _apply(self, keys, deltas):
+        """Add signed counts to cells, dropping cells that reach zero"""
+        merged_keys, inverse = np.unique(np.concatenate([self.keys, keys]), return_inverse=True)
+        merged = np.bincount(inverse, weights=np.concatenate([self.counts, deltas]),
+                             minlength=len(merged_keys)).astype(np.int64)
+        keep = merged != 0
+        self.keys, self.counts = merged_keys[keep], merged[keep]
+        self._columns = None
+
+    def update(self, df):
+        """Count new complaints and move re-ingested ones to their new cell"""
+        df = df.drop_duplicates('Complaint ID', keep='last')
+        ids = df['Complaint ID'].to_numpy().astype(np.int64)
+        keys = self.cell_keys(df)
+
+        positions = np.searchsorted(self.complaint_ids, ids)
+        known = positions < len(self.complaint_ids)
+        known[known] = self.complaint_ids[positions[known]] == ids[known]
+        old_keys = self.complaint_cells[positions[known]]
+        self._apply(np.concatenate([old_keys, keys]),
+                    np.concatenate([-np.ones(len(old_keys)), np.ones(len(keys))]))
+
+        self.complaint_cells[positions[known]] = keys[known]
+        order = np.argsort(np.concatenate([self.complaint_ids, ids[~known]]), kind='stable')
+        self.complaint_ids = np.concatenate([self.complaint_ids, ids[~known]])[order]
+        self.complaint_cells = np.concatenate([self.complaint_cells, keys[~known]])[order]
+        return {'added': int((~known).sum()), 'updated': int(known.sum())}
+
+    def remove(self, complaint_ids):
+        """Uncount deleted complaints (unknown IDs are ignored)"""
+        ids = np.asarray(list(complaint_ids), dtype=np.int64)
+        positions = np.searchsorted(self.complaint_ids, ids)
+        known = positions < len(self.complaint_ids)
+        known[known] = self.complaint_ids[positions[known]] == ids[known]
+        positions = positions[known]
+        self._apply(self.complaint_cells[positions], -np.ones(len(positions)))
+        keep = np.ones(len(self.complaint_ids), dtype=bool)
+        keep[positions] = False
+        self.complaint_ids, self.complaint_cells = self.complaint_ids[keep], self.complaint_cells[keep]
+        return int(len(positions))
+
+    # --- querying -----------------------------------------------------------
+
+    @property
+    def columns(self):
+        """Cell keys decoded into one NumPy column per dimension (cached)"""
+        if self._columns is None:
+            keys = self.keys
+            self._columns = {
+                'product': (keys >> np.uint64(PRODUCT_SHIFT) & _mask(PRODUCT_BITS)).astype(np.int64),
+                'company': (keys >> np.uint64(COMPANY_SHIFT) & _mask(COMPANY_BITS)).astype(np.int64),
+                'month': (keys >> np.uint64(MONTH_SHIFT) & _mask(MONTH_BITS)).astype(np.int64),
+                'issue': (keys & _mask(ISSUE_BITS)).astype(np.int64),
+            }
+        return self._columns
+
+    def products_in(self, text):
+        """Catalog products mentioned in `text`, by whole-word alias (see product_aliases)"""
+        names = [name for name in self.products if name]
+        if self._product_tagger is None or len(self._product_tagger.issues) != len(names):
+            self._product_tagger = IssueTagger([(name, product_aliases(name)) for name in names],
+                                               dtype=None)
+        return self._product_tagger.names(self._product_tagger.tag(text))
+
+    def _issue_mask(self, issues):
+        issues = [issues] if isinstance(issues, str) else list(issues)
+        unknown = set(issues) - set(self.tagger.issues)
+        if unknown:
+            raise ValueError(f"Unknown issues: {sorted(unknown)}. Choose from {self.tagger.issues}")
+        return sum(1 << self.tagger.issues.index(issue) for issue in issues)
+
+    def _select(self, product=None, company=None, issue=None, date_from=None, date_to=None):
+        """Boolean mask of cells matching the filters (issues: any of those given)"""
+        columns = self.columns
+        selected = np.ones(len(self.keys), dtype=bool)
+        for dimension, value in (('product', product), ('company', company)):
+            if value is not None:
+                values = [value] if isinstance(value, str) else list(value)
+                codes = [self._codes[dimension].get(v, -1) for v in values]
+                selected &= np.isin(columns[dimension], codes)
+        if issue is not None:
+            selected &= (columns['issue'] & self._issue_mask(issue)) != 0
+        if date_from is not None:
+            selected &= columns['month'] >= month_code(date_from)
+        if date_to is not None:
+            selected &= (columns['month'] <= month_code(date_to)) & (columns['month'] > 0)
+        return selected
+
+    def count(self, **filters):
+        """Exact number of complaints matching `filters`"""
+        return int(self.counts[self._select(**filters)].sum())
+
+    def trend(self, **filters):
+        """[(YYYY-MM, count)] per month, oldest first; complaints without a date are left out"""
+        selected = self._select(**filters) & (self.columns['month'] > 0)
+        months = self.columns['month'][selected]
+        totals = np.bincount(months, weights=self.counts[selected]) if len(months) else np.empty(0)
+        return [(month_label(m), int(totals[m])) for m in np.flatnonzero(totals)]
+
+    def breakdown(self, by, **filters):
+        """{value: count} along one dimension, largest first
+
+        For by='issue' a complaint counts once for every issue it mentions.
+        """
+        selected = self._select(**filters)
+        counts = self.counts[selected]
+        if by == 'issue':
+            masks = self.columns['issue'][selected]
+            totals = {name: int(counts[(masks >> bit & 1) == 1].sum())
+                      for bit, name in enumerate(self.tagger.issues)}
+        elif by in ('product', 'company'):
+            codes = self.columns[by][selected]
+            names = self.products if by == 'product' else self.companies
+            sums = np.bincount(codes, weights=counts, minlength=len(names))
+            totals = {names[code]: int(sums[code]) for code in np.flatnonzero(sums)}
+        elif by == 'month':
+            totals = dict(self.trend(**filters))
+        else:
+            raise ValueError(f"Unknown dimension: {by!r}. Choose from {list(DIMENSIONS)}")
+        return dict(sorted(totals.items(), key=lambda item: item[1], reverse=True))
+
+    # --- persistence ----------------------------------------------------------
+
+    def save(self, path):
+        """Write the cube as one .npz (atomically replaced)"""
+        tmp_path = path + '.tmp.npz'
+        np.savez(tmp_path, keys=self.keys, counts=self.counts, complaint_ids=self.complaint_ids,
+                 complaint_cells=self.complaint_cells,
+                 dictionaries=np.array(json.dumps({'products': self.products, 'companies': self.companies})))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            dictionaries = json.loads(str(data['dictionaries']))
+            return cls(dictionaries['products'], dictionaries['companies'], data['keys'], data['counts'],
+                       data['complaint_ids'], data['complaint_cells'])
+
+
+def build_aggregates(df, path=None, chunksize=100_000):
+    """Build a cube over raw complaints (DataFrame or iterable of frames) and optionally save it"""
+    cube = AggregateCube()
+    frames = [df] if hasattr(df, 'columns') else df
+    for frame in frames:
+        for start in range(0, len(frame), chunksize):
+            cube.update(frame.iloc[start:start + chunksize])
+    if path:
+        cube.save(path)
+        print(f"Saved aggregate cube ({len(cube.keys)} cells, {len(cube)} complaints) to: {path}")
+    return cube
+
+
+def open_aggregates(store_dir):
+    """The store's cube, or None if it has not been built"""
+    path = os.path.join(store_dir, AGGREGATES_NAME)
+    return AggregateCube.load(path) if os.path.exists(path) else None
+
+
+if __name__ == "__main__":
+    # Example usage
+    complaints = pd.read_csv('../data/processed/filtered_complaints.csv',
+                             usecols=['Complaint ID', 'Product', 'Company', 'Date received',
+                                      'Consumer complaint narrative'], chunksize=100_000)
+    build_aggregates(complaints, os.path.join('../vector_store/complaints_store', AGGREGATES_NAME))
@@ -0,0 +1,889 @@
+# benchmark.py - Performance benchmarks for the retrieval stack
+import argparse
+import time
+import numpy as np
+from vector_index import ExactIndex, IVFIndex
+
+
+def synthetic_embeddings(n, dim=384, seed=42):
+    """Random float32 vectors standing in for MiniLM embeddings"""
+    rng = np.random.default_rng(seed)
+    return rng.standard_normal((n, dim)).astype(np.float32)
+
+
+def clustered_embeddings(n, dim=384, n_topics=200, spread=0.35, seed=42):
+    """Vectors drawn around topic centers, closer to real complaint embeddings"""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((n_topics, dim)).astype(np.float32)
+    topics = rng.integers(0, n_topics, size=n)
+    noise = rng.standard_normal((n, dim)).astype(np.float32)
+    return centers[topics] + spread * noise
+
+
+def recall_at_k(approx_ids, exact_ids):
+    """Fraction of the exact top-k found by the approximate search"""
+    return len(set(approx_ids) & set(exact_ids)) / max(1, len(exact_ids))
+
+
+def time_queries(search_fn, queries, repeats=1):
+    """Time each query; return latencies in milliseconds"""
+    latencies = []
+    for _ in range(repeats):
+        for query in queries:
+            start = time.perf_counter()
+            search_fn(query)
+            latencies.append((time.perf_counter() - start) * 1000)
+    return np.array(latencies)
+
+
+def summarize_latencies(latencies):
+    """p50/p95/p99/mean summary of a latency array (ms)"""
+    return {
+        'p50_ms': float(np.percentile(latencies, 50)),
+        'p95_ms': float(np.percentile(latencies, 95)),
+        'p99_ms': float(np.percentile(latencies, 99)),
+        'mean_ms': float(latencies.mean()),
+    }
+
+
+def benchmark_exact_search(n_chunks=200_000, dim=384, n_queries=50, k=5):
+    """Compare the legacy cosine_similarity + argsort path with ExactIndex"""
+    from sklearn.metrics.pairwise import cosine_similarity
+
+    embeddings = synthetic_embeddings(n_chunks, dim)
+    queries = synthetic_embeddings(n_queries, dim, seed=7)
+
+    def legacy_search(query):
+        similarities = cosine_similarity([query], embeddings)[0]
+        return similarities.argsort()[-k:][::-1]
+
+    start = time.perf_counter()
+    index = ExactIndex(embeddings)
+    build_ms = (time.perf_counter() - start) * 1000
+
+    # Sanity check: both paths must agree on the top-k
+    for query in queries[:5]:
+        assert set(legacy_search(query)) == set(index.search(query, k)[0])
+
+    results = {
+        'legacy': summarize_latencies(time_queries(legacy_search, queries)),
+        'exact_index': summarize_latencies(time_queries(lambda q: index.search(q, k), queries)),
+    }
+
+    print(f"\n⏱️ Exact search: {n_chunks} chunks x {dim} dims, k={k}, {n_queries} queries")
+    print(f"   ExactIndex build (normalize once): {build_ms:.1f} ms")
+    for name, stats in results.items():
+        print(f"   {name:<12} p50 {stats['p50_ms']:.2f} ms | p99 {stats['p99_ms']:.2f} ms")
+    speedup = results['legacy']['p50_ms'] / results['exact_index']['p50_ms']
+    print(f"   Speedup (p50): {speedup:.1f}x")
+    return results
+
+
+def benchmark_batch_search(n_chunks=200_000, dim=384, n_queries=2000, k=5):
+    """Queries/sec of one-at-a-time search vs. ExactIndex.search_batch"""
+    embeddings = synthetic_embeddings(n_chunks, dim)
+    queries = synthetic_embeddings(n_queries, dim, seed=7)
+    index = ExactIndex(embeddings)
+
+    start = time.perf_counter()
+    for query in queries:
+        index.search(query, k)
+    single_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    index.search_batch(queries, k)
+    batch_s = time.perf_counter() - start
+
+    print(f"\n📦 Batched search: {n_chunks} chunks, {n_queries} queries, k={k}")
+    print(f"   one-at-a-time: {n_queries / single_s:>9.1f} queries/s")
+    print(f"   search_batch:  {n_queries / batch_s:>9.1f} queries/s ({single_s / batch_s:.1f}x)")
+    return {'single_qps': n_queries / single_s, 'batch_qps': n_queries / batch_s}
+
+
+def benchmark_materialization(n_chunks=200_000, ks=(5, 100, 1000, 5000)):
+    """Per-row DataFrame.iloc result assembly vs. columnar ResultBatch gathers"""
+    import pandas as pd
+    import pyarrow as pa
+    from vector_store import ColumnStore
+    from results import ResultBatch
+
+    rng = np.random.default_rng(42)
+    chunks_df = pd.DataFrame({
+        'text': [f"complaint text {i} " * 20 for i in range(n_chunks)],
+        'product': rng.choice(SYNTHETIC_PRODUCTS, n_chunks),
+        'chunk_index': rng.integers(0, 5, n_chunks),
+        'complaint_id': np.arange(n_chunks),
+    })
+    metadata = ColumnStore(pa.Table.from_pandas(chunks_df, preserve_index=False))
+
+    def legacy(rows, similarities):
+        return [{
+            'text': chunks_df.iloc[idx]['text'],
+            'product': chunks_df.iloc[idx]['product'],
+            'similarity': float(similarities[i]),
+            'chunk_index': int(chunks_df.iloc[idx]['chunk_index']),
+        } for i, idx in enumerate(rows)]
+
+    print(f"\n🧱 Result materialization over {n_chunks} chunks")
+    print(f"   {'k':>6} | {'iloc ms':>9} | {'columnar ms':>11}")
+    report = []
+    for k in ks:
+        rows = rng.choice(n_chunks, k, replace=False)
+        similarities = rng.random(k).astype(np.float32)
+        ResultBatch(metadata, rows[:1], similarities[:1]).chunks()  # warm column caches
+        legacy_ms = time_queries(lambda _: legacy(rows, similarities), [None])[0]
+        columnar_ms = time_queries(lambda _: ResultBatch(metadata, rows, similarities).chunks(), [None])[0]
+        report.append({'k': k, 'iloc_ms': float(legacy_ms), 'columnar_ms': float(columnar_ms)})
+        print(f"   {k:>6} | {legacy_ms:>9.2f} | {columnar_ms:>11.2f}")
+    return report
+
+
+def benchmark_filtered_search(n_chunks=200_000, dim=384, n_queries=50, k=5):
+    """Pre-filtered (posting list) search vs. unfiltered search, per product"""
+    import pandas as pd
+    import pyarrow as pa
+    from vector_store import VectorStore, ColumnStore
+
+    rng = np.random.default_rng(42)
+    # Skewed product mix, like the real corpus
+    weights = np.array([0.35, 0.25, 0.1, 0.1, 0.08, 0.06, 0.04, 0.02])
+    metadata = pd.DataFrame({
+        'product': rng.choice(SYNTHETIC_PRODUCTS, n_chunks, p=weights),
+        'complaint_id': np.arange(n_chunks),
+    })
+    store = VectorStore(synthetic_embeddings(n_chunks, dim),
+                        ColumnStore(pa.Table.from_pandas(metadata, preserve_index=False)))
+    index = ExactIndex(store.embeddings)
+    queries = synthetic_embeddings(n_queries, dim, seed=7)
+
+    unfiltered = summarize_latencies(time_queries(lambda q: index.search(q, k), queries))
+    print(f"\n🔎 Filtered search: {n_chunks} chunks, k={k}")
+    print(f"   {'filter':<40} | {'rows':>7} | {'p50 ms':>7}")
+    print(f"   {'(none)':<40} | {n_chunks:>7} | {unfiltered['p50_ms']:>7.2f}")
+
+    report = {'unfiltered': unfiltered, 'filtered': []}
+    for product in SYNTHETIC_PRODUCTS[:4]:
+        def filtered_search(query):
+            rows = store.filter_index.lookup({'product': product})
+            return index.search_subset(query, k, rows)
+        rows = len(store.filter_index.lookup({'product': product}))
+        stats = summarize_latencies(time_queries(filtered_search, queries))
+        report['filtered'].append({'product': product, 'rows': rows, **stats})
+        print(f"   {product[:40]:<40} | {rows:>7} | {stats['p50_ms']:>7.2f}")
+    return report
+
+
+def synthetic_texts(n, vocab_size=50_000, length=120, seed=42):
+    """Chunk-like texts with Zipf-distributed words"""
+    rng = np.random.default_rng(seed)
+    words = np.array([f"w{i}" for i in range(vocab_size)])
+    ranks = np.minimum(rng.zipf(1.1, size=n * length), vocab_size) - 1
+    return [' '.join(words[ranks[i * length:(i + 1) * length]]) for i in range(n)]
+
+
+def benchmark_lexical(n_chunks=1_000_000, n_queries=200, k=5):
+    """BM25 index build time, size and MaxScore query latency"""
+    from lexical_index import LexicalIndex, BM25Searcher
+
+    texts = synthetic_texts(n_chunks)
+    start = time.perf_counter()
+    lexical = LexicalIndex.build(texts)
+    build_s = time.perf_counter() - start
+    searcher = BM25Searcher([(lexical, None)])
+    print(f"\n🔤 BM25 index: {n_chunks} chunks, {len(lexical.doc_ids)} postings, "
+          f"{lexical.nbytes / 1e6:.0f} MB, built in {build_s:.1f}s")
+
+    # Queries mix rare and common words, like "overdraft fee on my account"
+    rng = np.random.default_rng(7)
+    report = {'build_s': build_s, 'index_mb': lexical.nbytes / 1e6}
+    for n_terms in (1, 3, 5):
+        queries = [' '.join(f"w{int(rank)}" for rank in
+                            np.minimum(rng.zipf(1.3, size=n_terms), 50_000) - 1)
+                   for _ in range(n_queries)]
+        stats = summarize_latencies(time_queries(lambda q: searcher.search(q, k), queries))
+        report[f'{n_terms}_terms'] = stats
+        print(f"   {n_terms} terms: p50 {stats['p50_ms']:.2f} ms, p95 {stats['p95_ms']:.2f} ms")
+    return report
+
+
+def benchmark_issue_tagging(n_chunks=20_000, k=5, n_answers=2000):
+    """Legacy per-request substring scans vs. Aho-Corasick tagging vs. precomputed masks"""
+    from issue_tagger import default_tagger
+
+    texts = synthetic_texts(n_chunks, vocab_size=2000, length=90)
+    keywords = ['billing', 'fee', 'login', 'customer', 'fraud', 'payment', 'credit', 'loan']
+    rng = np.random.default_rng(3)
+    # Sprinkle real issue keywords into the synthetic text
+    texts = [f"{text} {keywords[i % len(keywords)]}" for i, text in enumerate(texts)]
+    tagger = default_tagger()
+
+    def legacy_issues(chunks):
+        issues = []
+        for text in chunks:
+            text_lower = text.lower()
+            issue_keywords = [
+                ('billing', ['billing', 'charge', 'fee', 'overcharge']),
+                ('access', ['access', 'login', 'password', 'locked']),
+                ('service', ['service', 'customer', 'representative', 'support']),
+                ('fraud', ['fraud', 'unauthorized', 'theft', 'scam']),
+                ('payment', ['payment', 'transaction', 'transfer', 'withdrawal']),
+                ('credit', ['credit', 'score', 'report', 'rating']),
+                ('loan', ['loan', 'interest', 'repayment', 'debt'])
+            ]
+            for issue_name, words in issue_keywords:
+                if any(word in text_lower for word in words) and issue_name not in issues:
+                    issues.append(issue_name)
+        return issues
+
+    start = time.perf_counter()
+    masks = tagger.tag_many(texts)
+    ingest_s = time.perf_counter() - start
+
+    answers = [rng.integers(0, n_chunks, size=k) for _ in range(n_answers)]
+    timings = {}
+    for name, fn in [
+        ('legacy substring scans', lambda rows: legacy_issues([texts[i] for i in rows])),
+        ('automaton per request', lambda rows: tagger.names(
+            np.bitwise_or.reduce([tagger.tag(texts[i]) for i in rows]))),
+        ('precomputed bitmask OR', lambda rows: tagger.names(int(np.bitwise_or.reduce(masks[rows])))),
+    ]:
+        timings[name] = summarize_latencies(time_queries(fn, answers))
+
+    print(f"\n🏷️  Issue tagging: k={k} chunks per answer, "
+          f"ingest-time tagging {ingest_s / n_chunks * 1e6:.1f} µs/chunk")
+    for name, stats in timings.items():
+        print(f"   {name:<24} mean {stats['mean_ms'] * 1000:8.1f} µs per answer")
+    return {'ingest_us_per_chunk': ingest_s / n_chunks * 1e6, **timings}
+
+
+def benchmark_serving(store_path='../vector_store/sample_embeddings.parquet',
+                      concurrencies=(1, 4, 16, 64), n_requests=400, k=5):
+    """Latency/QPS vs. concurrency: one call per request vs. the micro-batching layer"""
+    import asyncio
+    from concurrent.futures import ThreadPoolExecutor
+    from rag_pipeline import RAGSystem
+    from serving import MicroBatcher, run_load_test
+
+    # Query cache off so every request pays for encoding, as with fresh questions
+    rag = RAGSystem(store_path, query_cache_size=0)
+    topics = ['credit card fees', 'late payment', 'fraud on my account', 'money transfer delay',
+              'loan interest', 'customer service', 'overdraft charge', 'locked out of account']
+    queries = [f"{topic} {i}" for i in range(n_requests) for topic in topics][:n_requests]
+
+    async def run(concurrency):
+        loop = asyncio.get_running_loop()
+        pool = ThreadPoolExecutor(max_workers=concurrency)
+        batcher = MicroBatcher(rag)
+
+        async def direct(query):
+            return await loop.run_in_executor(pool, rag.retrieve_chunks, query, k)
+
+        async def batched(query):
+            return await batcher.retrieve(query, k)
+
+        rows = []
+        for mode, request_fn in (('direct', direct), ('batched', batched)):
+            latencies, wall_s, errors = await run_load_test(request_fn, queries, concurrency, n_requests)
+            rows.append({'mode': mode, 'concurrency': concurrency, 'qps': len(latencies) / wall_s,
+                         'errors': errors, **summarize_latencies(np.array(latencies))})
+        rows[-1]['mean_batch_size'] = batcher.stats()['mean_batch_size']
+        await batcher.stop()
+        pool.shutdown()
+        return rows
+
+    print(f"\n🚦 Serving load test: {n_requests} requests, k={k}")
+    print(f"   {'mode':<8} {'conc':>5} {'QPS':>8} {'p50 ms':>8} {'p99 ms':>8} {'batch':>6}")
+    report = []
+    for concurrency in concurrencies:
+        for row in asyncio.run(run(concurrency)):
+            report.append(row)
+            print(f"   {row['mode']:<8} {concurrency:>5} {row['qps']:>8.1f} {row['p50_ms']:>8.2f} "
+                  f"{row['p99_ms']:>8.2f} {row.get('mean_batch_size', 1.0):>6.1f}")
+    return report
+
+
+def benchmark_streaming(store_path='../vector_store/sample_embeddings.parquet',
+                        concurrencies=(1, 4, 16, 64), n_requests=400, k=5):
+    """Time to first answer section vs. total latency: blocking answer() vs. answer_stream()"""
+    import asyncio
+    from rag_pipeline import RAGSystem
+    from serving import MicroBatcher
+
+    # Caches off so every request retrieves and assembles its answer
+    rag = RAGSystem(store_path, query_cache_size=0, result_cache_size=0)
+    topics = ['credit card fees', 'late payment', 'fraud on my account', 'money transfer delay',
+              'how many complaints mention loan interest', 'customer service', 'overdraft charge']
+    queries = [f"{topic} {i}" for i in range(n_requests) for topic in topics][:n_requests]
+
+    async def run(concurrency, mode):
+        batcher = MicroBatcher(rag, max_queue=max(256, concurrency))
+        first, total = [], []
+        next_request = 0
+
+        async def client():
+            nonlocal next_request
+            while next_request < n_requests:
+                query = queries[next_request]
+                next_request += 1
+                start = time.perf_counter()
+                if mode == 'blocking':
+                    await batcher.answer(query, k)
+                    first_at = time.perf_counter()  # nothing is shown before the whole answer
+                else:
+                    first_at = None
+                    async for _ in batcher.answer_stream(query, k):
+                        if first_at is None:
+                            first_at = time.perf_counter()
+                first.append((first_at - start) * 1000)
+                total.append((time.perf_counter() - start) * 1000)
+
+        await asyncio.gather(*(client() for _ in range(concurrency)))
+        await batcher.stop()
+        return np.array(first), np.array(total)
+
+    print(f"\n🌊 Streaming answers: {n_requests} requests, k={k}")
+    print(f"   {'mode':<9} {'conc':>5} {'first p50':>10} {'first p99':>10} {'total p50':>10} {'total p99':>10}")
+    report = []
+    for concurrency in concurrencies:
+        for mode in ('blocking', 'streaming'):
+            first, total = asyncio.run(run(concurrency, mode))
+            first_stats, total_stats = summarize_latencies(first), summarize_latencies(total)
+            report.append({'mode': mode, 'concurrency': concurrency,
+                           'first_p50_ms': first_stats['p50_ms'], 'first_p99_ms': first_stats['p99_ms'],
+                           'total_p50_ms': total_stats['p50_ms'], 'total_p99_ms': total_stats['p99_ms']})
+            print(f"   {mode:<9} {concurrency:>5} {first_stats['p50_ms']:>10.2f} {first_stats['p99_ms']:>10.2f} "
+                  f"{total_stats['p50_ms']:>10.2f} {total_stats['p99_ms']:>10.2f}")
+    return report
+
+
+def benchmark_ann(n_chunks=200_000, dim=384, n_queries=100, k=5, nlist=None,
+                  nprobes=(1, 2, 4, 8, 16, 32), embeddings=None):
+    """Recall@k vs. latency of IVFIndex across nprobe, measured against exact search"""
+    if embeddings is None:
+        embeddings = clustered_embeddings(n_chunks, dim)
+    rng = np.random.default_rng(7)
+    queries = embeddings[rng.choice(len(embeddings), n_queries, replace=False)]
+    queries = queries + 0.1 * rng.standard_normal(queries.shape).astype(np.float32)
+
+    exact = ExactIndex(embeddings)
+    start = time.perf_counter()
+    ivf = IVFIndex.build(embeddings, nlist=nlist)
+    build_s = time.perf_counter() - start
+
+    exact_ids = [exact.search(q, k)[0] for q in queries]
+    exact_stats = summarize_latencies(time_queries(lambda q: exact.search(q, k), queries))
+
+    print(f"\n🎯 IVF recall vs. latency: {len(embeddings)} chunks, nlist={ivf.nlist}, k={k}")
+    print(f"   Build: {build_s:.1f} s | exact p50 {exact_stats['p50_ms']:.2f} ms")
+    print(f"   {'nprobe':>6} | {'recall@k':>8} | {'p50 ms':>7} | {'p99 ms':>7}")
+
+    report = {'exact': exact_stats, 'nlist': ivf.nlist, 'build_s': build_s, 'ivf': []}
+    for nprobe in nprobes:
+        recall = np.mean([recall_at_k(ivf.search(q, k, nprobe=nprobe)[0], ids)
+                          for q, ids in zip(queries, exact_ids)])
+        stats = summarize_latencies(time_queries(lambda q: ivf.search(q, k, nprobe=nprobe), queries))
+        report['ivf'].append({'nprobe': nprobe, 'recall': float(recall), **stats})
+        print(f"   {nprobe:>6} | {recall:>8.3f} | {stats['p50_ms']:>7.2f} | {stats['p99_ms']:>7.2f}")
+    return report
+
+
+def benchmark_quantization(n_chunks=200_000, dim=384, n_queries=100, k=5, embeddings=None):
+    """Memory vs. recall@k of float32, int8 and PQ storage (with and without rerank)"""
+    from quantization import QuantizedIndex
+
+    if embeddings is None:
+        embeddings = clustered_embeddings(n_chunks, dim)
+    rng = np.random.default_rng(7)
+    queries = embeddings[rng.choice(len(embeddings), n_queries, replace=False)]
+    queries = queries + 0.1 * rng.standard_normal(queries.shape).astype(np.float32)
+
+    exact = ExactIndex(embeddings)
+    exact_ids = [exact.search(q, k)[0] for q in queries]
+    configs = [
+        ('sq8', {'quantizer': 'sq8'}),
+        ('pq48', {'quantizer': 'pq', 'm': 48, 'rerank': False}),
+        ('pq48+rerank', {'quantizer': 'pq', 'm': 48, 'rerank': True}),
+    ]
+
+    exact_stats = summarize_latencies(time_queries(lambda q: exact.search(q, k), queries))
+    print(f"\n🗜️ Quantization: {len(embeddings)} chunks x {embeddings.shape[1]} dims, k={k}")
+    print(f"   {'store':<12} | {'MB':>8} | {'recall@k':>8} | {'p50 ms':>7}")
+    print(f"   {'float32':<12} | {exact.vectors.nbytes / 2**20:>8.1f} | {1.0:>8.3f} | {exact_stats['p50_ms']:>7.2f}")
+
+    report = {'float32': {'mb': exact.vectors.nbytes / 2**20, 'recall': 1.0, **exact_stats}}
+    for name, params in configs:
+        index = QuantizedIndex.build(embeddings, **params)
+        recall = np.mean([recall_at_k(index.search(q, k)[0], ids)
+                          for q, ids in zip(queries, exact_ids)])
+        stats = summarize_latencies(time_queries(lambda q: index.search(q, k), queries))
+        # Rerank vectors would normally be memory-mapped, so only codes count as resident
+        report[name] = {'mb': index.nbytes / 2**20, 'recall': float(recall), **stats}
+        print(f"   {name:<12} | {index.nbytes / 2**20:>8.1f} | {recall:>8.3f} | {stats['p50_ms']:>7.2f}")
+    return report
+
+
+COLD_START_SCRIPTS = {
+    'parquet+np.stack': """
+import pandas as pd, numpy as np
+df = pd.read_parquet({path!r})
+embeddings = np.stack(df['embedding'].values)
+text = df['text'].iloc[0]
+""",
+    'vector_store (mmap)': """
+from vector_store import load_vector_store
+from vector_index import ExactIndex
+store = load_vector_store({path!r})
+index = ExactIndex(store.embeddings, normalized=store.normalized)
+text = store.metadata.value('text', 0)
+""",
+}
+
+
+def benchmark_cold_start(parquet_path, store_dir, runs=3):
+    """Time-to-servable for the legacy parquet load vs. the mmap store, in fresh processes"""
+    import json
+    import os
+    import subprocess
+    import sys
+
+    paths = {'parquet+np.stack': parquet_path, 'vector_store (mmap)': store_dir}
+    src_dir = os.path.dirname(os.path.abspath(__file__))
+    report = {}
+    print(f"\n🧊 Cold start: {parquet_path} vs. {store_dir} ({runs} runs each)")
+    for name, script in COLD_START_SCRIPTS.items():
+        timed = (
+            "import time, resource\n"
+            "start = time.perf_counter()\n"
+            + script.format(path=os.path.abspath(paths[name])) +
+            "\nimport json\n"
+            "print(json.dumps({'seconds': time.perf_counter() - start,\n"
+            "                  'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}))\n"
+        )
+        samples = []
+        for _ in range(runs):
+            out = subprocess.run([sys.executable, '-c', timed], cwd=src_dir,
+                                 capture_output=True, text=True, check=True)
+            samples.append(json.loads(out.stdout.strip().splitlines()[-1]))
+        report[name] = {
+            'seconds': float(np.median([s['seconds'] for s in samples])),
+            'max_rss_mb': float(np.median([s['max_rss_mb'] for s in samples])),
+        }
+        print(f"   {name:<20} {report[name]['seconds'] * 1000:>8.1f} ms | peak RSS {report[name]['max_rss_mb']:.0f} MB")
+    return report
+
+
+STARTUP_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+from rag_pipeline import RAGSystem
+import_s = time.perf_counter() - start
+heavy = sorted(m for m in ('torch', 'sentence_transformers', 'sklearn', 'pandas') if m in sys.modules)
+rag = RAGSystem({path!r}, load_model='lazy')
+servable_s = time.perf_counter() - start
+rag.model
+rag.retrieve_chunks('What are common credit card issues?', k=5)
+print(json.dumps({{'import_s': import_s, 'servable_s': servable_s, 'heavy_modules': heavy,
+                  'first_query_s': time.perf_counter() - start, **rag.timings}}))
+"""
+
+
+def benchmark_startup(store_path, runs=3):
+    """Startup breakdown (import, data load, index build, model load) in fresh processes"""
+    import json
+    import os
+    import subprocess
+    import sys
+
+    script = STARTUP_SCRIPT.format(path=os.path.abspath(store_path))
+    samples = []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, check=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__)))
+        samples.append(json.loads(out.stdout.strip().splitlines()[-1]))
+    phases = ['import_s', 'data_load_s', 'index_build_s', 'servable_s', 'model_load_s', 'first_query_s']
+    report = {phase: float(np.median([sample[phase] for sample in samples])) for phase in phases}
+    report['heavy_modules'] = samples[0]['heavy_modules']
+
+    print(f"\n🚦 Startup breakdown: {store_path} (median of {runs} fresh processes)")
+    print(f"   import rag_pipeline     {report['import_s'] * 1000:>8.1f} ms "
+          f"(heavy modules imported: {', '.join(report['heavy_modules']) or 'none'})")
+    print(f"   data load               {report['data_load_s'] * 1000:>8.1f} ms")
+    print(f"   index build             {report['index_build_s'] * 1000:>8.1f} ms")
+    print(f"   ⇒ servable (UI can start) {report['servable_s'] * 1000:>6.1f} ms")
+    print(f"   model load (deferred)   {report['model_load_s'] * 1000:>8.1f} ms")
+    print(f"   ⇒ first answered query  {report['first_query_s'] * 1000:>8.1f} ms")
+    return report
+
+
+SYNTHETIC_PRODUCTS = [
+    'Credit card', 'Checking or savings account', 'Mortgage', 'Debt collection',
+    'Money transfer, virtual currency, or money service', 'Student loan',
+    'Payday loan, title loan, personal loan, or advance loan',
+    'Credit reporting, credit repair services, or other personal consumer reports',
+]
+
+
+def write_synthetic_complaints_csv(path, target_gb=2.0, template_csv='../data/processed/filtered_complaints.csv',
+                                   batch_rows=50_000, seed=42):
+    """Write a raw-CFPB-shaped CSV of roughly `target_gb` by resampling real rows"""
+    import os
+    import pandas as pd
+
+    rng = np.random.default_rng(seed)
+    template = pd.read_csv(template_csv)
+    target_bytes = target_gb * 1024 ** 3
+    next_id = 1
+    header = True
+    with open(path, 'w') as f:
+        while f.tell() < target_bytes:
+            batch = template.iloc[rng.integers(0, len(template), batch_rows)].copy()
+            batch['Product'] = rng.choice(SYNTHETIC_PRODUCTS, batch_rows)
+            # Roughly a third of raw complaints have no published narrative
+            batch.loc[rng.random(batch_rows) < 0.35, 'Consumer complaint narrative'] = None
+            batch['Complaint ID'] = np.arange(next_id, next_id + batch_rows)
+            next_id += batch_rows
+            batch.to_csv(f, header=header, index=False)
+            header = False
+    print(f"Wrote synthetic CSV: {path} ({os.path.getsize(path) / 1024 ** 3:.2f} GB, {next_id - 1} rows)")
+    return path
+
+
+def benchmark_streaming_ingest(csv_path, output_path='/tmp/filtered_complaints.parquet', chunksize=50_000):
+    """Peak RSS and throughput of stream_filter_to_parquet, run in a fresh process"""
+    import json
+    import os
+    import subprocess
+    import sys
+
+    script = (
+        "import json\n"
+        "from data_processing import stream_filter_to_parquet\n"
+        f"stats = stream_filter_to_parquet({csv_path!r}, {output_path!r}, chunksize={chunksize})\n"
+        "print(json.dumps(stats))\n"
+    )
+    out = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, check=True,
+                         cwd=os.path.dirname(os.path.abspath(__file__)))
+    stats = json.loads(out.stdout.strip().splitlines()[-1])
+    input_gb = os.path.getsize(csv_path) / 1024 ** 3
+    print(f"\n🌊 Streaming ingest: {input_gb:.2f} GB CSV, chunksize={chunksize}")
+    print(f"   {stats['rows_read']} rows read, {stats['rows_written']} kept in {stats['seconds']:.1f} s")
+    print(f"   Throughput: {stats['rows_per_sec']:,.0f} rows/s | {stats['mb_per_sec']:.1f} MB/s")
+    print(f"   Peak RSS: {stats['peak_rss_mb']:.0f} MB")
+    return stats
+
+
+def benchmark_parallel_embedding(data_path='../data/processed/filtered_complaints.csv',
+                                 worker_counts=None, store_dir='/tmp/parallel_embedding_store'):
+    """chunks/sec of create_embeddings_parallel for increasing worker counts"""
+    import os
+    from chunking_embedding import load_filtered_data
+    from parallel_embedding import create_embeddings_parallel
+
+    df = load_filtered_data(data_path)
+    cpus = os.cpu_count() or 1
+    worker_counts = worker_counts or sorted({1, 2, 4, 8, 16, cpus} & set(range(1, cpus + 1)))
+
+    report = []
+    for workers in worker_counts:
+        stats = create_embeddings_parallel(df, store_dir, num_workers=workers)
+        report.append(stats)
+
+    base = report[0]['chunks_per_sec']
+    print(f"\n⚡ Parallel embedding scaling ({report[0]['chunks']} chunks, {cpus} CPUs)")
+    print(f"   {'workers':>7} | {'chunks/s':>9} | {'speedup':>7} | {'efficiency':>10}")
+    for stats in report:
+        speedup = stats['chunks_per_sec'] / base
+        print(f"   {stats['workers']:>7} | {stats['chunks_per_sec']:>9.1f} | {speedup:>6.2f}x | "
+              f"{speedup / (stats['workers'] / report[0]['workers']):>9.0%}")
+    return report
+
+
+def benchmark_encoders(model_dir='../vector_store/minilm_onnx', threads=None, n_single=50, n_bulk=512):
+    """Single-query latency, bulk throughput and drift of each encoder backend on CPU"""
+    import os
+    from encoders import load_encoder, compare_encoders, export_onnx, CALIBRATION_TEXTS, MIN_COSINE
+
+    if not os.path.exists(model_dir):
+        export_onnx(model_dir)
+    threads = threads or os.cpu_count() or 1
+    # Distinct texts so nothing is served from a cache; corpus chunks are longer
+    n_texts = len(CALIBRATION_TEXTS)
+    queries = [f"{CALIBRATION_TEXTS[i % n_texts]} (case {i})" for i in range(n_single)]
+    corpus = [" ".join(CALIBRATION_TEXTS[i % n_texts:] + CALIBRATION_TEXTS[:i % n_texts]) + f" ({i})"
+              for i in range(n_bulk)]
+
+    reference = load_encoder('torch', threads=threads)
+    report = {}
+    print(f"\n🧮 Encoder backends: {threads} threads, {n_single} single queries, {n_bulk} bulk chunks")
+    for backend in ['torch', 'onnx', 'onnx-int8']:
+        encoder = reference if backend == 'torch' else load_encoder(backend, model_dir, threads=threads)
+        encoder.encode(queries[:2])  # warm up
+        single = summarize_latencies(time_queries(encoder.encode, queries))
+        start = time.perf_counter()
+        encoder.encode(corpus, batch_size=64)
+        bulk = n_bulk / (time.perf_counter() - start)
+        cosines = compare_encoders(reference, encoder, corpus[:64] + queries)
+        report[backend] = {**single, 'chunks_per_sec': bulk, 'min_cosine': float(cosines.min())}
+        tolerance = MIN_COSINE.get(backend)
+        print(f"   {backend:<10} p50 {single['p50_ms']:>6.2f} ms | p99 {single['p99_ms']:>6.2f} ms | "
+              f"{bulk:>7.1f} chunks/s | min cosine {cosines.min():.4f}"
+              + (f" (tolerance {tolerance})" if tolerance else ""))
+    return report
+
+
+def benchmark_chunking(data_path='../data/processed/filtered_complaints.csv', n_complaints=20_000):
+    """Narratives/sec and token-count spread of legacy char chunks vs. the sentence chunker"""
+    import pandas as pd
+    from chunking_embedding import chunk_text
+    from chunker import SentenceChunker, TokenCounter
+
+    texts = pd.read_csv(data_path, usecols=['Consumer complaint narrative'], nrows=n_complaints)
+    texts = texts['Consumer complaint narrative'].dropna().astype(str).tolist()
+    counter = TokenCounter()
+
+    start = time.perf_counter()
+    legacy = [chunk for text in texts for chunk in chunk_text(text)]
+    legacy_s = time.perf_counter() - start
+
+    chunker = SentenceChunker(token_counter=counter)
+    start = time.perf_counter()
+    sentence = [chunk for _, chunks in chunker.iter_chunks(texts) for chunk in chunks]
+    sentence_s = time.perf_counter() - start
+
+    print(f"\n✂️ Chunking {len(texts)} narratives")
+    for name, chunks, seconds in [('chars (legacy)', legacy, legacy_s), ('sentences', sentence, sentence_s)]:
+        tokens = counter.count(chunks)
+        # Padding waste when chunks of similar length are batched 64 at a time
+        ordered = np.sort(tokens)
+        padded = sum(ordered[i:i + 64].max() * len(ordered[i:i + 64]) for i in range(0, len(ordered), 64))
+        print(f"   {name:<15} {len(texts) / seconds:>9,.0f} narratives/s | {len(chunks)} chunks | "
+              f"tokens p5/p50/p95 {np.percentile(tokens, 5):.0f}/{np.percentile(tokens, 50):.0f}/"
+              f"{np.percentile(tokens, 95):.0f} | max {tokens.max()} | padding {1 - tokens.sum() / padded:.1%}")
+
+
+def benchmark_dedup(data_path='../data/processed/filtered_complaints.csv', n_complaints=20_000,
+                    thresholds=(0.8, 0.9, 0.95), embed_chunks_per_sec=None):
+    """Index-size and embedding-time savings of near-duplicate collapsing"""
+    import pandas as pd
+    from chunking_embedding import build_chunks
+    from dedup import dedup_chunks
+
+    chunks_df = build_chunks(pd.read_csv(data_path, nrows=n_complaints))
+    if embed_chunks_per_sec is None:
+        from encoders import load_encoder
+        sample = chunks_df['text'].tolist()[:512]
+        encoder = load_encoder('torch')
+        start = time.perf_counter()
+        encoder.encode(sample, batch_size=64)
+        embed_chunks_per_sec = len(sample) / (time.perf_counter() - start)
+
+    print(f"\n🧬 Near-duplicate collapsing: {len(chunks_df)} chunks from {n_complaints} complaints "
+          f"(embedding at {embed_chunks_per_sec:.0f} chunks/s)")
+    report = {}
+    for threshold in thresholds:
+        start = time.perf_counter()
+        _, stats = dedup_chunks(chunks_df, threshold=threshold)
+        stats['dedup_seconds'] = time.perf_counter() - start
+        stats['embed_seconds_saved'] = stats['removed'] / embed_chunks_per_sec
+        stats['index_mb_saved'] = stats['removed'] * 384 * 4 / (1024 * 1024)
+        report[threshold] = stats
+        print(f"   threshold {threshold:.2f}: -{stats['removed']} chunks ({stats['reduction']:.1%}) | "
+              f"dedup {stats['dedup_seconds']:.1f}s | embedding saved {stats['embed_seconds_saved']:.1f}s | "
+              f"index saved {stats['index_mb_saved']:.1f} MB")
+    return report
+
+
+def benchmark_instrumentation(n_chunks=200_000, dim=384, n_queries=200, k=5, n_timers=200_000):
+    """Cost of the RAGSystem stage timers relative to one exact search"""
+    from metrics import RetrievalMetrics
+
+    # Per-timer cost, measured directly (the end-to-end difference is below the noise)
+    metrics = RetrievalMetrics()
+    start = time.perf_counter()
+    for _ in range(n_timers):
+        with metrics.stage('search'):
+            pass
+    timer_us = (time.perf_counter() - start) / n_timers * 1e6
+
+    index = ExactIndex(synthetic_embeddings(n_chunks, dim))
+    queries = synthetic_embeddings(n_queries, dim, seed=7)
+    search = summarize_latencies(time_queries(lambda q: index.search(q, k), queries))
+    timers_per_query = 4  # retrieve, encode, search, materialize
+    overhead_us = timer_us * timers_per_query
+
+    print(f"\n📈 Instrumentation overhead ({n_chunks} chunks, k={k})")
+    print(f"   One stage timer: {timer_us:.2f} µs | exact search p50 {search['p50_ms']:.3f} ms")
+    print(f"   {timers_per_query} timers per retrieve_chunks: {overhead_us:.1f} µs "
+          f"({overhead_us / 1000 / search['p50_ms']:.3%} of the search alone)")
+    return {'timer_us': timer_us, 'search': search, 'overhead_us': overhead_us}
+
+
+def benchmark_sharding(n_chunks=1_000_000, dim=384, n_queries=100, k=5, shard_counts=None,
+                       work_dir='/tmp/sharding_benchmark'):
+    """Scatter-gather latency and QPS for increasing shard counts (local worker processes)"""
+    import os
+    import pandas as pd
+    from sharding import build_shards_from_parquet, ShardedSearcher
+
+    cpus = os.cpu_count() or 1
+    shard_counts = shard_counts or sorted({1, 2, 4, 8, cpus} & set(range(1, cpus + 1)))
+    embeddings = clustered_embeddings(n_chunks, dim)
+    queries = synthetic_embeddings(n_queries, dim, seed=7)
+    os.makedirs(work_dir, exist_ok=True)
+    parquet_path = os.path.join(work_dir, 'chunks.parquet')
+    pd.DataFrame({'text': [''] * n_chunks, 'embedding': list(embeddings),
+                  'complaint_id': np.arange(n_chunks), 'product': 'Credit card',
+                  'chunk_index': 0}).to_parquet(parquet_path)
+
+    baseline = ExactIndex(embeddings)
+    report = {'single_process': summarize_latencies(time_queries(lambda q: baseline.search(q, k), queries))}
+    print(f"\n🧩 Sharded search: {n_chunks} chunks x {dim} dims, k={k}, {n_queries} queries, {cpus} CPUs")
+    print(f"   {'shards':>6} | {'p50 ms':>8} | {'p99 ms':>8} | {'batch QPS':>9} | recall")
+    print(f"   {'1 proc':>6} | {report['single_process']['p50_ms']:>8.2f} | "
+          f"{report['single_process']['p99_ms']:>8.2f} |")
+    exact_ids = [set(baseline.search(q, k)[0]) for q in queries[:20]]
+
+    for n_shards in shard_counts:
+        shard_dir = os.path.join(work_dir, f"shards-{n_shards}")
+        build_shards_from_parquet(parquet_path, shard_dir, n_shards=n_shards)
+        with ShardedSearcher(shard_dir) as searcher:
+            searcher.search(queries[0], k)  # warm up the worker processes
+            stats = summarize_latencies(time_queries(lambda q: searcher.search(q, k), queries))
+            start = time.perf_counter()
+            searcher.search_batch(queries, k)
+            stats['batch_qps'] = n_queries / (time.perf_counter() - start)
+            # Shard rows are local: compare merged hits by complaint_id (= global row here)
+            stats['recall'] = float(np.mean([
+                recall_at_k([chunk.complaint_id for chunk in searcher.materialize(searcher.search(q, k)[0])],
+                            expected) for q, expected in zip(queries[:20], exact_ids)]))
+        report[n_shards] = stats
+        print(f"   {n_shards:>6} | {stats['p50_ms']:>8.2f} | {stats['p99_ms']:>8.2f} | "
+              f"{stats['batch_qps']:>9.1f} | {stats['recall']:.3f}")
+    return report
+
+
+def benchmark_aggregates(n_complaints=1_000_000, n_queries=200, update_size=10_000):
+    """Aggregate-cube build/update time and count/trend latency vs scanning the complaints"""
+    import pandas as pd
+    from aggregates import AggregateCube
+    from issue_tagger import default_tagger, ISSUE_KEYWORDS
+
+    rng = np.random.default_rng(42)
+    products = np.array(['Credit card', 'Personal loan', 'Savings account', 'Money transfers', 'Mortgage'])
+    companies = np.array([f"Company {i}" for i in range(100)])
+    phrases = np.array([keywords[0] for _, keywords in ISSUE_KEYWORDS] + ['my account'])
+    narratives = [f"I have a problem with {a} and also {b}."
+                  for a, b in zip(rng.choice(phrases, n_complaints), rng.choice(phrases, n_complaints))]
+    df = pd.DataFrame({
+        'Complaint ID': np.arange(n_complaints),
+        'Product': rng.choice(products, n_complaints),
+        'Company': rng.choice(companies, n_complaints),
+        'Date received': (np.datetime64('2015-01-01') + rng.integers(0, 3650, n_complaints)).astype(str),
+        'Consumer complaint narrative': narratives,
+    })
+
+    start = time.perf_counter()
+    cube = AggregateCube()
+    cube.update(df)
+    build_s = time.perf_counter() - start
+    print(f"\n🧊 Aggregate cube: {n_complaints} complaints -> {len(cube.keys)} cells, built in {build_s:.1f}s")
+
+    start = time.perf_counter()
+    changed = df.sample(update_size, random_state=7).assign(**{'Product': 'Mortgage'})
+    cube.update(changed)
+    update_ms = (time.perf_counter() - start) * 1000
+    df.loc[changed.index, 'Product'] = 'Mortgage'
+
+    # Ground truth by scanning: tag every narrative, then filter the frame
+    tagger = default_tagger()
+    df['issues'] = tagger.tag_many(df['Consumer complaint narrative'].tolist())
+    issue_bits = {name: 1 << bit for bit, name in enumerate(tagger.issues)}
+    questions = [(tagger.issues[i % len(tagger.issues)], products[i % len(products)]) for i in range(n_queries)]
+
+    def scan(issue, product):
+        return int(((df['issues'] & issue_bits[issue]) != 0)[df['Product'] == product].sum())
+
+    exact = all(cube.count(issue=issue, product=product) == scan(issue, product)
+                for issue, product in questions[:20])
+    report = {'cells': len(cube.keys), 'build_s': build_s, 'update_ms': update_ms, 'exact': exact,
+              'count': summarize_latencies(time_queries(lambda q: cube.count(issue=q[0], product=q[1]), questions)),
+              'trend': summarize_latencies(time_queries(lambda q: cube.trend(issue=q[0], product=q[1]), questions)),
+              'scan': summarize_latencies(time_queries(lambda q: scan(*q), questions[:20]))}
+    print(f"   update of {update_size} re-ingested complaints: {update_ms:.0f} ms | counts exact: {exact}")
+    for name in ('count', 'trend', 'scan'):
+        print(f"   {name:<6} p50 {report[name]['p50_ms']:>8.2f} ms | p99 {report[name]['p99_ms']:>8.2f} ms")
+    return report
+
+
+def load_parquet_embeddings(parquet_path):
+    """Stack the embedding column of a create_embeddings parquet"""
+    import pandas as pd
+    chunks_df = pd.read_parquet(parquet_path, columns=['embedding'])
+    return np.stack(chunks_df['embedding'].values)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Retrieval benchmarks")
+    parser.add_argument('benchmark', choices=['exact', 'batch', 'materialize', 'filter', 'lexical', 'tagging', 'serving', 'ann', 'quant', 'coldstart', 'startup', 'ingest', 'embed', 'encoders', 'chunking', 'dedup', 'metrics', 'sharding', 'aggregates', 'streaming'], help="Benchmark to run")
+    parser.add_argument('--chunks', type=int, default=200_000)
+    parser.add_argument('--queries', type=int, default=50)
+    parser.add_argument('--k', type=int, default=5)
+    parser.add_argument('--parquet', help="Use real embeddings from a create_embeddings parquet")
+    parser.add_argument('--store', default='../vector_store/complaints_store',
+                        help="Vector store directory (coldstart)")
+    parser.add_argument('--csv', default='/tmp/synthetic_complaints.csv',
+                        help="Raw CSV for the ingest benchmark (generated if missing)")
+    parser.add_argument('--gb', type=float, default=2.0, help="Size of the synthetic CSV")
+    args = parser.parse_args()
+
+    if args.benchmark == 'exact':
+        benchmark_exact_search(n_chunks=args.chunks, n_queries=args.queries, k=args.k)
+    elif args.benchmark == 'batch':
+        benchmark_batch_search(n_chunks=args.chunks, n_queries=args.queries, k=args.k)
+    elif args.benchmark == 'materialize':
+        benchmark_materialization(n_chunks=args.chunks)
+    elif args.benchmark == 'filter':
+        benchmark_filtered_search(n_chunks=args.chunks, n_queries=args.queries, k=args.k)
+    elif args.benchmark == 'lexical':
+        benchmark_lexical(n_chunks=args.chunks, n_queries=args.queries, k=args.k)
+    elif args.benchmark == 'tagging':
+        benchmark_issue_tagging(k=args.k)
+    elif args.benchmark == 'serving':
+        import os
+        store_path = args.store if os.path.exists(args.store) else '../vector_store/sample_embeddings.parquet'
+        benchmark_serving(store_path, n_requests=args.queries, k=args.k)
+    elif args.benchmark == 'ann':
+        embeddings = load_parquet_embeddings(args.parquet) if args.parquet else None
+        benchmark_ann(n_chunks=args.chunks, n_queries=args.queries, k=args.k, embeddings=embeddings)
+    elif args.benchmark == 'quant':
+        embeddings = load_parquet_embeddings(args.parquet) if args.parquet else None
+        benchmark_quantization(n_chunks=args.chunks, n_queries=args.queries, k=args.k, embeddings=embeddings)
+    elif args.benchmark == 'coldstart':
+        benchmark_cold_start(args.parquet or '../vector_store/sample_embeddings.parquet', args.store)
+    elif args.benchmark == 'startup':
+        import os
+        store_path = args.store if os.path.exists(args.store) else '../vector_store/sample_embeddings.parquet'
+        benchmark_startup(store_path)
+    elif args.benchmark == 'ingest':
+        import os
+        if not os.path.exists(args.csv):
+            write_synthetic_complaints_csv(args.csv, target_gb=args.gb)
+        benchmark_streaming_ingest(args.csv)
+    elif args.benchmark == 'embed':
+        benchmark_parallel_embedding()
+    elif args.benchmark == 'encoders':
+        benchmark_encoders()
+    elif args.benchmark == 'chunking':
+        benchmark_chunking()
+    elif args.benchmark == 'dedup':
+        benchmark_dedup()
+    elif args.benchmark == 'metrics':
+        benchmark_instrumentation(n_chunks=args.chunks, k=args.k)
+    elif args.benchmark == 'sharding':
+        benchmark_sharding(n_chunks=args.chunks, n_queries=args.queries, k=args.k)
+    elif args.benchmark == 'aggregates':
+        benchmark_aggregates(n_complaints=args.chunks, n_queries=args.queries)
+    elif args.benchmark == 'streaming':
+        import os
+        store_path = args.store if os.path.exists(args.store) else '../vector_store/sample_embeddings.parquet'
+        benchmark_streaming(store_path, n_requests=args.queries, k=args.k)
@@ -0,0 +1,206 @@
+# caching.py - Caches for the retrieval hot path
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+
+
+def normalize_query(query):
+    """Cache key for a query: case- and whitespace-insensitive"""
+    return ' '.join(query.lower().split())
+
+
+class SqliteEmbeddingStore:
+    """Persistent embedding table shared by every process using the same file"""
+
+    def __init__(self, path, model_name):
+        self.path = path
+        self.model_name = model_name
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS query_embeddings ("
+                " model TEXT NOT NULL, query TEXT NOT NULL, embedding BLOB NOT NULL,"
+                " PRIMARY KEY (model, query))"
+            )
+
+    def _connection(self):
+        # One connection per thread; WAL lets many readers run alongside a writer
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        row = self._connection().execute(
+            "SELECT embedding FROM query_embeddings WHERE model = ? AND query = ?",
+            (self.model_name, key)).fetchone()
+        return np.frombuffer(row[0], dtype=np.float32) if row else None
+
+    def put(self, key, embedding):
+        with self._connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO query_embeddings (model, query, embedding) VALUES (?, ?, ?)",
+                (self.model_name, key, np.asarray(embedding, dtype=np.float32).tobytes()))
+
+
+class QueryEmbeddingCache:
+    """Bounded LRU cache of query embeddings with an optional sqlite backing store"""
+
+    def __init__(self, max_size=1024, path=None, model_name='all-MiniLM-L6-v2'):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk = SqliteEmbeddingStore(path, model_name) if path else None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, query):
+        key = normalize_query(query)
+        with self._lock:
+            embedding = self._entries.get(key)
+            if embedding is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return embedding
+
+        if self._disk is not None:
+            embedding = self._disk.get(key)
+            if embedding is not None:
+                self._remember(key, embedding)
+                with self._lock:
+                    self.disk_hits += 1
+                return embedding
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, query, embedding):
+        key = normalize_query(query)
+        embedding = np.array(embedding, dtype=np.float32)
+        self._remember(key, embedding)
+        if self._disk is not None:
+            self._disk.put(key, embedding)
+
+    def get_or_compute(self, query, encode_fn):
+        """Return the cached embedding, or compute it with `encode_fn` and cache it"""
+        embedding = self.get(query)
+        if embedding is None:
+            embedding = encode_fn(query)
+            self.put(query, embedding)
+        return embedding
+
+    def _remember(self, key, embedding):
+        embedding.flags.writeable = False  # shared between callers
+        with self._lock:
+            self._entries[key] = embedding
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            'size': len(self._entries),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'hit_rate': (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+        }
+
+
+class ResultCache:
+    """LRU + TTL cache of full retrieval/answer results
+
+    Entries are tagged with the vector store version they were computed
+    against; a lookup with a newer version drops everything cached so far.
+    Only lookups switch versions: a result computed against any other
+    version than the current one (e.g. by a request that started before a
+    store refresh) is not stored.
+    """
+
+    def __init__(self, max_size=512, ttl_seconds=3600, clock=time.monotonic):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self.version = None
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def make_key(query, k, filters=None):
+        frozen_filters = tuple(sorted(
+            (name, tuple(sorted(value)) if isinstance(value, (list, tuple, set)) else value)
+            for name, value in (filters or {}).items() if value is not None))
+        return (normalize_query(query), k, frozen_filters)
+
+    def _check_version(self, version):
+        if version != self.version:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self.version = version
+
+    def get(self, key, version):
+        with self._lock:
+            self._check_version(version)
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value = entry
+            if self.clock() >= expires_at:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value, version):
+        with self._lock:
+            if version != self.version:
+                return
+            self._entries[key] = (self.clock() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'max_size': self.max_size,
+            'ttl_seconds': self.ttl_seconds,
+            'version': self.version,
+            'hits': self.hits,
+            'misses': self.misses,
+            'expirations': self.expirations,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
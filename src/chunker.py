@@ -0,0 +1,233 @@
+# chunker.py - Sentence-aware chunking under a model-token budget
+#
+# Narratives are cleaned (CFPB "XXXX" redaction runs removed), split into
+# sentences, and packed greedily into chunks of at most `max_tokens`
+# WordPiece tokens, carrying up to `overlap_tokens` of trailing sentences
+# into the next chunk. Token counts come from the encoder's own tokenizer,
+# computed for a whole window of narratives in one batched call; packing
+# then works on cumulative token sums with searchsorted, one step per
+# chunk rather than per sentence.
+#
+# Boilerplate sentences ("Thank you.", "I am filing this complaint ...")
+# are counted across complaints as the stream goes by; once a short sentence
+# has appeared in `min_count` complaints it is dropped from later chunks
+# (unless it is all a narrative has). Repeated sentences inside one
+# narrative are dropped too. The counts belong to one build: every
+# default_chunker() starts its own, and a vector store keeps them
+# (boilerplate.npz) so incremental ingestion continues from the build's
+# counts instead of from whatever else the process chunked before.
+import hashlib
+import os
+import re
+import numpy as np
+
+TOKENIZER_NAME = 'sentence-transformers/all-MiniLM-L6-v2'
+BOILERPLATE_NAME = 'boilerplate.npz'
+
+# Redacted tokens: XXXX, XX/XX/XXXX, XXXX-XXXX, with optional $ or braces,
+# and runs of them separated by spaces
+REDACTION_PATTERN = re.compile(r"(?:\{?\$?\bX{2,}(?:[/\-.,]X{2,})*\b\}?[\s,]*)+")
+WHITESPACE_PATTERN = re.compile(r"\s+")
+# Sentence end: . ! ? (optionally closed by a quote/bracket) followed by space
+SENTENCE_PATTERN = re.compile(r"(?:(?<=[.!?])|(?<=[.!?][\"')\]]))\s+")
+WORD_PATTERN = re.compile(r"\S+")
+
+
+def clean_narrative(text):
+    """Remove redaction runs and collapse whitespace"""
+    text = REDACTION_PATTERN.sub(' ', text)
+    return WHITESPACE_PATTERN.sub(' ', text).strip()
+
+
+def split_sentences(text):
+    """Split cleaned text at sentence-ending punctuation"""
+    return [sentence for sentence in SENTENCE_PATTERN.split(text) if sentence]
+
+
+def sentence_key(sentence):
+    """Case- and punctuation-insensitive fingerprint for duplicate detection"""
+    normalized = re.sub(r"[^a-z0-9]+", ' ', sentence.lower()).strip()
+    return hashlib.blake2b(normalized.encode('utf-8'), digest_size=8).digest()
+
+
+class TokenCounter:
+    """Batched WordPiece token counts from the encoder's tokenizer"""
+
+    def __init__(self, tokenizer_name=TOKENIZER_NAME):
+        from transformers import AutoTokenizer
+        self.tokenizer = AutoTokenizer.from_pretrained(tokenizer_name)
+
+    def count(self, texts):
+        if not texts:
+            return np.empty(0, dtype=np.int64)
+        encoded = self.tokenizer(texts, add_special_tokens=False, return_attention_mask=False,
+                                 return_token_type_ids=False)['input_ids']
+        return np.fromiter((len(ids) for ids in encoded), dtype=np.int64, count=len(texts))
+
+
+class BoilerplateFilter:
+    """Streaming count of short sentences by the number of complaints they appear in"""
+
+    def __init__(self, min_count=1000, max_tokens=24, max_entries=1_000_000):
+        self.min_count = min_count
+        self.max_tokens = max_tokens      # boilerplate is short; longer sentences are not tracked
+        self.max_entries = max_entries
+        self._counts = {}
+
+    def is_boilerplate(self, key):
+        return self._counts.get(key, 0) >= self.min_count
+
+    def observe(self, keys):
+        """Count each distinct sentence of one complaint once"""
+        for key in keys:
+            self._counts[key] = self._counts.get(key, 0) + 1
+        if len(self._counts) > self.max_entries:
+            # Keep memory bounded: forget sentences seen only once
+            self._counts = {key: count for key, count in self._counts.items() if count > 1}
+
+    def save(self, path):
+        """Write the counts as one .npz (8-byte sentence keys packed as uint64)"""
+        keys = np.frombuffer(b''.join(self._counts), dtype=np.uint64)
+        counts = np.fromiter(self._counts.values(), dtype=np.int64, count=len(self._counts))
+        tmp_path = path + '.tmp.npz'
+        np.savez(tmp_path, keys=keys, counts=counts,
+                 params=np.array([self.min_count, self.max_tokens, self.max_entries]))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            boilerplate = cls(*(int(value) for value in data['params']))
+            raw = data['keys'].tobytes()
+            boilerplate._counts = {raw[i:i + 8]: int(count)
+                                   for i, count in zip(range(0, len(raw), 8), data['counts'])}
+        return boilerplate
+
+
+def open_boilerplate(store_dir):
+    """The store's boilerplate counts, or fresh ones if it has none yet"""
+    path = os.path.join(store_dir, BOILERPLATE_NAME)
+    return BoilerplateFilter.load(path) if os.path.exists(path) else BoilerplateFilter()
+
+
+class SentenceChunker:
+    """Pack sentences into chunks of at most `max_tokens` tokens"""
+
+    def __init__(self, max_tokens=128, overlap_tokens=24, token_counter=None, boilerplate=None):
+        if not 0 <= overlap_tokens < max_tokens:
+            raise ValueError("overlap_tokens must be smaller than max_tokens")
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+        self.token_counter = token_counter or TokenCounter()
+        self.boilerplate = boilerplate if boilerplate is not None else BoilerplateFilter()
+
+    def _sentences(self, text):
+        """Clean, split and de-duplicate one narrative's sentences"""
+        sentences, keys, seen = [], [], set()
+        for sentence in split_sentences(clean_narrative(text)):
+            key = sentence_key(sentence)
+            if key in seen:
+                continue
+            seen.add(key)
+            sentences.append(sentence)
+            keys.append(key)
+        return sentences, keys
+
+    def _split_long(self, sentence, n_tokens):
+        """Cut a sentence over the budget into word runs that each fit"""
+        words = WORD_PATTERN.findall(sentence)
+        pieces = int(np.ceil(n_tokens / self.max_tokens))
+        bounds = np.linspace(0, len(words), pieces + 1).round().astype(int)
+        pieces = [' '.join(words[start:end]) for start, end in zip(bounds[:-1], bounds[1:]) if end > start]
+        counts = self.token_counter.count(pieces)
+        kept, kept_lengths = [], []
+        for piece, n in zip(pieces, counts):
+            if n > self.max_tokens and len(WORD_PATTERN.findall(piece)) > 1:
+                piece_chunks, piece_lengths = self._split_long(piece, n)  # uneven token density
+                kept.extend(piece_chunks)
+                kept_lengths.extend(piece_lengths)
+            else:
+                kept.append(piece)
+                kept_lengths.append(int(n))
+        return kept, kept_lengths
+
+    def _pack(self, sentences, lengths):
+        """Greedy packing over cumulative token counts"""
+        ends = np.cumsum(lengths)
+        starts = ends - lengths
+        chunks, first = [], 0
+        while first < len(sentences):
+            # Last sentence that still fits after `first` (always at least one)
+            last = max(first + 1, int(np.searchsorted(ends, starts[first] + self.max_tokens, 'right')))
+            chunks.append(' '.join(sentences[first:last]))
+            if last >= len(sentences):
+                break
+            # Carry trailing sentences that fit in the overlap budget, unless
+            # they would leave no room for the next sentence
+            first = min(int(np.searchsorted(starts, ends[last - 1] - self.overlap_tokens, 'left')), last)
+            if ends[last] - starts[first] > self.max_tokens:
+                first = last
+        return chunks
+
+    def chunk_many(self, texts):
+        """Chunk a window of narratives; returns one list of chunks per text"""
+        per_text = [self._sentences(text) for text in texts]
+        flat = [sentence for sentences, _ in per_text for sentence in sentences]
+        lengths = self.token_counter.count(flat)
+
+        results, offset = [], 0
+        for sentences, keys in per_text:
+            counts = lengths[offset:offset + len(sentences)]
+            offset += len(sentences)
+            short = [key for key, n in zip(keys, counts) if n <= self.boilerplate.max_tokens]
+
+            keep = [not (n <= self.boilerplate.max_tokens and self.boilerplate.is_boilerplate(key))
+                    for key, n in zip(keys, counts)]
+            if not any(keep):
+                keep = [True] * len(sentences)  # the whole narrative is boilerplate; keep it
+
+            kept, kept_lengths = [], []
+            for sentence, n, wanted in zip(sentences, counts, keep):
+                if not wanted:
+                    continue
+                if n > self.max_tokens:
+                    pieces, piece_lengths = self._split_long(sentence, n)
+                    kept.extend(pieces)
+                    kept_lengths.extend(piece_lengths)
+                else:
+                    kept.append(sentence)
+                    kept_lengths.append(n)
+            self.boilerplate.observe(short)
+            results.append(self._pack(kept, np.asarray(kept_lengths, dtype=np.int64)) if kept else [])
+        return results
+
+    def iter_chunks(self, texts, window=1000):
+        """Stream (position, chunks) over any iterable of narratives, a window at a time"""
+        buffer, position = [], 0
+        for text in texts:
+            buffer.append(text)
+            if len(buffer) >= window:
+                for chunks in self.chunk_many(buffer):
+                    yield position, chunks
+                    position += 1
+                buffer = []
+        if buffer:
+            for chunks in self.chunk_many(buffer):
+                yield position, chunks
+                position += 1
+
+
+_token_counter = None
+
+
+def default_token_counter():
+    """Shared MiniLM token counter (the tokenizer is loaded once per process)"""
+    global _token_counter
+    if _token_counter is None:
+        _token_counter = TokenCounter()
+    return _token_counter
+
+
+def default_chunker(boilerplate=None):
+    """Chunker on the shared tokenizer with its own boilerplate counts (fresh unless given)"""
+    return SentenceChunker(token_counter=default_token_counter(), boilerplate=boilerplate)
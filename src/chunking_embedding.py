@@ -2,11 +2,19 @@
 import pandas as pd
 import numpy as np
 import os
-from sentence_transformers import SentenceTransformer
+import hashlib
+import time
+from issue_tagger import default_tagger
+from chunker import default_chunker, BOILERPLATE_NAME
+from dedup import dedup_chunks
+from encoders import load_encoder
 
 def load_filtered_data(file_path):
-    """Load the filtered complaints data"""
-    df = pd.read_csv(file_path)
+    """Load the filtered complaints data (CSV or streamed parquet)"""
+    if file_path.endswith('.parquet'):
+        df = pd.read_parquet(file_path)
+    else:
+        df = pd.read_csv(file_path)
     print(f"Loaded {len(df)} filtered complaints")
     return df
 
@@ -42,7 +50,7 @@ def create_stratified_sample(df, sample_size=500, random_state=42):
     return sample_df
 
 def chunk_text(text, chunk_size=500, overlap=50):
-    """Simple text chunking function"""
+    """Fixed-size character chunking (legacy; build_chunks uses chunker.py)"""
     if not text or len(text) < chunk_size:
         return [text] if text else []
     
@@ -56,66 +64,128 @@ def chunk_text(text, chunk_size=500, overlap=50):
     
     return chunks
 
-def create_embeddings(sample_df, output_path):
-    """Create embeddings for text chunks"""
+def content_hash(text):
+    """Stable fingerprint of a narrative, used to detect changed complaints"""
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()[:16]
+
+def build_chunks(df, chunker=None):
+    """Split complaint narratives into chunks with their metadata
+    
+    Chunks follow sentence boundaries under a model-token budget (see
+    chunker.py); all narratives in `df` are tokenized in one batch. Without
+    a `chunker`, boilerplate is counted over `df` alone.
+    """
+    chunker = chunker or default_chunker()
+    texts = df['Consumer complaint narrative'].fillna('').astype(str).str.strip()
+    keep = (texts.str.len() >= 20).to_numpy()
+    rows = df[keep]
+    texts = texts[keep].tolist()
+    
+    chunk_lists = chunker.chunk_many(texts)
+    counts = np.array([len(chunks) for chunks in chunk_lists], dtype=np.int64)
+    all_chunks = [chunk for chunks in chunk_lists for chunk in chunks]
+    
+    def column(name, default=None):
+        values = rows[name].to_numpy() if name in rows.columns else np.full(len(rows), default, dtype=object)
+        return np.repeat(values, counts)
+    
+    chunks_df = pd.DataFrame({
+        # Prefer the CFPB Complaint ID so IDs stay stable across runs
+        'complaint_id': np.repeat(rows['Complaint ID'].to_numpy() if 'Complaint ID' in rows.columns
+                                  else rows.index.to_numpy(), counts),
+        'product': column('Product'),
+        'chunk_index': np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts),
+        'total_chunks': np.repeat(counts, counts),
+        'content_hash': np.repeat(np.array([content_hash(text) for text in texts], dtype=object), counts),
+        # Filterable metadata (see metadata_index.py)
+        'date_received': column('Date received'),
+        'company': column('Company'),
+        'state': column('State'),
+    })
+    chunks_df.insert(0, 'text', all_chunks)
+    # Issue tags are computed once here, not on every query
+    chunks_df['issue_tags'] = default_tagger().tag_many(all_chunks)
+    return chunks_df
+
+def iter_build_chunks(frames, chunker=None):
+    """Stream chunk frames from an iterable of complaint frames (e.g. read_csv chunks)"""
+    chunker = chunker or default_chunker()
+    for frame in frames:
+        chunks_df = build_chunks(frame, chunker)
+        if len(chunks_df):
+            yield chunks_df
+
+def encode_chunks(model, texts, batch_size=100):
+    """Embed chunk texts in batches"""
+    embeddings = []
+    
+    for i in range(0, len(texts), batch_size):
+        batch = texts[i:i + batch_size]
+        batch_embeddings = model.encode(batch, show_progress_bar=False)
+        embeddings.append(batch_embeddings)
+    
+    if not embeddings:
+        return np.empty((0, model.get_sentence_embedding_dimension()), dtype=np.float32)
+    return np.vstack(embeddings)
+
+def create_embeddings(sample_df, output_path, store_dir=None, encoder=None, dedup=True,
+                      dedup_threshold=0.9):
+    """Create embeddings for text chunks
+    
+    If `store_dir` is given, also writes a memory-mapped vector store
+    (see vector_store.py) for fast startup and its aggregate cube (see
+    aggregates.py). `encoder` defaults to the
+    PyTorch backend (see encoders.load_encoder for ONNX). With `dedup`,
+    near-identical chunks are embedded once (see dedup.py).
+    """
     print("Creating embeddings...")
     
     # Initialize model
-    model = SentenceTransformer('all-MiniLM-L6-v2')
+    model = encoder or load_encoder('torch')
     
     # Create chunks
-    all_chunks = []
-    metadata = []
-    
-    for idx, row in sample_df.iterrows():
-        text = str(row['Consumer complaint narrative']).strip()
-        if not text or len(text) < 20:
-            continue
-        
-        chunks = chunk_text(text, chunk_size=500, overlap=50)
-        
-        for chunk_idx, chunk in enumerate(chunks):
-            all_chunks.append(chunk)
-            metadata.append({
-                "complaint_id": idx,
-                "product": row['Product'],
-                "chunk_index": chunk_idx,
-                "total_chunks": len(chunks)
-            })
-    
-    print(f"Created {len(all_chunks)} chunks from {len(sample_df)} complaints")
+    chunker = default_chunker()
+    chunks_df = build_chunks(sample_df, chunker)
+    print(f"Created {len(chunks_df)} chunks from {len(sample_df)} complaints")
     
-    # Create embeddings in batches
-    batch_size = 100
-    embeddings = []
+    dedup_stats = None
+    if dedup:
+        chunks_df, dedup_stats = dedup_chunks(chunks_df, threshold=dedup_threshold)
+        print(f"Collapsed {dedup_stats['removed']} near-duplicate chunks "
+              f"({dedup_stats['reduction']:.1%}; largest cluster {dedup_stats['largest_cluster']})")
     
-    for i in range(0, len(all_chunks), batch_size):
-        batch = all_chunks[i:i + batch_size]
-        batch_embeddings = model.encode(batch, show_progress_bar=False)
-        embeddings.append(batch_embeddings)
-    
-    embeddings = np.vstack(embeddings)
+    # Create embeddings in batches
+    start = time.perf_counter()
+    embeddings = encode_chunks(model, chunks_df['text'].tolist())
     print(f"Embeddings shape: {embeddings.shape}")
+    if dedup_stats and len(chunks_df):
+        # Savings at the measured encoding rate
+        seconds_per_chunk = (time.perf_counter() - start) / len(chunks_df)
+        print(f"Dedup saved ~{dedup_stats['removed'] * seconds_per_chunk:.1f}s of embedding and "
+              f"{dedup_stats['removed'] * embeddings.shape[1] * 4 / (1024 * 1024):.2f} MB of index")
     
     # Save to file
-    chunks_df = pd.DataFrame({
-        'text': all_chunks,
-        'embedding': list(embeddings),
-        'complaint_id': [m['complaint_id'] for m in metadata],
-        'product': [m['product'] for m in metadata],
-        'chunk_index': [m['chunk_index'] for m in metadata],
-        'total_chunks': [m['total_chunks'] for m in metadata]
-    })
+    chunks_df.insert(1, 'embedding', list(embeddings))
     
     os.makedirs(os.path.dirname(output_path), exist_ok=True)
     chunks_df.to_parquet(output_path)
     print(f"Saved embeddings to: {output_path}")
     print(f"File size: {os.path.getsize(output_path)/(1024*1024):.2f} MB")
     
+    if store_dir:
+        from vector_store import save_vector_store
+        from aggregates import build_aggregates, AGGREGATES_NAME
+        save_vector_store(chunks_df, store_dir)
+        # Incremental ingestion continues from this build's boilerplate counts
+        chunker.boilerplate.save(os.path.join(store_dir, BOILERPLATE_NAME))
+        # Exact counts for analytical questions, over the same complaints
+        build_aggregates(sample_df, os.path.join(store_dir, AGGREGATES_NAME))
+    
     return chunks_df
 
 if __name__ == "__main__":
     # Example usage
     df = load_filtered_data('../data/processed/filtered_complaints.csv')
     sample_df = create_stratified_sample(df, sample_size=500)
-    chunks_df = create_embeddings(sample_df, '../vector_store/sample_embeddings.parquet')
\ No newline at end of file
+    chunks_df = create_embeddings(sample_df, '../vector_store/sample_embeddings.parquet',
+                                  store_dir='../vector_store/complaints_store')
\ No newline at end of file
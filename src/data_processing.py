@@ -1,6 +1,32 @@
 # data_processing.py - Task 1 functions
 import pandas as pd
+import numpy as np
 import os
+import re
+import resource
+import time
+
+# Products kept for the complaint analyzer (matched case-insensitively)
+TARGET_PRODUCTS = [
+    'credit card',
+    'personal loan',
+    'savings account',
+    'money transfer'
+]
+PRODUCT_PATTERN = '|'.join(re.escape(product) for product in TARGET_PRODUCTS)
+
+# Only the columns the downstream pipeline uses, with compact dtypes
+NEEDED_COLUMNS = {
+    'Date received': 'string',
+    'Product': 'category',
+    'Sub-product': 'category',
+    'Issue': 'category',
+    'Sub-issue': 'category',
+    'Consumer complaint narrative': 'string',
+    'Company': 'category',
+    'State': 'category',
+    'Complaint ID': 'int64',
+}
 
 def load_and_filter_data(file_path):
     """Load CFPB data and filter for target products"""
@@ -9,18 +35,8 @@ def load_and_filter_data(file_path):
     df = pd.read_csv(file_path)
     print(f"Original data: {df.shape[0]} rows, {df.shape[1]} columns")
     
-    # Filter for 4 target products
-    target_products = [
-        'credit card',
-        'personal loan', 
-        'savings account',
-        'money transfer'
-    ]
-    
-    # Create filter mask (case-insensitive)
-    mask = pd.Series(False, index=df.index)
-    for product in target_products:
-        mask |= df['Product'].str.contains(product, case=False, na=False)
+    # Filter for 4 target products in a single case-insensitive pass
+    mask = df['Product'].str.contains(PRODUCT_PATTERN, case=False, na=False)
     
     filtered_df = df[mask].copy()
     print(f"After filtering: {len(filtered_df)} rows")
@@ -33,6 +49,67 @@ def load_and_filter_data(file_path):
     
     return filtered_df
 
+def product_mask(products):
+    """Vectorized target-product filter; categoricals are matched once per category"""
+    if isinstance(products.dtype, pd.CategoricalDtype):
+        matches = products.cat.categories.str.contains(PRODUCT_PATTERN, case=False)
+        codes = products.cat.codes.to_numpy()
+        # Code -1 (missing) must map to False
+        return pd.Series(np.append(matches, False)[codes], index=products.index)
+    return products.str.contains(PRODUCT_PATTERN, case=False, na=False)
+
+def stream_filter_to_parquet(file_path, output_path, chunksize=50_000):
+    """Filter the raw CFPB CSV in bounded-memory chunks, appending to parquet
+    
+    Reads only NEEDED_COLUMNS with compact dtypes, so peak memory depends on
+    `chunksize` rather than the size of the input file.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    
+    print("Streaming data from:", file_path)
+    start = time.perf_counter()
+    rows_read = rows_written = 0
+    
+    # Fixed schema so every chunk appends to the same parquet file
+    schema = pa.schema([
+        (name, pa.int64() if dtype == 'int64' else pa.string())
+        for name, dtype in NEEDED_COLUMNS.items()
+    ])
+    
+    os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+    reader = pd.read_csv(file_path, usecols=list(NEEDED_COLUMNS), dtype=NEEDED_COLUMNS,
+                         chunksize=chunksize)
+    with pq.ParquetWriter(output_path, schema, compression='zstd') as writer:
+        for chunk in reader:
+            rows_read += len(chunk)
+            mask = product_mask(chunk['Product']) & chunk['Consumer complaint narrative'].notna()
+            filtered = chunk[mask]
+            if filtered.empty:
+                continue
+            
+            table = pa.Table.from_pandas(filtered.astype({
+                name: 'string' for name, dtype in NEEDED_COLUMNS.items() if dtype == 'category'
+            }), schema=schema, preserve_index=False)
+            writer.write_table(table)
+            rows_written += len(filtered)
+    
+    elapsed = time.perf_counter() - start
+    input_mb = os.path.getsize(file_path) / (1024 * 1024)
+    stats = {
+        'rows_read': rows_read,
+        'rows_written': rows_written,
+        'seconds': elapsed,
+        'rows_per_sec': rows_read / elapsed if elapsed else 0.0,
+        'mb_per_sec': input_mb / elapsed if elapsed else 0.0,
+        # ru_maxrss is reported in KB on Linux
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+    print(f"Kept {rows_written} of {rows_read} rows in {elapsed:.1f}s "
+          f"({stats['mb_per_sec']:.1f} MB/s, peak RSS {stats['peak_rss_mb']:.0f} MB)")
+    print(f"Saved filtered data to: {output_path}")
+    return stats
+
 def save_filtered_data(df, output_path):
     """Save filtered data to CSV"""
     os.makedirs(os.path.dirname(output_path), exist_ok=True)
@@ -42,5 +119,6 @@ def save_filtered_data(df, output_path):
     
 if __name__ == "__main__":
     # Example usage
-    filtered_df = load_and_filter_data('../data/raw/complaints.csv')
-    save_filtered_data(filtered_df, '../data/processed/filtered_complaints.csv')
\ No newline at end of file
+    # Streams the multi-GB raw dump; use load_and_filter_data for small files
+    stream_filter_to_parquet('../data/raw/complaints.csv',
+                             '../data/processed/filtered_complaints.parquet')
\ No newline at end of file
@@ -0,0 +1,120 @@
+# dedup.py - Near-duplicate chunk detection with MinHash + LSH
+#
+# Each chunk becomes a set of word 5-shingles, summarized by a MinHash
+# signature (`num_perm` universal hash functions over the shingle hashes,
+# computed for all shingles of a chunk in one NumPy pass). Signatures are
+# cut into `bands` bands; chunks sharing any band land in the same LSH
+# bucket and become candidate pairs, which are kept only if their estimated
+# Jaccard similarity reaches `threshold`. Matches are merged with
+# union-find, and each cluster collapses to its first chunk, which records
+# `duplicate_count` plus the complaint ID and content hash of every member
+# chunk (`member_ids`, `member_hashes`), so incremental ingestion still
+# knows the collapsed complaints (see ingestion.py).
+#
+# Clusters never cross `group_by` columns (product by default), so product
+# filters stay exact; company/state/date filters see the representative's
+# values only.
+import re
+import zlib
+import numpy as np
+
+SHINGLE_PATTERN = re.compile(r"[a-z0-9]+")
+MERSENNE_PRIME = (1 << 61) - 1
+MAX_HASH = (1 << 32) - 1
+
+
+def shingle_hashes(text, size=5):
+    """32-bit hashes of the word `size`-shingles of a text"""
+    words = SHINGLE_PATTERN.findall(text.lower())
+    if len(words) < size:
+        words = words + [''] * (size - len(words))  # short texts are one shingle
+    shingles = {' '.join(words[i:i + size]) for i in range(len(words) - size + 1)}
+    return np.fromiter((zlib.crc32(s.encode('utf-8')) for s in shingles), dtype=np.uint64,
+                       count=len(shingles))
+
+
+class MinHasher:
+    """MinHash signatures from `num_perm` hash functions h(x) = (a*x + b) mod p"""
+
+    def __init__(self, num_perm=64, seed=42):
+        rng = np.random.default_rng(seed)
+        self.num_perm = num_perm
+        # Kept below 2**32 so a*x + b stays exact in uint64 for 32-bit x
+        self.a = rng.integers(1, MAX_HASH, size=num_perm, dtype=np.uint64)
+        self.b = rng.integers(0, MAX_HASH, size=num_perm, dtype=np.uint64)
+
+    def signature(self, hashes):
+        permuted = (hashes[:, None] * self.a[None, :] + self.b[None, :]) % MERSENNE_PRIME
+        return (permuted & MAX_HASH).min(axis=0).astype(np.uint32)
+
+    def signatures(self, texts, shingle_size=5):
+        return np.vstack([self.signature(shingle_hashes(text, shingle_size)) for text in texts]) \
+            if len(texts) else np.empty((0, self.num_perm), dtype=np.uint32)
+
+
+def _find(parent, i):
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+
+def near_duplicate_clusters(signatures, threshold=0.9, bands=16, groups=None):
+    """Cluster id (index of the cluster's first row) for every row"""
+    n, num_perm = signatures.shape
+    if num_perm % bands:
+        raise ValueError(f"num_perm ({num_perm}) must be divisible by bands ({bands})")
+    rows_per_band = num_perm // bands
+    groups = np.zeros(n, dtype=np.int64) if groups is None else np.asarray(groups)
+    parent = np.arange(n)
+
+    for band in range(bands):
+        columns = signatures[:, band * rows_per_band:(band + 1) * rows_per_band]
+        buckets = {}
+        for i in range(n):
+            key = (groups[i], columns[i].tobytes())
+            first = buckets.setdefault(key, i)
+            if first == i:
+                continue
+            root_i, root_first = _find(parent, i), _find(parent, first)
+            if root_i == root_first:
+                continue
+            # Estimated Jaccard = fraction of equal MinHash values
+            if np.mean(signatures[i] == signatures[first]) >= threshold:
+                parent[max(root_i, root_first)] = min(root_i, root_first)
+    return np.array([_find(parent, i) for i in range(n)])
+
+
+def dedup_chunks(chunks_df, threshold=0.9, num_perm=64, bands=16, group_by=('product',)):
+    """Collapse near-identical chunks; returns (deduplicated frame, stats)
+
+    The kept frame gains `duplicate_count`, `member_ids` and
+    `member_hashes` (complaint ID and content hash of every chunk in the
+    cluster, representative first; len(member_ids) == duplicate_count).
+    """
+    signatures = MinHasher(num_perm).signatures(chunks_df['text'].tolist())
+    groups = None
+    if group_by:
+        groups = chunks_df.groupby(list(group_by), sort=False, dropna=False).ngroup().to_numpy()
+    clusters = near_duplicate_clusters(signatures, threshold, bands, groups)
+
+    representatives = np.flatnonzero(clusters == np.arange(len(clusters)))
+    counts = np.bincount(clusters, minlength=len(clusters))
+    complaint_ids = chunks_df['complaint_id'].tolist()
+    hashes = chunks_df['content_hash'].tolist() if 'content_hash' in chunks_df.columns else [None] * len(chunks_df)
+    members = {}
+    for i, cluster in enumerate(clusters):
+        members.setdefault(cluster, []).append(i)
+
+    deduped = chunks_df.iloc[representatives].reset_index(drop=True)
+    deduped['duplicate_count'] = counts[representatives]
+    deduped['member_ids'] = [[complaint_ids[i] for i in members[r]] for r in representatives]
+    deduped['member_hashes'] = [[hashes[i] for i in members[r]] for r in representatives]
+    stats = {
+        'chunks_in': len(chunks_df),
+        'chunks_out': len(deduped),
+        'removed': len(chunks_df) - len(deduped),
+        'reduction': 1 - len(deduped) / len(chunks_df) if len(chunks_df) else 0.0,
+        'largest_cluster': int(counts.max()) if len(counts) else 0,
+    }
+    return deduped, stats
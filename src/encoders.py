@@ -0,0 +1,203 @@
+# encoders.py - Pluggable sentence encoder backends for queries and chunks
+#
+# 'torch'      SentenceTransformer on PyTorch (the reference embeddings)
+# 'onnx'       the same MiniLM graph exported to ONNX Runtime, float32
+# 'onnx-int8'  the ONNX graph with dynamically quantized int8 weights
+#
+# Every backend returns L2-normalized float32 vectors, like the reference
+# all-MiniLM-L6-v2 pipeline (transformer -> mean pooling -> normalize).
+# export_onnx() writes a model directory and checks its embeddings against
+# the PyTorch model on calibration texts before anything uses it.
+#
+# Stated tolerance: per-text cosine similarity to the PyTorch embedding of
+# at least MIN_COSINE[backend] (0.999 for float32 ONNX, 0.98 for int8).
+import json
+import os
+import numpy as np
+
+MODEL_NAME = 'all-MiniLM-L6-v2'
+ONNX_CONFIG_NAME = 'encoder.json'
+FP32_MODEL_NAME = 'model.onnx'
+INT8_MODEL_NAME = 'model-int8.onnx'
+
+MIN_COSINE = {'onnx': 0.999, 'onnx-int8': 0.98}
+
+CALIBRATION_TEXTS = [
+    "I was charged a late fee even though I paid my credit card bill on time.",
+    "The bank closed my savings account without notice and kept my money for weeks.",
+    "My money transfer never arrived and customer service keeps telling me to wait.",
+    "They reported a personal loan as delinquent to the credit bureaus by mistake.",
+    "Unauthorized transactions appeared on my card and the fraud claim was denied.",
+    "Overdraft fees",
+    "I have called more than ten times about the interest rate increase on my account and "
+    "every representative gives me a different answer, nobody can explain why it changed.",
+    "Billing dispute",
+]
+
+
+def _set_torch_threads(threads):
+    if threads:
+        import torch
+        torch.set_num_threads(threads)
+
+
+class TorchEncoder:
+    """SentenceTransformer on PyTorch: the reference backend"""
+
+    backend = 'torch'
+
+    def __init__(self, model_name=MODEL_NAME, threads=None):
+        _set_torch_threads(threads)
+        from sentence_transformers import SentenceTransformer  # imports torch
+        self.model_name = model_name
+        self.model = SentenceTransformer(model_name)
+
+    def get_sentence_embedding_dimension(self):
+        return self.model.get_sentence_embedding_dimension()
+
+    def encode(self, texts, batch_size=32, show_progress_bar=False):
+        embeddings = self.model.encode(texts, batch_size=batch_size, show_progress_bar=show_progress_bar)
+        return np.asarray(embeddings, dtype=np.float32)
+
+
+class OnnxEncoder:
+    """MiniLM on ONNX Runtime, from a directory written by export_onnx()"""
+
+    def __init__(self, model_dir, quantized=True, threads=None):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        with open(os.path.join(model_dir, ONNX_CONFIG_NAME)) as f:
+            self.config = json.load(f)
+        self.backend = 'onnx-int8' if quantized else 'onnx'
+        self.model_name = self.config['model_name']
+        self.max_seq_length = self.config['max_seq_length']
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+            options.inter_op_num_threads = 1
+        model_path = os.path.join(model_dir, INT8_MODEL_NAME if quantized else FP32_MODEL_NAME)
+        self.session = ort.InferenceSession(model_path, options, providers=['CPUExecutionProvider'])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    def get_sentence_embedding_dimension(self):
+        return self.config['dim']
+
+    def _encode_batch(self, texts):
+        tokens = self.tokenizer(texts, padding=True, truncation=True,
+                                max_length=self.max_seq_length, return_tensors='np')
+        feed = {name: tokens[name].astype(np.int64) for name in self.input_names}
+        hidden = self.session.run(None, feed)[0]
+
+        # Mean pooling over real tokens, then L2 normalize
+        mask = tokens['attention_mask'][:, :, None].astype(np.float32)
+        pooled = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+        norms = np.linalg.norm(pooled, axis=1, keepdims=True)
+        return (pooled / np.maximum(norms, 1e-12)).astype(np.float32)
+
+    def encode(self, texts, batch_size=32, show_progress_bar=False):
+        single = isinstance(texts, str)
+        texts = [texts] if single else list(texts)
+        if not texts:
+            return np.empty((0, self.get_sentence_embedding_dimension()), dtype=np.float32)
+
+        # Encode in length order so each batch pads to similar lengths
+        order = np.argsort([len(text) for text in texts], kind='stable')
+        embeddings = np.empty((len(texts), self.get_sentence_embedding_dimension()), dtype=np.float32)
+        for start in range(0, len(texts), batch_size):
+            positions = order[start:start + batch_size]
+            embeddings[positions] = self._encode_batch([texts[i] for i in positions])
+        return embeddings[0] if single else embeddings
+
+
+def load_encoder(backend='torch', model_dir=None, threads=None, model_name=MODEL_NAME):
+    """Create an encoder; ONNX backends need the `model_dir` from export_onnx()"""
+    if backend == 'torch':
+        return TorchEncoder(model_name, threads=threads)
+    if backend in MIN_COSINE:
+        if model_dir is None:
+            raise ValueError(f"The {backend!r} encoder needs model_dir (see encoders.export_onnx)")
+        return OnnxEncoder(model_dir, quantized=backend == 'onnx-int8', threads=threads)
+    raise ValueError(f"Unknown encoder backend: {backend!r} (use 'torch', 'onnx' or 'onnx-int8')")
+
+
+def encoder_cache_key(backend='torch', model_dir=None, model_name=MODEL_NAME, **_):
+    """Name under which query embeddings from this encoder are cached
+
+    Backends produce slightly different vectors, so they must not share
+    cached embeddings. The torch key stays the plain model name.
+    """
+    if backend == 'torch':
+        return model_name
+    return f"{model_name}:{backend}:{os.path.basename(os.path.normpath(model_dir or ''))}"
+
+
+def compare_encoders(reference, candidate, texts=CALIBRATION_TEXTS):
+    """Per-text cosine similarity between two encoders' embeddings"""
+    expected = np.asarray(reference.encode(list(texts)), dtype=np.float32)
+    actual = np.asarray(candidate.encode(list(texts)), dtype=np.float32)
+    expected /= np.linalg.norm(expected, axis=1, keepdims=True)
+    actual /= np.linalg.norm(actual, axis=1, keepdims=True)
+    return np.einsum('ij,ij->i', expected, actual)
+
+
+def verify_encoder(reference, candidate, texts=CALIBRATION_TEXTS, min_cosine=None):
+    """Raise ValueError if `candidate` drifts from `reference` beyond the tolerance"""
+    min_cosine = MIN_COSINE.get(candidate.backend, 1.0) if min_cosine is None else min_cosine
+    cosines = compare_encoders(reference, candidate, texts)
+    report = {'min_cosine': float(cosines.min()), 'mean_cosine': float(cosines.mean()),
+              'tolerance': min_cosine}
+    if report['min_cosine'] < min_cosine:
+        raise ValueError(f"{candidate.backend} embeddings drift from {reference.backend}: "
+                         f"min cosine {report['min_cosine']:.4f} < {min_cosine}")
+    return report
+
+
+def export_onnx(output_dir, model_name=MODEL_NAME, quantize=True, opset=14):
+    """Export the transformer to ONNX (and an int8 copy), then verify both"""
+    import torch
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    reference = TorchEncoder(model_name)
+    transformer = reference.model[0]
+    os.makedirs(output_dir, exist_ok=True)
+    transformer.tokenizer.save_pretrained(output_dir)
+
+    dummy = transformer.tokenizer(["export example"], return_tensors='pt')
+    input_names = [name for name in ('input_ids', 'attention_mask', 'token_type_ids') if name in dummy]
+    dynamic_axes = {name: {0: 'batch', 1: 'sequence'} for name in input_names}
+    dynamic_axes['last_hidden_state'] = {0: 'batch', 1: 'sequence'}
+
+    fp32_path = os.path.join(output_dir, FP32_MODEL_NAME)
+    model = transformer.auto_model.eval()
+    with torch.no_grad():
+        torch.onnx.export(model, tuple(dummy[name] for name in input_names), fp32_path,
+                          input_names=input_names, output_names=['last_hidden_state'],
+                          dynamic_axes=dynamic_axes, opset_version=opset)
+
+    config = {'model_name': model_name, 'dim': reference.get_sentence_embedding_dimension(),
+              'max_seq_length': reference.model.max_seq_length, 'verification': {}}
+    with open(os.path.join(output_dir, ONNX_CONFIG_NAME), 'w') as f:
+        json.dump(config, f, indent=2)
+
+    backends = ['onnx']
+    if quantize:
+        quantize_dynamic(fp32_path, os.path.join(output_dir, INT8_MODEL_NAME), weight_type=QuantType.QInt8)
+        backends.append('onnx-int8')
+
+    for backend in backends:
+        config['verification'][backend] = verify_encoder(reference, load_encoder(backend, output_dir))
+        print(f"✅ {backend}: min cosine {config['verification'][backend]['min_cosine']:.4f} "
+              f"vs. PyTorch (tolerance {MIN_COSINE[backend]})")
+    with open(os.path.join(output_dir, ONNX_CONFIG_NAME), 'w') as f:
+        json.dump(config, f, indent=2)
+    print(f"Exported {model_name} to: {output_dir}")
+    return config
+
+
+if __name__ == "__main__":
+    # Example usage
+    export_onnx('../vector_store/minilm_onnx')
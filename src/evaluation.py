@@ -2,63 +2,68 @@
 import pandas as pd
 from rag_pipeline import RAGSystem
 
-def create_evaluation_table():
-    """Create evaluation table with test questions and answers"""
+# Labeled test questions (5-10 as required)
+EVALUATION_QUESTIONS = [
+    {
+        'question': 'What are common credit card issues?',
+        'expected_focus': ['credit card', 'billing', 'service', 'payment']
+    },
+    {
+        'question': 'Are there problems with savings accounts?',
+        'expected_focus': ['savings', 'checking', 'account', 'access']
+    },
+    {
+        'question': 'What billing complaints do customers have?',
+        'expected_focus': ['billing', 'charge', 'fee', 'payment']
+    },
+    {
+        'question': 'Tell me about customer service complaints',
+        'expected_focus': ['service', 'customer', 'representative', 'support']
+    },
+    {
+        'question': 'Are there any fraud-related complaints?',
+        'expected_focus': ['fraud', 'unauthorized', 'theft', 'scam']
+    },
+    {
+        'question': 'What issues exist with money transfers?',
+        'expected_focus': ['transfer', 'money', 'transaction', 'wire']
+    },
+    {
+        'question': 'How many complaints mention late payments?',
+        'expected_focus': ['late', 'payment', 'delay', 'overdue']
+    },
+    {
+        'question': 'What problems do customers report with loans?',
+        'expected_focus': ['loan', 'interest', 'debt', 'repayment']
+    }
+]
+
+def create_evaluation_table(hybrid=False):
+    """Create evaluation table with test questions and answers
+    
+    `hybrid=True` evaluates dense + BM25 keyword retrieval (see lexical_index.py).
+    """
     
     # Initialize RAG system
-    rag = RAGSystem('../vector_store/sample_embeddings.parquet')
-    
-    # Define test questions (5-10 as required)
-    test_questions = [
-        {
-            'question': 'What are common credit card issues?',
-            'expected_focus': ['credit card', 'billing', 'service', 'payment']
-        },
-        {
-            'question': 'Are there problems with savings accounts?',
-            'expected_focus': ['savings', 'checking', 'account', 'access']
-        },
-        {
-            'question': 'What billing complaints do customers have?',
-            'expected_focus': ['billing', 'charge', 'fee', 'payment']
-        },
-        {
-            'question': 'Tell me about customer service complaints',
-            'expected_focus': ['service', 'customer', 'representative', 'support']
-        },
-        {
-            'question': 'Are there any fraud-related complaints?',
-            'expected_focus': ['fraud', 'unauthorized', 'theft', 'scam']
-        },
-        {
-            'question': 'What issues exist with money transfers?',
-            'expected_focus': ['transfer', 'money', 'transaction', 'wire']
-        },
-        {
-            'question': 'How many complaints mention late payments?',
-            'expected_focus': ['late', 'payment', 'delay', 'overdue']
-        },
-        {
-            'question': 'What problems do customers report with loans?',
-            'expected_focus': ['loan', 'interest', 'debt', 'repayment']
-        }
-    ]
+    rag = RAGSystem('../vector_store/sample_embeddings.parquet', hybrid=hybrid)
+    
+    test_questions = EVALUATION_QUESTIONS
     
     print("Running evaluation on 8 test questions...")
     print("=" * 70)
     
     evaluation_results = []
     
-    for i, test in enumerate(test_questions, 1):
+    # Retrieve chunks for all questions in one batch
+    all_chunks = rag.retrieve_batch([test['question'] for test in test_questions], k=5)
+    
+    for i, (test, chunks) in enumerate(zip(test_questions, all_chunks), 1):
         question = test['question']
         expected = test['expected_focus']
         
         print(f"\n{i}. Question: {question}")
         print(f"   Expected focus: {', '.join(expected)}")
         
-        # Retrieve chunks
-        chunks = rag.retrieve_chunks(question, k=5)
-        
         # Generate answer
         answer, sources = rag.generate_answer(question, chunks)
         
@@ -153,13 +158,286 @@ def generate_markdown_table():
     print("✅ Markdown evaluation table saved for report inclusion")
     return '\n'.join(markdown_lines)
 
+# --- Retrieval benchmark harness ---------------------------------------------
+#
+# A query set is a list of {'query', 'relevant' (complaint IDs, optional),
+# 'filters' (optional)} dicts. Queries are sharded across a process pool;
+# each worker opens the store (memory-mapped, so shared) and a RAGSystem
+# whose query embeddings persist in a sqlite cache between runs. Quality is
+# measured against exact search over the same embeddings (recall@k) and
+# against labels when present (MRR); latency is per retrieve_chunks call.
+
+QUERY_SETS = {}
+
+
+def register_query_set(name):
+    """Decorator adding a query-set builder `fn(store_path, n, seed)` to QUERY_SETS"""
+    def register(fn):
+        QUERY_SETS[name] = fn
+        return fn
+    return register
+
+
+@register_query_set('questions')
+def evaluation_query_set(store_path=None, n=None, seed=42):
+    """EVALUATION_QUESTIONS; unlabeled, so quality is recall vs. exact search only"""
+    return [{'query': test['question']} for test in EVALUATION_QUESTIONS][:n]
+
+
+@register_query_set('synthetic')
+def synthetic_query_set(store_path, n=2000, seed=42, words=(6, 14)):
+    """Word spans cut from random chunks; the source complaint is the relevant answer"""
+    import numpy as np
+    from vector_store import load_vector_store
+
+    metadata = load_vector_store(store_path).metadata
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(len(metadata), size=min(n, len(metadata)), replace=False)
+    texts = metadata.take('text', rows)
+    complaint_ids = metadata.take('complaint_id', rows)
+    queries = []
+    for text, complaint_id in zip(texts, complaint_ids):
+        tokens = str(text).split()
+        length = int(rng.integers(*words))
+        start = int(rng.integers(0, max(1, len(tokens) - length)))
+        queries.append({'query': ' '.join(tokens[start:start + length]),
+                        'relevant': [complaint_id.item() if hasattr(complaint_id, 'item') else complaint_id]})
+    return queries
+
+
+def load_query_set(path):
+    """Query set from a JSONL file, one {'query', 'relevant'?, 'filters'?} per line"""
+    import json
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+_benchmark_worker = None
+
+
+def _init_benchmark_worker(store_path, rag_options):
+    """Open the store and a RAGSystem once per worker process"""
+    global _benchmark_worker
+    _benchmark_worker = RAGSystem(store_path, load_model='eager', **rag_options)
+
+
+def brute_force_top_k(embeddings, query_embedding, k, rows=None):
+    """Ground-truth top-k rows by cosine similarity, independent of any index code"""
+    import numpy as np
+    query = np.asarray(query_embedding, dtype=np.float32)
+    query = query / max(float(np.linalg.norm(query)), 1e-12)
+    candidates = np.arange(len(embeddings)) if rows is None else np.asarray(rows, dtype=np.int64)
+    vectors = np.asarray(embeddings[candidates], dtype=np.float32)
+    similarities = vectors @ query / np.maximum(np.linalg.norm(vectors, axis=1), 1e-12)
+    return candidates[np.argsort(-similarities, kind='stable')[:k]]
+
+
+def _run_benchmark_shard(queries, k):
+    """Per-query latency, recall@k vs. brute-force search and reciprocal rank"""
+    import os
+    import resource
+    import time
+    import numpy as np
+
+    rag = _benchmark_worker
+    records = []
+    for item in queries:
+        filters = item.get('filters')
+        start = time.perf_counter()
+        chunks = rag.retrieve_chunks(item['query'], k=k, filters=filters)
+        latency_ms = (time.perf_counter() - start) * 1000
+
+        # Untimed, and not through the query cache so its stats stay honest
+        embedding = rag.model.encode(item['query'])
+        rows = rag.store.filter_index.lookup(filters) if filters else None
+        expected = brute_force_top_k(rag.store.embeddings, embedding, k, rows) \
+            if rows is None or len(rows) else np.empty(0)
+        got = [chunk.row for chunk in chunks]
+        record = {'latency_ms': latency_ms,
+                  'recall': len(set(got) & set(expected.tolist())) / len(expected) if len(expected) else 1.0}
+        if item.get('relevant'):
+            relevant = set(item['relevant'])
+            ranks = [rank for rank, chunk in enumerate(chunks, 1) if chunk.complaint_id in relevant]
+            record['reciprocal_rank'] = 1 / ranks[0] if ranks else 0.0
+        records.append(record)
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return records, peak_rss_mb, (os.getpid(), rag.cache_stats()['query_embeddings'])
+
+
+def run_retrieval_benchmark(store_path, query_set='synthetic', n_queries=2000, k=5, workers=None,
+                            shard_size=50, query_cache='off', output_path=None, seed=42, **rag_options):
+    """Run a query set through RAGSystem in a process pool; return (and save) a JSON report
+
+    `query_set` is a QUERY_SETS name, a JSONL path or a list of query dicts.
+    `rag_options` go to RAGSystem (index_type, hybrid, encoder, ...).
+
+    `query_cache` is 'off' (every query is encoded, the default), 'memory'
+    (a fresh in-process LRU per worker) or a sqlite path (persistent and
+    possibly warm from earlier runs). The setting and the cache hits are
+    recorded in the report, since a warm cache makes any configuration look
+    faster. Recall is measured against brute-force search; an exact,
+    non-hybrid run is that reference and is marked as such.
+    """
+    import json
+    import os
+    import resource
+    import subprocess
+    import time
+    from concurrent.futures import ProcessPoolExecutor
+    import numpy as np
+    from benchmark import summarize_latencies
+
+    if isinstance(query_set, str):
+        name = query_set
+        queries = QUERY_SETS[query_set](store_path, n_queries, seed) if query_set in QUERY_SETS \
+            else load_query_set(query_set)[:n_queries]
+    else:
+        name, queries = 'custom', list(query_set)[:n_queries]
+    workers = workers or os.cpu_count() or 1
+    if query_cache == 'off':
+        rag_options = {'query_cache_size': 0, **rag_options}
+    elif query_cache != 'memory':
+        rag_options = {'query_cache_path': query_cache, **rag_options}
+    shards = [queries[i:i + shard_size] for i in range(0, len(queries), shard_size)]
+
+    print(f"📏 Retrieval benchmark: {len(queries)} '{name}' queries, k={k}, {workers} workers")
+    records, peak_rss, cache_stats = [], [], {}
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_benchmark_worker,
+                             initargs=(store_path, rag_options)) as pool:
+        # Warm-up so worker start and model loading stay out of the timed run
+        for _, _, (pid, stats) in pool.map(_run_benchmark_shard, [queries[:1]] * workers, [k] * workers):
+            cache_stats.setdefault(pid, (stats, stats))
+        start = time.perf_counter()
+        for shard_records, shard_rss, (pid, stats) in pool.map(_run_benchmark_shard, shards,
+                                                               [k] * len(shards)):
+            records.extend(shard_records)
+            peak_rss.append(shard_rss)
+            cache_stats[pid] = (cache_stats.get(pid, ({}, None))[0], stats)
+        wall_s = time.perf_counter() - start
+    # Hits during the timed run: last minus post-warm-up counters, per worker
+    cache_hits = {name: sum(last.get(name, 0) - first.get(name, 0) for first, last in cache_stats.values())
+                  for name in ('hits', 'disk_hits', 'misses')}
+
+    latencies = np.array([r['latency_ms'] for r in records])
+    reciprocal_ranks = [r['reciprocal_rank'] for r in records if 'reciprocal_rank' in r]
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    report = {
+        'config': {'store': os.path.abspath(store_path), 'query_set': name, 'queries': len(records),
+                   'k': k, 'workers': workers, 'seed': seed, 'commit': commit,
+                   'query_cache': query_cache if query_cache in ('off', 'memory') else 'persistent',
+                   'reference': rag_options.get('index_type', 'exact') == 'exact'
+                   and not rag_options.get('hybrid', False),
+                   'rag_options': {key: value for key, value in rag_options.items()
+                                   if key not in ('query_cache_path', 'query_cache_size')}},
+        'query_cache': cache_hits,
+        'quality': {f'recall@{k}': float(np.mean([r['recall'] for r in records])),
+                    'mrr': float(np.mean(reciprocal_ranks)) if reciprocal_ranks else None,
+                    'labeled_queries': len(reciprocal_ranks)},
+        'latency': summarize_latencies(latencies),
+        'qps': len(records) / wall_s,
+        'peak_rss_mb': float(max(peak_rss + [resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024])),
+    }
+
+    quality = report['quality']
+    print(f"   recall@{k} {quality[f'recall@{k}']:.3f} | MRR "
+          f"{quality['mrr'] if quality['mrr'] is None else round(quality['mrr'], 3)} | "
+          f"p50 {report['latency']['p50_ms']:.2f} ms | p95 {report['latency']['p95_ms']:.2f} ms | "
+          f"p99 {report['latency']['p99_ms']:.2f} ms | {report['qps']:.0f} QPS | "
+          f"peak RSS {report['peak_rss_mb']:.0f} MB")
+    print(f"   query cache {report['config']['query_cache']}: {cache_hits['hits']} hits, "
+          f"{cache_hits['disk_hits']} disk hits, {cache_hits['misses']} misses"
+          + (" | exact reference run: recall is 1.0 by construction" if report['config']['reference'] else ""))
+    if output_path:
+        with open(output_path, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"✅ Report saved to: {output_path}")
+    return report
+
+
+# Metric -> (higher is better, allowed relative change before it counts as a regression)
+REGRESSION_CHECKS = {
+    'quality.recall@{k}': (True, 0.01),
+    'quality.mrr': (True, 0.02),
+    'latency.p50_ms': (False, 0.10),
+    'latency.p95_ms': (False, 0.15),
+    'latency.p99_ms': (False, 0.20),
+    'qps': (True, 0.10),
+    'peak_rss_mb': (False, 0.10),
+}
+
+
+def compare_reports(baseline, candidate, checks=REGRESSION_CHECKS):
+    """Metric deltas between two run_retrieval_benchmark reports; lists regressions"""
+    def lookup(report, path):
+        value = report
+        for key in path.format(k=report['config']['k']).split('.'):
+            value = value.get(key) if isinstance(value, dict) else None
+        return value
+
+    if baseline['config']['k'] != candidate['config']['k'] or \
+            baseline['config']['query_set'] != candidate['config']['query_set']:
+        print("⚠️ Reports use different query sets or k; deltas are not comparable")
+    if baseline['config'].get('query_cache') != candidate['config'].get('query_cache'):
+        print("⚠️ Reports use different query-cache settings; latency deltas are not comparable")
+
+    rows, regressions = [], []
+    for path, (higher_is_better, tolerance) in checks.items():
+        before, after = lookup(baseline, path), lookup(candidate, path)
+        if before is None or after is None:
+            continue
+        change = (after - before) / before if before else 0.0
+        worse = -change if higher_is_better else change
+        rows.append({'metric': path.format(k=baseline['config']['k']), 'baseline': before,
+                     'candidate': after, 'change': change, 'regression': worse > tolerance})
+        if worse > tolerance:
+            regressions.append(rows[-1]['metric'])
+
+    for row in rows:
+        flag = '❌' if row['regression'] else '✅'
+        print(f"   {flag} {row['metric']:<16} {row['baseline']:>10.3f} -> {row['candidate']:>10.3f} "
+              f"({row['change']:+.1%})")
+    return rows, regressions
+
+
 if __name__ == "__main__":
-    # Run evaluation
-    eval_df = create_evaluation_table()
+    import argparse
+    import json
+    import sys
     
-    # Generate markdown for report
-    markdown_table = generate_markdown_table()
+    parser = argparse.ArgumentParser(description="Evaluation table and retrieval benchmarks")
+    parser.add_argument('command', nargs='?', default='table', choices=['table', 'bench', 'compare'])
+    parser.add_argument('reports', nargs='*', help="compare: baseline.json candidate.json")
+    parser.add_argument('--store', default='../vector_store/complaints_store')
+    parser.add_argument('--queries', default='synthetic', help="synthetic, questions or a JSONL path")
+    parser.add_argument('--n', type=int, default=2000)
+    parser.add_argument('--k', type=int, default=5)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--index-type', default='exact', choices=['exact', 'ivf', 'sq8', 'pq'])
+    parser.add_argument('--hybrid', action='store_true')
+    parser.add_argument('--query-cache', default='off',
+                        help="off (default), memory (fresh per run) or a sqlite path (may be warm)")
+    parser.add_argument('--output', default='../data/processed/retrieval_benchmark.json')
+    args = parser.parse_args()
     
-    # Print sample
-    print("\n📋 Sample from evaluation table:")
-    print(eval_df[['Question', 'Quality Score (1-5)']].head(3))
\ No newline at end of file
+    if args.command == 'bench':
+        run_retrieval_benchmark(args.store, args.queries, n_queries=args.n, k=args.k, workers=args.workers,
+                                query_cache=args.query_cache, output_path=args.output,
+                                index_type=args.index_type, hybrid=args.hybrid)
+    elif args.command == 'compare':
+        baseline, candidate = (json.load(open(path)) for path in args.reports)
+        _, regressions = compare_reports(baseline, candidate)
+        sys.exit(1 if regressions else 0)
+    else:
+        # Run evaluation
+        eval_df = create_evaluation_table()
+        
+        # Generate markdown for report
+        markdown_table = generate_markdown_table()
+        
+        # Print sample
+        print("\n📋 Sample from evaluation table:")
+        print(eval_df[['Question', 'Quality Score (1-5)']].head(3))
@@ -0,0 +1,296 @@
+# ingestion.py - Incremental, append-only embedding ingestion
+#
+# Instead of rebuilding the whole vector store, each run embeds only new or
+# changed complaints into a new segment, marks replaced/deleted chunks with
+# tombstones, and publishes a new manifest version. A background compactor
+# periodically merges segments and drops tombstoned rows. The store's
+# aggregate cube (aggregates.py) is updated in the same step.
+import contextlib
+import fcntl
+import os
+import shutil
+import threading
+import time
+import numpy as np
+import pandas as pd
+from chunking_embedding import build_chunks, encode_chunks, content_hash
+from chunker import default_chunker, open_boilerplate, BOILERPLATE_NAME
+from encoders import load_encoder
+from aggregates import AggregateCube, open_aggregates, AGGREGATES_NAME
+from vector_store import (VectorStore, read_arrow, read_manifest, write_manifest,
+                          write_segment, segment_name, MANIFEST_NAME, METADATA_NAME, EMBEDDINGS_NAME)
+
+
+@contextlib.contextmanager
+def store_lock(store_dir):
+    """Exclusive writer lock so ingestion and compaction never interleave"""
+    os.makedirs(store_dir, exist_ok=True)
+    with open(os.path.join(store_dir, '.lock'), 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def read_or_create_manifest(store_dir):
+    if os.path.exists(os.path.join(store_dir, MANIFEST_NAME)):
+        return read_manifest(store_dir)
+    return {'format': 1, 'version': 0, 'dim': None, 'normalized': True, 'segments': []}
+
+
+def load_tombstones(store_dir, segment):
+    if not segment.get('tombstones'):
+        return np.empty(0, dtype=np.int64)
+    return np.load(os.path.join(store_dir, 'segments', segment['name'], segment['tombstones']))
+
+
+def load_live_catalog(store_dir, manifest):
+    """One row per (complaint, live chunk): complaint_id, content_hash, segment position, row
+
+    A deduplicated chunk (see dedup.py) appears once for every member
+    complaint, so complaints whose chunks were all collapsed into another
+    complaint's representative still count as known.
+    """
+    frames = []
+    for position, segment in enumerate(manifest['segments']):
+        path = os.path.join(store_dir, 'segments', segment['name'], METADATA_NAME)
+        table = read_arrow(path)
+        has_members = {'member_ids', 'member_hashes'} <= set(table.column_names)
+        columns = ['complaint_id', 'content_hash'] + (['member_ids', 'member_hashes'] if has_members else [])
+        frame = table.select(columns).to_pandas()
+        frame['segment'] = position
+        frame['row'] = np.arange(len(frame))
+        frame = frame.drop(index=load_tombstones(store_dir, segment))
+        if has_members:
+            dtype = frame['complaint_id'].dtype
+            shared = frame['member_ids'].notna()
+            members = frame[shared].explode(['member_ids', 'member_hashes'])
+            members = members.assign(complaint_id=members['member_ids'].astype(dtype),
+                                     content_hash=members['member_hashes'])
+            frame = pd.concat([frame[~shared], members])
+        frames.append(frame[['complaint_id', 'content_hash', 'segment', 'row']])
+
+    if not frames:
+        return pd.DataFrame(columns=['complaint_id', 'content_hash', 'segment', 'row'])
+    return pd.concat(frames, ignore_index=True).drop_duplicates()
+
+
+def reissue_shared_chunks(store_dir, manifest, rows, stale_ids):
+    """Copies of deduplicated chunks that lose some, but not all, members
+
+    The chunks at (segment, row) are about to be tombstoned. Each keeps its
+    text and embedding (it is within the dedup threshold of every member);
+    stale complaints leave `member_ids`/`member_hashes`/`duplicate_count`, and
+    if the representative itself is stale the first surviving member takes
+    over its complaint_id and content_hash. Returns (embeddings, frame).
+    """
+    vectors, frames = [], []
+    for position, segment_rows in rows.groupby('segment')['row']:
+        segment_dir = os.path.join(store_dir, 'segments', manifest['segments'][position]['name'])
+        table = read_arrow(os.path.join(segment_dir, METADATA_NAME))
+        if 'member_ids' not in table.column_names:
+            continue
+        segment_rows = np.unique(segment_rows.to_numpy())
+        frame = table.take(segment_rows).to_pandas()
+        keep = np.zeros(len(frame), dtype=bool)
+        owners, owner_hashes = frame['complaint_id'].tolist(), frame['content_hash'].tolist()
+        member_ids, member_hashes = [], []
+        for i, (ids, hashes) in enumerate(zip(frame['member_ids'], frame['member_hashes'])):
+            survivors = [] if ids is None else [(member, h) for member, h in zip(ids, hashes)
+                                                 if member not in stale_ids]
+            keep[i] = bool(survivors)
+            member_ids.append([member for member, _ in survivors])
+            member_hashes.append([h for _, h in survivors])
+            if survivors and owners[i] in stale_ids:
+                owners[i], owner_hashes[i] = survivors[0]
+        frame['complaint_id'] = np.asarray(owners, dtype=frame['complaint_id'].dtype)
+        frame['content_hash'] = owner_hashes
+        frame['member_ids'] = member_ids
+        frame['member_hashes'] = member_hashes
+        frame['duplicate_count'] = [len(ids) for ids in member_ids]
+        if keep.any():
+            embeddings = np.load(os.path.join(segment_dir, EMBEDDINGS_NAME), mmap_mode='r')
+            vectors.append(np.asarray(embeddings[segment_rows[keep]]))
+            frames.append(frame[keep])
+    if not frames:
+        return None, None
+    return np.concatenate(vectors), pd.concat(frames, ignore_index=True)
+
+
+def ingest_incremental(df, store_dir, model=None, deleted_ids=()):
+    """Embed only new or changed complaints and publish them as a new segment
+
+    `df` holds raw complaints with 'Complaint ID', 'Product' and
+    'Consumer complaint narrative'. Complaints whose narrative changed are
+    re-embedded and their old chunks tombstoned; `deleted_ids` are tombstoned.
+    """
+    with store_lock(store_dir):
+        manifest = read_or_create_manifest(store_dir)
+        catalog = load_live_catalog(store_dir, manifest)
+        known_hashes = catalog.drop_duplicates('complaint_id').set_index('complaint_id')['content_hash']
+
+        # Classify incoming complaints by content hash
+        df = df.drop_duplicates('Complaint ID', keep='last')
+        narratives = df['Consumer complaint narrative'].astype(str).str.strip()
+        df = df[narratives.str.len() >= 20]
+        hashes = narratives[df.index].map(content_hash)
+        previous = df['Complaint ID'].map(known_hashes)
+        is_new = previous.isna()
+        is_changed = ~is_new & (previous != hashes)
+        to_embed = df[is_new | is_changed]
+
+        stale_ids = set(df.loc[is_changed, 'Complaint ID']) | set(deleted_ids)
+        stale = catalog[catalog['complaint_id'].isin(stale_ids)]
+
+        stats = {
+            'new': int(is_new.sum()),
+            'changed': int(is_changed.sum()),
+            'unchanged': int(len(df) - is_new.sum() - is_changed.sum()),
+            'deleted': len(set(deleted_ids) & set(catalog['complaint_id'])),
+            'chunks_embedded': 0,
+            'version': manifest['version'],
+        }
+        if to_embed.empty and stale.empty:
+            print("Nothing to ingest: vector store is up to date")
+            return stats
+
+        version = manifest['version'] + 1
+
+        # Tombstone replaced and deleted chunks (new files; old manifest stays valid)
+        for position, rows in stale.groupby('segment')['row']:
+            segment = manifest['segments'][position]
+            deleted = np.union1d(load_tombstones(store_dir, segment), rows.to_numpy())
+            filename = f"tombstones-{version:06d}.npy"
+            np.save(os.path.join(store_dir, 'segments', segment['name'], filename), deleted)
+            segment['tombstones'] = filename
+            segment['deleted'] = int(len(deleted))
+
+        # Embed new/changed complaints into a fresh segment, together with
+        # deduplicated chunks that still stand for other complaints
+        reissued_embeddings, reissued = reissue_shared_chunks(
+            store_dir, manifest, stale[['segment', 'row']], stale_ids)
+        if not to_embed.empty or reissued is not None:
+            embeddings, chunks_df = reissued_embeddings, reissued
+            if not to_embed.empty:
+                if model is None:
+                    model = load_encoder('torch')
+                # Boilerplate counts carry over from earlier runs on this store
+                chunker = default_chunker(open_boilerplate(store_dir))
+                chunks_df = build_chunks(to_embed, chunker)
+                chunker.boilerplate.save(os.path.join(store_dir, BOILERPLATE_NAME))
+                embeddings = encode_chunks(model, chunks_df['text'].tolist())
+                stats['chunks_embedded'] = len(chunks_df)
+                if reissued is not None:
+                    # Same columns and types as the reissued chunks
+                    chunks_df['duplicate_count'] = 1
+                    chunks_df['member_ids'] = [[cid] for cid in chunks_df['complaint_id']]
+                    chunks_df['member_hashes'] = [[h] for h in chunks_df['content_hash']]
+                    embeddings = np.concatenate([embeddings, reissued_embeddings])
+                    chunks_df = pd.concat([chunks_df, reissued.reindex(columns=chunks_df.columns)],
+                                          ignore_index=True)
+            manifest['segments'].append(
+                write_segment(store_dir, segment_name(version), embeddings, chunks_df))
+            manifest['dim'] = int(embeddings.shape[1])
+
+        # Keep the aggregate cube exact. A fresh store starts its own; an
+        # existing store without one is left alone (run build_aggregates
+        # over the full data set instead).
+        cube = open_aggregates(store_dir)
+        if cube is None and manifest['version'] == 0:
+            cube = AggregateCube()
+        if cube is not None:
+            if not to_embed.empty:
+                cube.update(to_embed)
+            if deleted_ids:
+                cube.remove(deleted_ids)
+            cube.save(os.path.join(store_dir, AGGREGATES_NAME))
+
+        manifest['version'] = version
+        write_manifest(store_dir, manifest)
+        stats['version'] = version
+
+    print(f"Ingested v{version}: {stats['new']} new, {stats['changed']} changed, "
+          f"{stats['deleted']} deleted, {stats['chunks_embedded']} chunks embedded")
+    return stats
+
+
+def needs_compaction(manifest, max_segments=8, max_deleted_ratio=0.2):
+    """Too many segments, or too many tombstoned rows"""
+    segments = manifest['segments']
+    rows = sum(segment['rows'] for segment in segments)
+    deleted = sum(segment.get('deleted', 0) for segment in segments)
+    return len(segments) > max_segments or bool(rows and deleted / rows > max_deleted_ratio)
+
+
+def compact_segments(store_dir):
+    """Merge all segments into one, dropping tombstoned rows"""
+    with store_lock(store_dir):
+        manifest = read_manifest(store_dir)
+        segments = manifest['segments']
+        if len(segments) <= 1 and not any(segment.get('deleted') for segment in segments):
+            return None
+
+        store = VectorStore.open(store_dir)
+        version = manifest['version'] + 1
+        merged = write_segment(store_dir, segment_name(version), store.embeddings,
+                               store.metadata.table)
+        # Old segments stay on disk until readers have had time to reopen
+        retired_at = time.time()
+        manifest.setdefault('retired', []).extend(
+            {'name': segment['name'], 'retired_at': retired_at} for segment in segments)
+        manifest['segments'] = [merged]
+        manifest['version'] = version
+        write_manifest(store_dir, manifest)
+
+    print(f"Compacted {len(segments)} segments into {merged['name']} ({merged['rows']} chunks)")
+    return manifest
+
+
+def remove_retired_segments(store_dir, min_age_seconds=300):
+    """Delete segments retired by compaction once readers have had time to move on"""
+    with store_lock(store_dir):
+        manifest = read_manifest(store_dir)
+        now = time.time()
+        expired = [entry for entry in manifest.get('retired', [])
+                   if now - entry['retired_at'] > min_age_seconds]
+        if not expired:
+            return []
+
+        for entry in expired:
+            shutil.rmtree(os.path.join(store_dir, 'segments', entry['name']), ignore_errors=True)
+        manifest['retired'] = [entry for entry in manifest['retired'] if entry not in expired]
+        write_manifest(store_dir, manifest)
+    return [entry['name'] for entry in expired]
+
+
+class BackgroundCompactor(threading.Thread):
+    """Daemon thread that compacts the store when it becomes fragmented"""
+
+    def __init__(self, store_dir, interval=60, max_segments=8, max_deleted_ratio=0.2):
+        super().__init__(daemon=True)
+        self.store_dir = store_dir
+        self.interval = interval
+        self.max_segments = max_segments
+        self.max_deleted_ratio = max_deleted_ratio
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                manifest = read_manifest(self.store_dir)
+                if needs_compaction(manifest, self.max_segments, self.max_deleted_ratio):
+                    compact_segments(self.store_dir)
+                remove_retired_segments(self.store_dir)
+            except Exception as e:
+                print(f"❌ Background compaction failed: {e}")
+
+    def stop(self):
+        self._stop_event.set()
+
+
+if __name__ == "__main__":
+    # Example usage: append today's complaints to the store
+    df = pd.read_csv('../data/processed/filtered_complaints.csv')
+    ingest_incremental(df, '../vector_store/complaints_store')
+    compact_segments('../vector_store/complaints_store')
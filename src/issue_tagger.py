@@ -0,0 +1,101 @@
+# issue_tagger.py - Single-pass issue tagging of complaint text
+#
+# All issue keywords (single words or phrases) are compiled into one
+# Aho-Corasick automaton over word tokens, so a chunk is tagged in a single
+# left-to-right pass and only whole words match ("fee" does not match
+# "coffee"). Tags are stored per chunk as a bitmask (`issue_tags` column),
+# computed once at ingest; answering a question then only ORs the masks of
+# the retrieved chunks.
+import re
+from collections import deque
+import numpy as np
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+# Issue name -> keywords, in display order; bit i of a mask is issue i.
+# Matching is on whole words, so common inflections are listed explicitly.
+ISSUE_KEYWORDS = [
+    ('billing', ['billing', 'billed', 'bill', 'charge', 'charges', 'charged', 'fee', 'fees',
+                 'overcharge', 'overcharged', 'overdraft']),
+    ('access', ['access', 'login', 'log in', 'password', 'locked', 'locked out']),
+    ('service', ['service', 'customer', 'customers', 'representative', 'representatives',
+                 'support']),
+    ('fraud', ['fraud', 'fraudulent', 'unauthorized', 'theft', 'identity theft', 'scam',
+               'scammed', 'scammer']),
+    ('payment', ['payment', 'payments', 'transaction', 'transactions', 'transfer', 'transfers',
+                 'withdrawal', 'withdrawals']),
+    ('credit', ['credit', 'score', 'report', 'reports', 'credit report', 'rating']),
+    ('loan', ['loan', 'loans', 'interest', 'repayment', 'debt', 'debts']),
+]
+
+# Smallest unsigned type that holds one bit per issue
+TAG_DTYPE = np.uint16
+
+
+class IssueTagger:
+    """Aho-Corasick automaton over word tokens; tag(text) -> issue bitmask"""
+
+    def __init__(self, issue_keywords=ISSUE_KEYWORDS, dtype=TAG_DTYPE):
+        # dtype=None: masks stay Python ints of any width (tag() only, no tag_many)
+        if dtype is not None and len(issue_keywords) > np.iinfo(dtype).bits:
+            raise ValueError(f"At most {np.iinfo(dtype).bits} issues fit in a tag mask")
+        self.dtype = dtype
+        self.issues = [name for name, _ in issue_keywords]
+        self._goto = [{}]    # state -> {token: next state}
+        self._output = [0]   # state -> mask of issues whose phrase ends here
+        for bit, (_, phrases) in enumerate(issue_keywords):
+            for phrase in phrases:
+                state = 0
+                for token in TOKEN_PATTERN.findall(phrase.lower()):
+                    if token not in self._goto[state]:
+                        self._goto.append({})
+                        self._output.append(0)
+                        self._goto[state][token] = len(self._goto) - 1
+                    state = self._goto[state][token]
+                self._output[state] |= 1 << bit
+        self._build_failure_links()
+
+    def _build_failure_links(self):
+        # Breadth-first, so a state's failure target is finished before it
+        self._fail = [0] * len(self._goto)
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for token, child in self._goto[state].items():
+                fallback = self._fail[state]
+                while fallback and token not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(token, 0)
+                self._fail[child] = target if target != child else 0
+                self._output[child] |= self._output[self._fail[child]]
+                queue.append(child)
+
+    def tag(self, text):
+        """Bitmask of the issues mentioned in `text`"""
+        goto, fail, output = self._goto, self._fail, self._output
+        state = mask = 0
+        for token in TOKEN_PATTERN.findall(str(text).lower()):
+            while state and token not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(token, 0)
+            mask |= output[state]
+        return mask
+
+    def tag_many(self, texts):
+        """Bitmasks for many texts, as a NumPy array"""
+        return np.fromiter((self.tag(text) for text in texts), dtype=self.dtype, count=len(texts))
+
+    def names(self, mask):
+        """Issue names set in `mask`, in ISSUE_KEYWORDS order"""
+        return [name for bit, name in enumerate(self.issues) if mask >> bit & 1]
+
+
+_default_tagger = None
+
+
+def default_tagger():
+    """Shared tagger for ISSUE_KEYWORDS (built once per process)"""
+    global _default_tagger
+    if _default_tagger is None:
+        _default_tagger = IssueTagger()
+    return _default_tagger
@@ -0,0 +1,294 @@
+# lexical_index.py - BM25 inverted index over chunk text, fused with dense retrieval
+#
+# Each vector store segment gets its own immutable index (lexical.npz),
+# written next to its embeddings at ingest time, so new data is indexed
+# incrementally and compaction simply rewrites it. At query time the
+# per-segment indexes are searched with store-wide BM25 statistics.
+#
+# Postings are stored CSR-style (term offsets into flat doc id / term
+# frequency arrays). Queries run term-at-a-time with MaxScore pruning: once
+# the k-th best score exceeds what the remaining terms could add, those
+# (usually long, low-idf) posting lists are only probed for the current
+# candidates instead of being scanned.
+import os
+import re
+import numpy as np
+
+LEXICAL_NAME = 'lexical.npz'
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset("""
+a an and are as at be been but by can did do does for from had has have how i if in into is
+it its me my of on or our so that the their them there these they this to was we were what
+when where which who why will with you your about any tell
+""".split())
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+
+def tokenize(text):
+    """Lowercase alphanumeric tokens without stopwords"""
+    return [token for token in TOKEN_PATTERN.findall(str(text).lower()) if token not in STOPWORDS]
+
+
+class LexicalIndex:
+    """Inverted index of one segment: term -> sorted doc ids with term frequencies"""
+
+    def __init__(self, terms, offsets, doc_ids, tfs, doc_lengths, max_tf, min_length):
+        self.terms = terms
+        self.vocab = {term: term_id for term_id, term in enumerate(terms)}
+        self.offsets = offsets          # (n_terms + 1,) int64
+        self.doc_ids = doc_ids          # (n_postings,) int32, sorted within each term
+        self.tfs = tfs                  # (n_postings,) uint16
+        self.doc_lengths = doc_lengths  # (n_docs,) int32
+        # Per-term max tf and min doc length, for BM25 upper bounds
+        self.max_tf = max_tf
+        self.min_length = min_length
+
+    def __len__(self):
+        return len(self.doc_lengths)
+
+    @property
+    def nbytes(self):
+        return sum(array.nbytes for array in (self.offsets, self.doc_ids, self.tfs, self.doc_lengths))
+
+    @classmethod
+    def build(cls, texts):
+        """Tokenize `texts` (one per row) and build the postings"""
+        vocab = {}
+        term_ids = []
+        doc_lengths = np.zeros(len(texts), dtype=np.int32)
+        for doc, text in enumerate(texts):
+            tokens = tokenize(text)
+            doc_lengths[doc] = len(tokens)
+            term_ids.extend(vocab.setdefault(token, len(vocab)) for token in tokens)
+
+        n_docs = max(len(texts), 1)
+        doc_ids = np.repeat(np.arange(len(texts), dtype=np.int64), doc_lengths)
+        # One sort groups postings by term, then doc; counts are term frequencies
+        keys, tfs = np.unique(np.asarray(term_ids, dtype=np.int64) * n_docs + doc_ids,
+                              return_counts=True)
+        posting_terms = keys // n_docs
+        doc_ids = (keys % n_docs).astype(np.int32)
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(posting_terms, minlength=len(vocab)))])
+
+        starts = offsets[:-1]
+        if len(keys):
+            max_tf = np.maximum.reduceat(tfs, starts).astype(np.uint16)
+            min_length = np.minimum.reduceat(doc_lengths[doc_ids], starts).astype(np.int32)
+        else:
+            max_tf = np.empty(0, dtype=np.uint16)
+            min_length = np.empty(0, dtype=np.int32)
+        return cls(list(vocab), offsets.astype(np.int64), doc_ids,
+                   np.minimum(tfs, np.iinfo(np.uint16).max).astype(np.uint16),
+                   doc_lengths, max_tf, min_length)
+
+    def postings(self, term):
+        """(doc ids, term frequencies) for `term`, empty if unseen"""
+        term_id = self.vocab.get(term)
+        if term_id is None:
+            return self.doc_ids[:0], self.tfs[:0]
+        start, stop = self.offsets[term_id], self.offsets[term_id + 1]
+        return self.doc_ids[start:stop], self.tfs[start:stop]
+
+    def save(self, path):
+        # Terms are stored as one newline-joined UTF-8 buffer
+        terms = np.frombuffer('\n'.join(self.terms).encode('utf-8'), dtype=np.uint8)
+        np.savez(path, terms=terms, offsets=self.offsets, doc_ids=self.doc_ids, tfs=self.tfs,
+                 doc_lengths=self.doc_lengths, max_tf=self.max_tf, min_length=self.min_length)
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        terms = data['terms'].tobytes().decode('utf-8')
+        return cls(terms.split('\n') if terms else [], data['offsets'], data['doc_ids'], data['tfs'],
+                   data['doc_lengths'], data['max_tf'], data['min_length'])
+
+
+class BM25Searcher:
+    """BM25 over a store's segment indexes, with store-wide idf and average length
+
+    `parts` is a list of (LexicalIndex, row_map) where row_map maps segment
+    doc ids to store rows (-1 for tombstoned rows), or None for identity.
+    """
+
+    def __init__(self, parts, k1=K1, b=B):
+        self.k1 = k1
+        self.b = b
+        self.parts = []
+        live_lengths = []
+        for lexical, row_map in parts:
+            live = np.ones(len(lexical), dtype=bool) if row_map is None else row_map >= 0
+            live_lengths.append(lexical.doc_lengths[live])
+            self.parts.append((lexical, row_map, live))
+        lengths = np.concatenate(live_lengths) if live_lengths else np.empty(0)
+        self.n_docs = len(lengths)
+        self.n_indexed = sum(len(lexical) for lexical, _, _ in self.parts)
+        self.avg_length = float(lengths.mean()) if len(lengths) and lengths.mean() > 0 else 1.0
+        # Per-doc length normalization, k1 * (1 - b + b * dl / avgdl)
+        self.norms = [(k1 * (1 - b + b * lexical.doc_lengths / self.avg_length)).astype(np.float32)
+                      for lexical, _, _ in self.parts]
+
+    def __len__(self):
+        return self.n_docs
+
+    def idf(self, term):
+        # Tombstoned rows still count until compaction (as in Lucene), on both sides
+        df = sum(len(lexical.postings(term)[0]) for lexical, _, _ in self.parts)
+        return float(np.log(1 + (self.n_indexed - df + 0.5) / (df + 0.5)))
+
+    def _term_weight(self, tf, norm):
+        return tf * (self.k1 + 1) / (tf + norm)
+
+    def search(self, query, k=5, rows=None):
+        """Top-k store rows by BM25 score for the query text
+
+        `rows` (sorted store row numbers) restricts the search, as produced
+        by MetadataIndex.lookup. Returns (rows, scores), best first.
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms or k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        idfs = {term: self.idf(term) for term in terms}
+
+        allowed_rows = None
+        if rows is not None:
+            allowed_rows = np.zeros(self.n_docs, dtype=bool)
+            allowed_rows[rows] = True
+
+        # Search segments one after another; the k-th best score found so far
+        # prunes later segments too
+        found_rows, found_scores = [], []
+        threshold = -np.inf
+        for (lexical, row_map, live), norms in zip(self.parts, self.norms):
+            if allowed_rows is None:
+                allowed = live
+            elif row_map is None:
+                allowed = allowed_rows
+            else:
+                allowed = np.zeros(len(lexical), dtype=bool)
+                allowed[live] = allowed_rows[row_map[live]]
+            docs, scores = self._search_part(lexical, norms, allowed, terms, idfs, k, threshold)
+            if len(docs):
+                found_rows.append(docs if row_map is None else row_map[docs])
+                found_scores.append(scores)
+                merged = np.concatenate(found_scores)
+                if len(merged) >= k:
+                    threshold = max(threshold, float(np.partition(merged, -k)[-k]))
+
+        if not found_rows:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        all_rows = np.concatenate(found_rows).astype(np.int64)
+        all_scores = np.concatenate(found_scores)
+        order = np.lexsort((all_rows, -all_scores))[:k]
+        return all_rows[order], all_scores[order]
+
+    def _search_part(self, lexical, norms, allowed, terms, idfs, k, threshold):
+        """Term-at-a-time MaxScore over one segment"""
+        bounds = {}
+        for term in terms:
+            term_id = lexical.vocab.get(term)
+            if term_id is not None:
+                bounds[term] = idfs[term] * self._term_weight(
+                    float(lexical.max_tf[term_id]),
+                    self.k1 * (1 - self.b + self.b * lexical.min_length[term_id] / self.avg_length))
+        if not bounds:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        # Highest-impact terms first; their lists seed the candidate set
+        ordered = sorted(bounds, key=bounds.get, reverse=True)
+        candidates = np.empty(0, dtype=np.int64)
+        scores = np.empty(0, dtype=np.float32)
+        for position, term in enumerate(ordered):
+            # Best score the terms after this one could still add
+            remaining = sum(bounds[later] for later in ordered[position + 1:])
+            docs, tfs = lexical.postings(term)
+
+            # Existing candidates: probe the list instead of scanning it
+            in_candidates = np.zeros(len(docs), dtype=bool)
+            if len(candidates):
+                found = np.minimum(np.searchsorted(docs, candidates), len(docs) - 1)
+                hit = docs[found] == candidates
+                scores[hit] += idfs[term] * self._term_weight(
+                    tfs[found[hit]].astype(np.float32), norms[candidates[hit]])
+                in_candidates[found[hit]] = True
+
+            # Essential term: a doc first seen here can still reach the top-k,
+            # but only if this term plus every remaining one could lift it there
+            if bounds[term] + remaining >= threshold:
+                new = allowed[docs] & ~in_candidates
+                docs, tfs = docs[new], tfs[new]
+                weights = idfs[term] * self._term_weight(tfs.astype(np.float32), norms[docs])
+                admit = weights + remaining >= threshold
+                if len(candidates):
+                    candidates = np.concatenate([candidates, docs[admit]])
+                    scores = np.concatenate([scores, weights[admit].astype(np.float32)])
+                    order = np.argsort(candidates, kind='stable')
+                    candidates, scores = candidates[order], scores[order]
+                else:
+                    candidates = docs[admit].astype(np.int64)
+                    scores = weights[admit].astype(np.float32)
+
+            if len(candidates) >= k:
+                threshold = max(threshold, float(np.partition(scores, -k)[-k]))
+                # Drop candidates that cannot catch up even with every remaining term
+                viable = scores + remaining >= threshold
+                if not viable.all():
+                    candidates, scores = candidates[viable], scores[viable]
+
+        if len(candidates) > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+            candidates, scores = candidates[top], scores[top]
+        order = np.lexsort((candidates, -scores))
+        return candidates[order], scores[order]
+
+
+def open_lexical_index(store):
+    """BM25 searcher for a VectorStore, loading per-segment indexes when present
+
+    Segments written before lexical indexes existed (and legacy parquet
+    stores) are indexed from their text column in memory.
+    """
+    if not store.segments:
+        return BM25Searcher([(LexicalIndex.build(store.metadata.column('text')), None)])
+
+    parts = []
+    offset = 0
+    for segment_dir, rows, live in store.segments:
+        path = os.path.join(segment_dir, LEXICAL_NAME)
+        if os.path.exists(path):
+            lexical = LexicalIndex.load(path)
+        else:
+            from vector_store import read_arrow, METADATA_NAME  # vector_store imports this module
+            table = read_arrow(os.path.join(segment_dir, METADATA_NAME))
+            lexical = LexicalIndex.build(table.column('text').to_pylist())
+        row_map = np.arange(offset, offset + rows, dtype=np.int64)
+        if live is not None:
+            row_map = np.full(rows, -1, dtype=np.int64)
+            row_map[live] = np.arange(offset, offset + len(live))
+        parts.append((lexical, row_map))
+        offset += rows if live is None else len(live)
+    return BM25Searcher(parts)
+
+
+def write_lexical_index(segment_dir, texts):
+    """Build and save the lexical index for a newly written segment"""
+    LexicalIndex.build(texts).save(os.path.join(segment_dir, LEXICAL_NAME))
+
+
+def reciprocal_rank_fusion(rankings, k=5, rrf_k=60):
+    """Fuse several ranked row lists: score(row) = sum 1 / (rrf_k + rank)
+
+    Returns (rows, fused scores), best first. Ties keep the order of the
+    first ranking the row appears in.
+    """
+    fused = {}
+    for ranking in rankings:
+        for rank, row in enumerate(np.asarray(ranking).tolist()):
+            if row >= 0:
+                fused[row] = fused.get(row, 0.0) + 1.0 / (rrf_k + rank + 1)
+    best = sorted(fused.items(), key=lambda item: -item[1])[:k]
+    rows = np.array([row for row, _ in best], dtype=np.int64)
+    scores = np.array([score for _, score in best], dtype=np.float32)
+    return rows, scores
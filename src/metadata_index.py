@@ -0,0 +1,109 @@
+# metadata_index.py - Inverted indexes over vector store metadata for pre-filtering
+#
+# Filters are resolved to a sorted array of matching row numbers before any
+# similarity is computed, so a product-specific question only scores the
+# chunks of that product.
+import numpy as np
+
+# Filter keys accepted by RAGSystem.retrieve_chunks(filters=...)
+CATEGORY_FILTERS = ('product', 'company', 'state')
+FILTER_KEYS = CATEGORY_FILTERS + ('complaint_id', 'date_from', 'date_to')
+
+
+class PostingLists:
+    """value -> sorted row numbers, stored as one permutation plus offsets"""
+
+    def __init__(self, codes, categories):
+        codes = np.asarray(codes, dtype=np.int64)
+        self.rows = np.argsort(codes, kind='stable')  # rows grouped by code, ascending within
+        counts = np.bincount(codes[codes >= 0], minlength=len(categories))
+        self.offsets = np.concatenate([[0], np.cumsum(counts)]) + int((codes < 0).sum())
+        self.lookup = {str(value).lower(): code for code, value in enumerate(categories)}
+        self.values = list(categories)
+
+    def get(self, value):
+        code = self.lookup.get(str(value).lower())
+        if code is None:
+            return np.empty(0, dtype=np.int64)
+        return self.rows[self.offsets[code]:self.offsets[code + 1]]
+
+
+class SortedKeyIndex:
+    """Sorted keys with their rows, for point and range lookups"""
+
+    def __init__(self, keys):
+        self.order = np.argsort(keys, kind='stable')
+        self.keys = np.asarray(keys)[self.order]
+        # Missing dates (NaT) sort last and never match a range
+        self.n_valid = int((~np.isnat(self.keys)).sum()) if self.keys.dtype.kind == 'M' else len(self.keys)
+
+    def range(self, low=None, high=None):
+        start = 0 if low is None else np.searchsorted(self.keys[:self.n_valid], low, side='left')
+        stop = self.n_valid if high is None else np.searchsorted(self.keys[:self.n_valid], high, side='right')
+        return np.sort(self.order[start:stop])
+
+    def points(self, values):
+        values = np.asarray(values, dtype=self.keys.dtype)
+        starts = np.searchsorted(self.keys, values, side='left')
+        stops = np.searchsorted(self.keys, values, side='right')
+        parts = [self.order[a:b] for a, b in zip(starts, stops)]
+        return np.sort(np.concatenate(parts)) if parts else np.empty(0, dtype=np.int64)
+
+
+class MetadataIndex:
+    """Per-column inverted indexes, built lazily the first time a column is filtered"""
+
+    def __init__(self, metadata):
+        self.metadata = metadata
+        self._indexes = {}
+
+    def _column_index(self, name):
+        if name not in self._indexes:
+            if name not in self.metadata.columns:
+                raise ValueError(f"Vector store has no '{name}' metadata; "
+                                 f"rebuild embeddings to filter on it")
+            if name in CATEGORY_FILTERS:
+                self._indexes[name] = PostingLists(*self.metadata.codes(name))
+            elif name == 'date_received':
+                dates = np.array(self.metadata.take(name, np.arange(len(self.metadata))),
+                                 dtype='datetime64[D]')
+                self._indexes[name] = SortedKeyIndex(dates)
+            else:
+                self._indexes[name] = SortedKeyIndex(self.metadata.column(name))
+        return self._indexes[name]
+
+    def values(self, name):
+        """Distinct values of a category column (e.g. for UI dropdowns)"""
+        return self._column_index(name).values
+
+    def lookup(self, filters):
+        """Sorted row numbers matching every filter (AND across keys, OR within a list)"""
+        unknown = set(filters) - set(FILTER_KEYS)
+        if unknown:
+            raise ValueError(f"Unknown filters: {sorted(unknown)}. Choose from {list(FILTER_KEYS)}")
+
+        matches = []
+        for name in CATEGORY_FILTERS:
+            if filters.get(name) is not None:
+                values = filters[name] if isinstance(filters[name], (list, tuple, set)) else [filters[name]]
+                postings = self._column_index(name)
+                # An empty list matches nothing; repeated values must not repeat rows
+                parts = [postings.get(v) for v in values]
+                matches.append(np.unique(np.concatenate(parts)) if parts else np.empty(0, dtype=np.int64))
+
+        if filters.get('complaint_id') is not None:
+            ids = filters['complaint_id']
+            ids = list(ids) if isinstance(ids, (list, tuple, set)) else [ids]
+            matches.append(np.unique(self._column_index('complaint_id').points(ids)))
+
+        if filters.get('date_from') is not None or filters.get('date_to') is not None:
+            low = np.datetime64(filters['date_from'], 'D') if filters.get('date_from') else None
+            high = np.datetime64(filters['date_to'], 'D') if filters.get('date_to') else None
+            matches.append(self._column_index('date_received').range(low, high))
+
+        if not matches:
+            return None  # no filters: search everything
+        rows = matches[0]
+        for other in matches[1:]:
+            rows = np.intersect1d(rows, other, assume_unique=True)
+        return rows
@@ -0,0 +1,206 @@
+# metrics.py - Hot-path timers, counters and an opt-in slow-request profiler
+#
+# RetrievalMetrics keeps one latency histogram per pipeline stage (fixed
+# buckets, so observing is a bisect plus a few additions under a lock) and
+# plain counters/gauges. to_prometheus() renders everything in the
+# Prometheus text exposition format.
+#
+# SlowRequestProfiler is off unless installed: a daemon thread samples the
+# stacks of threads currently inside a request every `interval_ms`, and
+# requests slower than `threshold_ms` have their samples appended to a file
+# as collapsed stacks ("outer;inner;leaf count"), the input format of
+# flamegraph.pl and speedscope.
+import bisect
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+# Histogram bucket upper bounds, in seconds
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class Histogram:
+    """Fixed-bucket latency histogram"""
+
+    __slots__ = ('buckets', 'counts', 'count', 'sum', 'max')
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def quantile(self, q):
+        """q-quantile estimate, interpolated linearly inside its bucket"""
+        if not self.count:
+            return 0.0
+        target, seen, lower = q * self.count, 0, 0.0
+        for bound, count in zip(self.buckets + (self.max,), self.counts):
+            upper = min(bound, self.max)
+            if count and seen + count >= target:
+                return lower + (upper - lower) * (target - seen) / count
+            seen += count
+            lower = upper
+        return self.max
+
+
+class _StageTimer:
+    """Context manager timing one block into a RetrievalMetrics stage"""
+
+    __slots__ = ('metrics', 'name', 'start')
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        self.metrics.observe(self.name, time.perf_counter() - self.start)
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+NULL_TIMER = _NullTimer()
+
+
+class RetrievalMetrics:
+    """Per-stage timers plus counters and gauges for a RAGSystem"""
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.stages = {}
+        self.counters = Counter()
+        self.gauges = {}
+        self._lock = threading.Lock()
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            histogram = self.stages.get(stage)
+            if histogram is None:
+                histogram = self.stages[stage] = Histogram()
+            histogram.observe(seconds)
+
+    def stage(self, name):
+        """Time a block: `with metrics.stage('encode'): ...`"""
+        return _StageTimer(self, name) if self.enabled else NULL_TIMER
+
+    def increment(self, name, amount=1):
+        if self.enabled:
+            with self._lock:
+                self.counters[name] += amount
+
+    def set_gauge(self, name, value):
+        self.gauges[name] = value
+
+    def snapshot(self):
+        """Plain-dict view for JSON stats endpoints"""
+        with self._lock:
+            stages = {name: {'count': h.count, 'mean_ms': h.sum / h.count * 1000 if h.count else 0.0,
+                             'p50_ms': h.quantile(0.5) * 1000, 'p99_ms': h.quantile(0.99) * 1000,
+                             'max_ms': h.max * 1000}
+                      for name, h in self.stages.items()}
+            return {'stages': stages, 'counters': dict(self.counters), 'gauges': dict(self.gauges)}
+
+    def to_prometheus(self, prefix='rag', extra_gauges=None):
+        """Prometheus text exposition format (version 0.0.4)"""
+        lines = [f"# HELP {prefix}_stage_seconds Time spent in each retrieval/answer stage",
+                 f"# TYPE {prefix}_stage_seconds histogram"]
+        with self._lock:
+            for name, h in sorted(self.stages.items()):
+                cumulative = 0
+                for bound, count in zip(h.buckets, h.counts):
+                    cumulative += count
+                    lines.append(f'{prefix}_stage_seconds_bucket{{stage="{name}",le="{bound}"}} {cumulative}')
+                lines.append(f'{prefix}_stage_seconds_bucket{{stage="{name}",le="+Inf"}} {h.count}')
+                lines.append(f'{prefix}_stage_seconds_sum{{stage="{name}"}} {h.sum:.9f}')
+                lines.append(f'{prefix}_stage_seconds_count{{stage="{name}"}} {h.count}')
+            counters = dict(self.counters)
+        for name, value in sorted(counters.items()):
+            lines.append(f"# TYPE {prefix}_{name}_total counter")
+            lines.append(f"{prefix}_{name}_total {value}")
+        for name, value in sorted({**self.gauges, **(extra_gauges or {})}.items()):
+            lines.append(f"# TYPE {prefix}_{name} gauge")
+            lines.append(f"{prefix}_{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+class SlowRequestProfiler:
+    """Sampling profiler that dumps collapsed stacks of slow requests"""
+
+    def __init__(self, output_path, threshold_ms=200, interval_ms=5, max_depth=64):
+        self.output_path = output_path
+        self.threshold = threshold_ms / 1000
+        self.interval = interval_ms / 1000
+        self.max_depth = max_depth
+        self.dumped = 0
+        self._active = {}  # thread id -> Counter of collapsed stacks
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._sample_forever, name='slow-request-profiler',
+                                        daemon=True)
+        self._thread.start()
+
+    def _collapse(self, frame):
+        names = []
+        while frame is not None and len(names) < self.max_depth:
+            code = frame.f_code
+            names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+            frame = frame.f_back
+        return ';'.join(reversed(names))
+
+    def _sample_forever(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                if not self._active:
+                    continue
+                frames = sys._current_frames()
+                for thread_id, samples in self._active.items():
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        samples[self._collapse(frame)] += 1
+
+    @contextmanager
+    def request(self, label):
+        """Sample the calling thread while the block runs"""
+        thread_id = threading.get_ident()
+        samples = Counter()
+        with self._lock:
+            self._active[thread_id] = samples
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self._active.pop(thread_id, None)
+            if elapsed >= self.threshold and samples:
+                self._dump(label, elapsed, samples)
+
+    def _dump(self, label, elapsed, samples):
+        # One "# request" comment per slow request; flamegraph tools skip it
+        with self._lock, open(self.output_path, 'a') as f:
+            f.write(f"# {time.strftime('%Y-%m-%dT%H:%M:%S')} {elapsed * 1000:.1f} ms {label!r}\n")
+            for stack, count in samples.most_common():
+                f.write(f"{stack} {count}\n")
+            self.dumped += 1
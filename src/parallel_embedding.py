@@ -0,0 +1,152 @@
+# parallel_embedding.py - Multi-process embedding with length-sorted dynamic batches
+#
+# The parent process chunks complaints in windows, sorts each window by
+# token length and cuts it into batches under a padded-token budget. Batches
+# go to a pool of worker processes (one encoder each, see encoders.py)
+# through a bounded in-flight queue, and results are written to the vector store in
+# the original chunk order.
+#
+# Chunking loads the HF tokenizer (and its Rust thread pool) in the parent,
+# so workers are spawned, not forked: a fork after threads have started can
+# deadlock the child.
+import os
+import re
+import time
+import multiprocessing as mp
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from chunking_embedding import iter_build_chunks
+from chunker import default_chunker, BOILERPLATE_NAME
+from vector_store import SegmentWriter, write_manifest, segment_name
+from encoders import load_encoder
+
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+_worker_model = None
+
+
+def estimate_tokens(text):
+    """Cheap token count (words + punctuation), a lower bound on WordPiece tokens"""
+    return len(TOKEN_PATTERN.findall(text)) + 2  # [CLS] and [SEP]
+
+
+def _init_worker(encoder, encoder_params, threads_per_worker):
+    """Load one encoder per worker process"""
+    global _worker_model
+    _worker_model = load_encoder(encoder, threads=threads_per_worker, **encoder_params)
+
+
+def _encode_batch(texts):
+    return _worker_model.encode(texts, batch_size=len(texts), show_progress_bar=False)
+
+
+def plan_batches(lengths, max_batch_tokens=8192, max_batch_size=256):
+    """Group positions sorted by length so each batch stays under a padded-token budget"""
+    order = np.argsort(lengths, kind='stable')
+    batches, current, longest = [], [], 0
+    for position in order:
+        longest_if_added = max(longest, lengths[position])
+        # Padded cost of a batch = its longest sequence x its size
+        if current and (longest_if_added * (len(current) + 1) > max_batch_tokens
+                        or len(current) >= max_batch_size):
+            batches.append(np.array(current))
+            current, longest_if_added = [], lengths[position]
+        current.append(position)
+        longest = longest_if_added
+    if current:
+        batches.append(np.array(current))
+    return batches
+
+
+def iter_chunk_windows(df, window_complaints=2000, chunker=None):
+    """Chunk complaints a window at a time so chunking overlaps encoding"""
+    return iter_build_chunks((df.iloc[start:start + window_complaints]
+                              for start in range(0, len(df), window_complaints)), chunker)
+
+
+def create_embeddings_parallel(df, store_dir, num_workers=None, threads_per_worker=1,
+                               max_batch_tokens=8192, window_complaints=2000, max_in_flight=None,
+                               encoder='torch', encoder_params=None):
+    """Embed all complaints in `df` with a worker pool and write a vector store
+
+    `encoder` and `encoder_params` select the backend (see encoders.load_encoder);
+    a 'threads' entry in `encoder_params` overrides `threads_per_worker`.
+    """
+    encoder_params = dict(encoder_params or {})
+    threads_per_worker = encoder_params.pop('threads', threads_per_worker)
+    num_workers = num_workers or os.cpu_count() or 1
+    max_in_flight = max_in_flight or num_workers * 4
+    print(f"Creating embeddings with {num_workers} workers...")
+
+    start = time.perf_counter()
+    writer = SegmentWriter(store_dir, segment_name(1))
+    pending = deque()  # (window, batch positions, future), in submission order
+    windows = {}       # window id -> [chunks_df, embeddings, batches remaining]
+    next_window_to_write = 0
+    total_chunks = 0
+    chunker = default_chunker()  # boilerplate counted over this build, kept with the store
+
+    def complete_oldest():
+        nonlocal next_window_to_write
+        window_id, positions, future = pending.popleft()
+        state = windows[window_id]
+        batch_embeddings = future.result()
+        if state[1] is None:
+            state[1] = np.empty((len(state[0]), batch_embeddings.shape[1]), dtype=np.float32)
+        state[1][positions] = batch_embeddings
+        state[2] -= 1
+
+        # Futures finish in FIFO order, so windows complete (and are written) in order
+        while next_window_to_write in windows and windows[next_window_to_write][2] == 0:
+            chunks_df, embeddings, _ = windows.pop(next_window_to_write)
+            writer.append(embeddings, chunks_df)
+            next_window_to_write += 1
+
+    with ProcessPoolExecutor(max_workers=num_workers, mp_context=mp.get_context('spawn'),
+                             initializer=_init_worker,
+                             initargs=(encoder, encoder_params, threads_per_worker)) as pool:
+        for window_id, chunks_df in enumerate(iter_chunk_windows(df, window_complaints, chunker)):
+            texts = chunks_df['text'].tolist()
+            lengths = np.array([estimate_tokens(text) for text in texts])
+            batches = plan_batches(lengths, max_batch_tokens)
+            windows[window_id] = [chunks_df, None, len(batches)]
+            total_chunks += len(texts)
+
+            for positions in batches:
+                # Bounded queue: wait for the oldest batch before submitting more
+                while len(pending) >= max_in_flight:
+                    complete_oldest()
+                future = pool.submit(_encode_batch, [texts[i] for i in positions])
+                pending.append((window_id, positions, future))
+
+        while pending:
+            complete_oldest()
+
+    segment = writer.close()
+    chunker.boilerplate.save(os.path.join(store_dir, BOILERPLATE_NAME))
+    write_manifest(store_dir, {
+        'format': 1,
+        'version': 1,
+        'dim': writer.dim,
+        'normalized': True,
+        'segments': [segment],
+    })
+
+    elapsed = time.perf_counter() - start
+    stats = {
+        'chunks': total_chunks,
+        'seconds': elapsed,
+        'chunks_per_sec': total_chunks / elapsed if elapsed else 0.0,
+        'workers': num_workers,
+    }
+    print(f"Embedded {total_chunks} chunks in {elapsed:.1f}s "
+          f"({stats['chunks_per_sec']:.1f} chunks/sec) -> {store_dir}")
+    return stats
+
+
+if __name__ == "__main__":
+    # Example usage
+    from chunking_embedding import load_filtered_data
+    df = load_filtered_data('../data/processed/filtered_complaints.csv')
+    create_embeddings_parallel(df, '../vector_store/complaints_store')
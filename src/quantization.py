@@ -0,0 +1,196 @@
+# quantization.py - Compressed embedding storage (int8 scalar and product quantization)
+import numpy as np
+from vector_index import normalize_rows, top_k_indices, kmeans, assign_to_centroids, stack_results
+
+SCORE_BLOCK = 8192  # rows decoded per block, bounds temporary memory
+
+
+class ScalarQuantizer:
+    """Per-dimension int8 quantization: 1 byte per dimension (4x smaller than float32)"""
+
+    kind = 'sq8'
+
+    def __init__(self, vmin, scale):
+        self.vmin = vmin
+        self.scale = scale
+
+    @classmethod
+    def train(cls, vectors):
+        vmin = vectors.min(axis=0)
+        scale = (vectors.max(axis=0) - vmin) / 255.0
+        scale[scale == 0] = 1.0
+        return cls(vmin.astype(np.float32), scale.astype(np.float32))
+
+    def encode(self, vectors):
+        codes = np.rint((vectors - self.vmin) / self.scale)
+        return np.clip(codes, 0, 255).astype(np.uint8)
+
+    def decode(self, codes):
+        return codes.astype(np.float32) * self.scale + self.vmin
+
+    def score(self, codes, query):
+        """Asymmetric dot products: float query against quantized codes"""
+        # q.x ~= q.vmin + sum_i (q_i * scale_i) * code_i
+        weighted_query = query * self.scale
+        offset = float(query @ self.vmin)
+        scores = np.empty(codes.shape[0], dtype=np.float32)
+        for start in range(0, codes.shape[0], SCORE_BLOCK):
+            block = codes[start:start + SCORE_BLOCK].astype(np.float32)
+            scores[start:start + SCORE_BLOCK] = block @ weighted_query + offset
+        return scores
+
+    def state(self):
+        return {'vmin': self.vmin, 'scale': self.scale}
+
+
+class ProductQuantizer:
+    """Split vectors into m sub-vectors, each encoded as one byte (256-centroid codebook)"""
+
+    kind = 'pq'
+
+    def __init__(self, codebooks):
+        # codebooks: (m, 256, dim // m)
+        self.codebooks = codebooks
+
+    @property
+    def m(self):
+        return self.codebooks.shape[0]
+
+    @classmethod
+    def train(cls, vectors, m=48, n_iter=10, sample_size=16384, seed=42):
+        dim = vectors.shape[1]
+        if dim % m != 0:
+            raise ValueError(f"Dimension {dim} is not divisible by m={m}")
+        sub_dim = dim // m
+        codebooks = np.zeros((m, 256, sub_dim), dtype=np.float32)
+        for j in range(m):
+            sub_vectors = vectors[:, j * sub_dim:(j + 1) * sub_dim]
+            centroids = kmeans(sub_vectors, 256, n_iter=n_iter,
+                               sample_size=sample_size, seed=seed + j)
+            codebooks[j, :len(centroids)] = centroids
+        return cls(codebooks)
+
+    def encode(self, vectors):
+        sub_dim = self.codebooks.shape[2]
+        codes = np.empty((vectors.shape[0], self.m), dtype=np.uint8)
+        for j in range(self.m):
+            sub_vectors = np.ascontiguousarray(vectors[:, j * sub_dim:(j + 1) * sub_dim])
+            codes[:, j] = assign_to_centroids(sub_vectors, self.codebooks[j])
+        return codes
+
+    def decode(self, codes):
+        parts = [self.codebooks[j][codes[:, j]] for j in range(self.m)]
+        return np.concatenate(parts, axis=1)
+
+    def score(self, codes, query):
+        """Asymmetric distance computation via per-subspace lookup tables"""
+        sub_dim = self.codebooks.shape[2]
+        # tables[j, c] = query sub-vector j . centroid c of subspace j
+        tables = np.einsum('jcd,jd->jc', self.codebooks, query.reshape(self.m, sub_dim))
+        flat_tables = tables.ravel()
+        offsets = (np.arange(self.m) * 256).astype(np.int64)
+
+        scores = np.empty(codes.shape[0], dtype=np.float32)
+        for start in range(0, codes.shape[0], SCORE_BLOCK):
+            block = codes[start:start + SCORE_BLOCK].astype(np.int64) + offsets
+            scores[start:start + SCORE_BLOCK] = flat_tables[block].sum(axis=1)
+        return scores
+
+    def state(self):
+        return {'codebooks': self.codebooks}
+
+
+QUANTIZERS = {
+    'sq8': ScalarQuantizer,
+    'pq': ProductQuantizer,
+}
+
+
+class QuantizedIndex:
+    """Search over compressed codes, optionally re-ranking candidates exactly
+
+    This trades recall and latency for memory: decoding codes costs more than
+    a float32 matrix product (on 20k chunks sq8 ran at 3.7 ms p50 and PQ48
+    at 5.8 ms vs. 1.6 ms exact), and PQ alone reached only 0.20 recall@5
+    (0.68 with re-ranking). Use it when the float32 matrix does not fit.
+
+    Re-ranking needs the full-precision vectors; pass `rerank_vectors`
+    (ideally memory-mapped) to rescore the top `k * rerank_factor` candidates.
+    """
+
+    def __init__(self, quantizer, codes, rerank_vectors=None, rerank_factor=10):
+        self.quantizer = quantizer
+        self.codes = codes
+        self.rerank_vectors = rerank_vectors
+        self.rerank_factor = rerank_factor
+
+    def __len__(self):
+        return self.codes.shape[0]
+
+    @property
+    def nbytes(self):
+        """Resident size of the compressed codes"""
+        return self.codes.nbytes
+
+    @classmethod
+    def build(cls, embeddings, quantizer='pq', rerank=None, rerank_factor=10, **params):
+        """Train the quantizer and encode all vectors
+
+        `rerank` defaults to True for PQ, whose raw scores are too coarse to
+        rank on their own, and False for sq8.
+        """
+        if rerank is None:
+            rerank = quantizer == 'pq'
+        if quantizer not in QUANTIZERS:
+            raise ValueError(f"Unknown quantizer: {quantizer}. Choose from {list(QUANTIZERS)}")
+        vectors = normalize_rows(embeddings)
+        trained = QUANTIZERS[quantizer].train(vectors, **params)
+        codes = trained.encode(vectors)
+        # Re-rank against the caller's vectors (e.g. a memmap), not a resident copy
+        return cls(trained, codes, rerank_vectors=embeddings if rerank else None,
+                   rerank_factor=rerank_factor)
+
+    def search(self, query_embedding, k=5):
+        """Return (indices, similarities) using approximate scores, then optional rerank"""
+        query = normalize_rows(query_embedding)[0]
+        scores = self.quantizer.score(self.codes, query)
+
+        if self.rerank_vectors is None:
+            top = top_k_indices(scores, k)
+            return top, scores[top]
+
+        candidates = top_k_indices(scores, k * self.rerank_factor)
+        exact_scores = normalize_rows(self.rerank_vectors[candidates]) @ query
+        top = top_k_indices(exact_scores, k)
+        return candidates[top], exact_scores[top]
+
+    def search_subset(self, query_embedding, k, rows):
+        """Approximate search over the codes of `rows` only"""
+        query = normalize_rows(query_embedding)[0]
+        scores = self.quantizer.score(self.codes[rows], query)
+        if self.rerank_vectors is None:
+            top = top_k_indices(scores, k)
+            return rows[top], scores[top]
+        candidates = rows[top_k_indices(scores, k * self.rerank_factor)]
+        exact_scores = normalize_rows(self.rerank_vectors[candidates]) @ query
+        top = top_k_indices(exact_scores, k)
+        return candidates[top], exact_scores[top]
+
+    def search_batch(self, query_embeddings, k=5):
+        """Per-query search (ADC lookup tables are query-specific)"""
+        return stack_results([self.search(query, k) for query in normalize_rows(query_embeddings)], k)
+
+    def save(self, path):
+        """Persist codes and codebooks (re-rank vectors are not stored)"""
+        np.savez(path, index_type=self.quantizer.kind, codes=self.codes,
+                 rerank_factor=self.rerank_factor, **self.quantizer.state())
+
+    @classmethod
+    def load(cls, path, rerank_vectors=None):
+        with np.load(path) as data:
+            kind = str(data['index_type'])
+            state = {name: data[name] for name in data.files
+                     if name not in ('index_type', 'codes', 'rerank_factor')}
+            return cls(QUANTIZERS[kind](**state), data['codes'],
+                       rerank_vectors=rerank_vectors,
+                       rerank_factor=int(data['rerank_factor']))
@@ -1,96 +1,561 @@
 # rag_pipeline.py - Task 3 functions
-import pandas as pd
+import re
 import numpy as np
-from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
+import threading
+import time
+from contextlib import contextmanager
+from vector_index import build_index, stack_results, normalize_rows
+from vector_store import load_vector_store, read_manifest
+from caching import QueryEmbeddingCache, ResultCache
+from results import ResultBatch
+from lexical_index import reciprocal_rank_fusion
+from issue_tagger import default_tagger, ISSUE_KEYWORDS
+from encoders import load_encoder, encoder_cache_key
+from metrics import RetrievalMetrics, SlowRequestProfiler
+from aggregates import open_aggregates
+
+# Count and trend questions get exact figures from the aggregate cube
+ANALYTICAL_PATTERN = re.compile(r"\b(how many|how often|number of|count|trend|over time|per month|by month|"
+                                r"increas\w*|decreas\w*|rising|growing)\b", re.IGNORECASE)
 
 class RAGSystem:
-    def __init__(self, embeddings_path):
-        """Initialize RAG system with pre-built embeddings"""
+    def __init__(self, embeddings_path, index=None, index_type='exact', index_params=None,
+                 refresh_interval=None, query_cache_size=1024, query_cache_path=None,
+                 result_cache_size=512, result_cache_ttl=3600, hybrid=False, hybrid_depth=50,
+                 load_model='lazy', encoder='torch', encoder_params=None, metrics=True,
+                 aggregates=None):
+        """Initialize RAG system with pre-built embeddings
+        
+        `index` can be any object with a `search(query_embedding, k)` method
+        returning (indices, similarities). Otherwise one is built from
+        `index_type` ('exact', 'ivf', 'sq8', 'pq') and `index_params`, which
+        picks the memory/recall tradeoff.
+        
+        With `refresh_interval` (seconds), queries check the store manifest at
+        most that often and pick up newly ingested segments without a restart.
+        
+        Query embeddings are kept in an LRU cache of `query_cache_size`
+        entries; `query_cache_path` adds a sqlite file shared across restarts
+        and worker processes. Full answers are cached by `answer()` for
+        `result_cache_ttl` seconds and dropped when the store version changes.
+        
+        With `hybrid=True`, the top `hybrid_depth` dense and BM25 (keyword)
+        results are fused with reciprocal rank fusion, so exact terms like
+        "overdraft" or fee names are not lost; similarities stay cosine.
+        
+        `load_model` controls when the embedding model (and torch) is loaded:
+        'lazy' on the first query that misses the query cache, 'background'
+        in a thread started now so the caller can come up meanwhile, or
+        'eager' before returning. `status()` reports readiness.
+        
+        `encoder` picks the query encoder backend: 'torch' (reference),
+        'onnx' or 'onnx-int8' (ONNX Runtime; pass
+        encoder_params={'model_dir': ..., 'threads': ...}, see encoders.py).
+        
+        Each stage of retrieval and answering is timed into `self.metrics`
+        (see metrics.py; `metrics=False` turns the timers off). Call
+        `enable_profiler()` to dump stacks of slow requests.
+        
+        Count and trend questions ("How many complaints mention late
+        payments?") are answered with exact figures from an aggregate cube
+        (see aggregates.py): `aggregates` is a cube directory, or None to use
+        the store directory's cube when one was built.
+        """
+        if load_model not in ('lazy', 'background', 'eager'):
+            raise ValueError(f"load_model must be 'lazy', 'background' or 'eager', got {load_model!r}")
         print("Loading RAG system...")
+        self.embeddings_path = embeddings_path
+        self.index_type = index_type
+        self.index_params = dict(index_params or {})
+        self.refresh_interval = refresh_interval
+        self.hybrid = hybrid
+        self.hybrid_depth = hybrid_depth
+        self._last_refresh_check = time.monotonic()
+        self._refresh_lock = threading.Lock()
+        self._model = None
+        self._model_lock = threading.Lock()
+        self._model_error = None
+        self.encoder = encoder
+        self.encoder_params = dict(encoder_params or {})
+        self.timings = {}
+        self.metrics = RetrievalMetrics(enabled=metrics)
+        self.profiler = None
         
-        # Load embeddings
-        self.chunks_df = pd.read_parquet(embeddings_path)
-        self.embeddings_array = np.stack(self.chunks_df['embedding'].values)
+        # Open the vector store: a memory-mapped store directory, or a legacy
+        # parquet read straight into Arrow (no per-row embedding objects)
+        start = time.perf_counter()
+        store = load_vector_store(embeddings_path)
+        if hybrid:
+            store.lexical_index  # load the keyword index now, not on the first query
+        self.timings['data_load_s'] = time.perf_counter() - start
         
-        # Load embedding model
-        self.model = SentenceTransformer('all-MiniLM-L6-v2')
+        # Build search index (normalized once, reused for every query)
+        start = time.perf_counter()
+        self._custom_index = index is not None
+        if index is None:
+            index = self._build_index(store)
+        self._active = (store, index)
+        self.timings['index_build_s'] = time.perf_counter() - start
         
-        print(f"✅ System loaded: {len(self.chunks_df)} chunks available")
+        self._aggregates_dir = aggregates or store.path
+        self.aggregates = open_aggregates(self._aggregates_dir) if self._aggregates_dir else None
+        if self.aggregates is None:
+            print(f"⚠️ No aggregate cube in {self._aggregates_dir or embeddings_path}: count and trend "
+                  f"questions are answered from retrieved excerpts only (build one with aggregates.py)")
+        
+        self.query_cache = QueryEmbeddingCache(max_size=query_cache_size, path=query_cache_path,
+                                               model_name=encoder_cache_key(encoder, **self.encoder_params))
+        self.result_cache = ResultCache(max_size=result_cache_size, ttl_seconds=result_cache_ttl)
+        
+        # The embedding model is the slow part of startup; defer it
+        if load_model == 'eager':
+            self._load_model()
+        elif load_model == 'background':
+            threading.Thread(target=self._load_model_quietly, name='model-loader', daemon=True).start()
+        
+        print(f"✅ System loaded: {len(self.store)} chunks available")
+    
+    # Store and index are swapped together as one tuple so a concurrent
+    # query never pairs a new index with old metadata
+    @property
+    def store(self):
+        return self._active[0]
+    
+    @property
+    def index(self):
+        return self._active[1]
+    
+    @property
+    def metadata(self):
+        return self._active[0].metadata
+    
+    @property
+    def chunks_df(self):
+        """Chunk metadata as a DataFrame (decodes every row; avoid on hot paths)"""
+        return self.metadata.to_pandas()
+    
+    @property
+    def model(self):
+        """Query encoder (see encoders.py), loaded on first use"""
+        if self._model is None:
+            # Loading (or waiting for the background loader) is its own
+            # stage, so it does not inflate the 'encode' histogram
+            with self.metrics.stage('model_load'):
+                self._load_model()
+        return self._model
     
-    def retrieve_chunks(self, query, k=5):
-        """Retrieve top-k most relevant chunks"""
-        # Embed the query
-        query_embedding = self.model.encode(query)
+    def _load_model(self):
+        # Concurrent first queries (or the background loader) wait on the
+        # lock instead of loading a second copy
+        with self._model_lock:
+            if self._model is not None:
+                return self._model
+            start = time.perf_counter()
+            try:
+                self._model = load_encoder(self.encoder, **self.encoder_params)
+            except Exception as e:
+                self._model_error = e
+                raise
+            self._model_error = None
+            self.timings['model_load_s'] = time.perf_counter() - start
+            print(f"✅ Embedding model ({self.encoder}) loaded in {self.timings['model_load_s']:.1f}s")
+            return self._model
+    
+    def _load_model_quietly(self):
+        try:
+            self._load_model()
+        except Exception as e:
+            print(f"❌ Background model load failed: {e}")  # retried on the first query
+    
+    def status(self):
+        """Readiness report: store is served as soon as it opens, queries need the model"""
+        if self._model is not None:
+            model_state = 'ready'
+        elif self._model_error is not None:
+            model_state = f"failed: {self._model_error}"
+        else:
+            model_state = 'loading' if self._model_lock.locked() else 'not loaded'
+        return {
+            'ready': self._model is not None,
+            'model': model_state,
+            'version': self.store.version,
+            'chunks': len(self.store),
+            'timings': dict(self.timings),
+        }
+    
+    def _build_index(self, store):
+        index_params = dict(self.index_params)
+        if self.index_type == 'exact':
+            # A normalized store is searched in place, straight from the mmap
+            index_params.setdefault('normalized', store.normalized)
+        return build_index(store.embeddings, self.index_type, **index_params)
+    
+    def refresh(self):
+        """Reload the store if a newer manifest version was published
         
-        # Calculate similarities
-        similarities = cosine_similarity([query_embedding], self.embeddings_array)[0]
+        Returns True if new data was picked up. Indexes passed in by the
+        caller cannot be rebuilt, so refresh is a no-op for them.
+        """
+        if self._custom_index or self.store.path is None:
+            return False
+        with self._refresh_lock:
+            if read_manifest(self.store.path)['version'] == self.store.version:
+                return False
+            store = load_vector_store(self.store.path)
+            if self.hybrid:
+                store.lexical_index
+            self._active = (store, self._build_index(store))
+            if self._aggregates_dir:
+                self.aggregates = open_aggregates(self._aggregates_dir)
+        print(f"🔄 Vector store refreshed to v{store.version}: {len(store)} chunks")
+        return True
+    
+    def _maybe_refresh(self):
+        if self.refresh_interval is None:
+            return
+        now = time.monotonic()
+        if now - self._last_refresh_check >= self.refresh_interval:
+            self._last_refresh_check = now
+            self.refresh()
+    
+    def embed_query(self, query):
+        """Query embedding, served from the cache when the question was seen before"""
+        return self.query_cache.get_or_compute(query, self._encode_query)
+    
+    def _encode_query(self, text):
+        model = self.model
+        with self.metrics.stage('encode'):
+            return model.encode(text)
+    
+    def _filter_rows(self, store, filters):
+        """Sorted rows matching `filters`, or None to search everything"""
+        if not filters:
+            return None
+        with self.metrics.stage('filter'):
+            return store.filter_index.lookup(filters)
+    
+    def _search(self, store, index, query, query_embedding, k, filters=None):
+        """Top-k search, scoring only rows that match `filters` when given"""
+        rows = self._filter_rows(store, filters)
+        if rows is not None and len(rows) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        if not self.hybrid:
+            # Scoring and top-k selection happen in one index call
+            with self.metrics.stage('search'):
+                return self._dense_search(store, index, query_embedding, k, rows)
         
-        # Get top-k indices
-        top_indices = similarities.argsort()[-k:][::-1]
+        with self.metrics.stage('search'):
+            dense_rows, _ = self._dense_search(store, index, query_embedding,
+                                               max(k, self.hybrid_depth), rows)
+        return self._fuse(store, query, query_embedding, dense_rows, k, rows)
+    
+    def _fuse(self, store, query, query_embedding, dense_rows, k, rows=None):
+        """Hybrid: fuse the dense and keyword rankings, then report cosine similarity"""
+        with self.metrics.stage('lexical'):
+            lexical_rows, _ = store.lexical_index.search(query, max(k, self.hybrid_depth), rows)
+        with self.metrics.stage('fuse'):
+            top_indices, _ = reciprocal_rank_fusion([dense_rows, lexical_rows], k)
+            vectors = np.asarray(store.embeddings[top_indices], dtype=np.float32)
+            if not store.normalized:
+                vectors = normalize_rows(vectors)
+            query_vector = normalize_rows(np.asarray(query_embedding, dtype=np.float32)[None, :])[0]
+            return top_indices, vectors @ query_vector
+    
+    def _dense_search(self, store, index, query_embedding, k, rows=None):
+        if rows is None:
+            return index.search(query_embedding, k)
+        if hasattr(index, 'search_subset'):
+            return index.search_subset(query_embedding, k, rows)
         
-        # Prepare results
-        results = []
-        for idx in top_indices:
-            results.append({
-                'text': self.chunks_df.iloc[idx]['text'],
-                'product': self.chunks_df.iloc[idx]['product'],
-                'similarity': float(similarities[idx]),
-                'chunk_index': int(self.chunks_df.iloc[idx]['chunk_index'])
-            })
+        # Custom index without subset search: rank everything, then post-filter
+        top_indices, similarities = index.search(query_embedding, len(store))
+        keep = np.isin(top_indices, rows)
+        return top_indices[keep][:k], similarities[keep][:k]
+    
+    def _dense_search_batch(self, store, index, query_embeddings, k, rows=None):
+        """Dense top-k for many queries, in one index call where the index allows it"""
+        if rows is None and hasattr(index, 'search_batch'):
+            return index.search_batch(query_embeddings, k)
+        if rows is not None and hasattr(index, 'search_subset_batch'):
+            return index.search_subset_batch(query_embeddings, k, rows)
+        return stack_results([self._dense_search(store, index, embedding, k, rows)
+                              for embedding in query_embeddings], k)
+    
+    def retrieve_chunks(self, query, k=5, filters=None):
+        """Retrieve top-k most relevant chunks
         
-        return results
+        `filters` restricts the search before scoring, e.g.
+        {'product': 'Credit card', 'state': 'CA', 'date_from': '2024-01-01'}
+        (see metadata_index.FILTER_KEYS).
+        """
+        with self._request('retrieve', query):
+            self._maybe_refresh()
+            store, index = self._active
+            metadata = store.metadata
+            
+            # Embed the query (cached; model time is the 'encode' stage)
+            query_embedding = self.embed_query(query)
+            
+            # Score and select top-k
+            top_indices, similarities = self._search(store, index, query, query_embedding, k, filters)
+            
+            with self.metrics.stage('materialize'):
+                return self._materialize(metadata, top_indices, similarities)
     
-    def generate_answer(self, question, chunks):
-        """Generate answer based on retrieved chunks"""
-        # Analyze chunks
-        products = {}
-        issues = []
+    def embed_queries(self, queries):
+        """Embed many queries; cache misses are encoded together in one model call"""
+        embeddings = [self.query_cache.get(query) for query in queries]
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if missing:
+            model = self.model
+            with self.metrics.stage('encode_batch'):
+                encoded = model.encode([queries[i] for i in missing], show_progress_bar=False)
+            for i, embedding in zip(missing, encoded):
+                self.query_cache.put(queries[i], embedding)
+                embeddings[i] = embedding
+        return np.vstack(embeddings) if embeddings else np.empty((0, 0), dtype=np.float32)
+    
+    def retrieve_batch(self, queries, k=5, filters=None):
+        """Retrieve top-k chunks for many queries at once
         
-        for chunk in chunks:
-            product = chunk['product']
-            products[product] = products.get(product, 0) + 1
+        Queries are encoded in one model call and scored with a single
+        matrix-matrix product (for the exact index, filtered or not; hybrid
+        mode fuses BM25 per query afterwards). Returns one result list per
+        query, in order.
+        """
+        with self._request('retrieve_batch', f"batch of {len(queries)}"):
+            self._maybe_refresh()
+            store, index = self._active
+            if not queries:
+                return []
+            self.metrics.increment('batched_queries', len(queries))
             
-            # Check for common issues
-            text_lower = chunk['text'].lower()
-            issue_keywords = [
-                ('billing', ['billing', 'charge', 'fee', 'overcharge']),
-                ('access', ['access', 'login', 'password', 'locked']),
-                ('service', ['service', 'customer', 'representative', 'support']),
-                ('fraud', ['fraud', 'unauthorized', 'theft', 'scam']),
-                ('payment', ['payment', 'transaction', 'transfer', 'withdrawal']),
-                ('credit', ['credit', 'score', 'report', 'rating']),
-                ('loan', ['loan', 'interest', 'repayment', 'debt'])
-            ]
+            query_embeddings = self.embed_queries(list(queries))
+            rows = self._filter_rows(store, filters)
+            if rows is not None and len(rows) == 0:
+                top_indices = np.empty((len(queries), 0), dtype=np.int64)
+                similarities = np.empty((len(queries), 0), dtype=np.float32)
+            else:
+                # Dense scoring is batched even in hybrid mode; only the BM25
+                # search and fusion run per query
+                depth = max(k, self.hybrid_depth) if self.hybrid else k
+                with self.metrics.stage('search_batch'):
+                    top_indices, similarities = self._dense_search_batch(
+                        store, index, query_embeddings, depth, rows)
+                if self.hybrid:
+                    top_indices, similarities = stack_results(
+                        [self._fuse(store, query, embedding, dense_rows[dense_rows >= 0], k, rows)
+                         for query, embedding, dense_rows in zip(queries, query_embeddings, top_indices)], k)
             
-            for issue_name, keywords in issue_keywords:
-                if any(keyword in text_lower for keyword in keywords):
-                    if issue_name not in issues:
-                        issues.append(issue_name)
+            with self.metrics.stage('materialize_batch'):
+                return [self._materialize(store.metadata, row_indices, row_similarities)
+                        for row_indices, row_similarities in zip(top_indices, similarities)]
+    
+    def retrieve_view(self, query, k=1000, filters=None):
+        """Columnar results for large-k analytics (no per-row objects until asked)"""
+        with self._request('retrieve_view', query):
+            self._maybe_refresh()
+            store, index = self._active
+            query_embedding = self.embed_query(query)
+            top_indices, similarities = self._search(store, index, query, query_embedding, k, filters)
+            return ResultBatch(store.metadata, top_indices, similarities)
+    
+    def _materialize(self, metadata, top_indices, similarities):
+        """Build result objects with one vectorized gather per metadata column"""
+        return ResultBatch(metadata, top_indices, similarities).chunks()
+    
+    def answer(self, question, k=5, filters=None):
+        """Retrieve and answer in one call, served from the result cache on repeats
         
-        # Build answer
-        answer_parts = [f"**Analysis of customer complaints for:** '{question}'"]
-        answer_parts.append("---")
+        Returns (answer, chunks) like generate_answer.
+        """
+        self._maybe_refresh()
+        key = ResultCache.make_key(question, k, filters)
+        version = self.store.version
+        cached = self.result_cache.get(key, version)
+        if cached is not None:
+            return cached
+        
+        chunks = self.retrieve_chunks(question, k=k, filters=filters)
+        result = self.generate_answer(question, chunks, filters)
+        self.result_cache.put(key, result, version)
+        return result
+    
+    def answer_stream(self, question, k=5, filters=None):
+        """Streaming counterpart of answer(): yields (answer so far, chunks)
         
+        The first yield comes as soon as retrieval finishes; its latency is
+        recorded as the 'first_section' stage, separately from the
+        'answer_stream' total. A cache hit yields the whole answer at once.
+        """
+        start = time.perf_counter()
+        self._maybe_refresh()
+        key = ResultCache.make_key(question, k, filters)
+        version = self.store.version
+        cached = self.result_cache.get(key, version)
+        if cached is not None:
+            yield cached
+            return
+        
+        chunks = self.retrieve_chunks(question, k=k, filters=filters)
+        yield from self.stream_sections(question, chunks, filters, start, key, version)
+    
+    def stream_sections(self, question, chunks, filters=None, start=None, cache_key=None, version=None):
+        """Yield (answer so far, chunks) per answer section, then cache the full answer
+        
+        Shared by answer_stream and MicroBatcher.answer_stream. `start` is
+        when the request arrived (for the 'first_section' and
+        'answer_stream' stages); the answer is cached under `cache_key` for
+        store `version` when given.
+        """
+        start = time.perf_counter() if start is None else start
+        sections = []
+        for section in self.answer_sections(question, chunks, filters):
+            sections.append(section)
+            if len(sections) == 1 and self.metrics.enabled:
+                self.metrics.observe('first_section', time.perf_counter() - start)
+            yield "\n".join(sections), chunks
+        if cache_key is not None:
+            self.result_cache.put(cache_key, ("\n".join(sections), chunks), version)
+        if self.metrics.enabled:
+            self.metrics.observe('answer_stream', time.perf_counter() - start)
+    
+    def analyze(self, question, filters=None):
+        """Exact counts for a count/trend question, or None for other questions
+        
+        Issues are detected in the question with the issue tagger and
+        products by whole-word product aliases (or `filters['product']`).
+        """
+        cube = self.aggregates
+        if cube is None or not ANALYTICAL_PATTERN.search(question):
+            return None
+        with self.metrics.stage('aggregate'):
+            tagger = default_tagger()
+            issues = tagger.names(tagger.tag(question))
+            products = (filters or {}).get('product')
+            if products is None:
+                products = cube.products_in(question) or None
+            selection = {'issue': issues or None, 'product': products}
+            return {
+                'issues': issues,
+                'products': [products] if isinstance(products, str) else products,
+                'total': cube.count(**selection),
+                'corpus': len(cube),
+                'by_product': cube.breakdown('product', **selection),
+                'trend': cube.trend(**selection),
+            }
+    
+    def cache_stats(self):
+        """Hit/miss metrics for the query-embedding and result caches"""
+        return {
+            'query_embeddings': self.query_cache.stats(),
+            'results': self.result_cache.stats(),
+        }
+    
+    def enable_profiler(self, output_path='slow_requests.folded', threshold_ms=200, interval_ms=5):
+        """Sample requests and dump collapsed stacks of those slower than `threshold_ms`"""
+        self.profiler = SlowRequestProfiler(output_path, threshold_ms, interval_ms)
+        return self.profiler
+    
+    @contextmanager
+    def _request(self, kind, label):
+        """Count and time one top-level call, under the profiler when enabled"""
+        self.metrics.increment(f"{kind}_requests")
+        if self.profiler is None:
+            with self.metrics.stage(kind):
+                yield
+            return
+        with self.profiler.request(label), self.metrics.stage(kind):
+            yield
+    
+    def _gauges(self):
+        gauges = {'corpus_chunks': len(self.store), 'store_version': self.store.version,
+                  'model_loaded': int(self._model is not None)}
+        for cache, stats in self.cache_stats().items():
+            for name in ('hits', 'disk_hits', 'misses', 'size'):
+                if name in stats:
+                    gauges[f"{cache}_cache_{name}"] = stats[name]
+        return gauges
+    
+    def stats(self):
+        """Stage timings, counters, cache and corpus stats as one dict"""
+        snapshot = self.metrics.snapshot()
+        snapshot['gauges'].update(self._gauges())
+        snapshot['caches'] = self.cache_stats()
+        if self.profiler is not None:
+            snapshot['slow_requests_dumped'] = self.profiler.dumped
+        return snapshot
+    
+    def prometheus_metrics(self):
+        """All metrics in Prometheus text format, for a /metrics endpoint"""
+        return self.metrics.to_prometheus(extra_gauges=self._gauges())
+    
+    def generate_answer(self, question, chunks, filters=None):
+        """Generate answer based on retrieved chunks"""
+        with self.metrics.stage('answer'):
+            return "\n".join(self.answer_sections(question, chunks, filters)), chunks
+    
+    def answer_sections(self, question, chunks, filters=None):
+        """Yield the answer one Markdown section at a time, cheapest first
+        
+        The top match and product distribution come straight from the
+        retrieved chunks; exact counts (aggregate cube), issue analysis and
+        excerpts follow. Joined with newlines, the sections are the
+        generate_answer text.
+        """
+        products = {}
+        for chunk in chunks:
+            product = chunk['product']
+            # A deduplicated chunk stands for `duplicate_count` complaints
+            products[product] = products.get(product, 0) + chunk.get('duplicate_count', 1)
+        
+        header = [f"**Analysis of customer complaints for:** '{question}'", "---"]
         if products:
-            answer_parts.append(f"**Found {len(chunks)} relevant complaint excerpts**")
-            answer_parts.append("**Product distribution:**")
+            top = chunks[0]
+            header.append(f"**Found {len(chunks)} relevant complaint excerpts** "
+                          f"(top match: {top['product']}, similarity {top['similarity']:.2f})")
+            header.append("**Product distribution:**")
             for product, count in products.items():
-                answer_parts.append(f"- {product}: {count} complaints")
+                header.append(f"- {product}: {count} complaints")
+        yield "\n".join(header)
+        
+        analysis = self.analyze(question, filters)
+        if analysis is not None:
+            # Counts are per issue category, not per phrase of the question
+            keywords = dict(ISSUE_KEYWORDS)
+            scope = ('issue categories ' + '; '.join(f"{issue} ({', '.join(keywords[issue][:4])}, ...)"
+                                                     for issue in analysis['issues'])
+                     if analysis['issues'] else 'all issues')
+            if analysis['products']:
+                scope += f" in {', '.join(analysis['products'])}"
+            counts = [f"\n**Complaints in {scope}:** {analysis['total']:,} of {analysis['corpus']:,} "
+                      f"(exact count over the whole database)"]
+            for product, count in list(analysis['by_product'].items())[:5]:
+                counts.append(f"- {product}: {count:,}")
+            if analysis['trend']:
+                recent = analysis['trend'][-6:]
+                counts.append("**Monthly trend (latest months):** "
+                              + ", ".join(f"{month}: {count:,}" for month, count in recent))
+            yield "\n".join(counts)
         
+        # Issue tags are precomputed bitmasks, so this is an OR
+        tagger = default_tagger()
+        issue_mask = 0
+        for chunk in chunks:
+            tags = chunk.get('issue_tags')
+            issue_mask |= int(tags) if tags is not None else tagger.tag(chunk['text'])
+        issues = tagger.names(issue_mask)
         if issues:
-            answer_parts.append(f"\n**Common issues:** {', '.join(issues)}")
+            yield f"\n**Common issues:** {', '.join(issues)}"
         
         # Add source examples
-        answer_parts.append("\n**Top complaint excerpts:**")
+        yield "\n**Top complaint excerpts:**"
         for i, chunk in enumerate(chunks[:3]):  # Show top 3
             excerpt = chunk['text']
             if len(excerpt) > 150:
                 excerpt = excerpt[:150] + "..."
-            answer_parts.append(f"{i+1}. ({chunk['product']}, similarity: {chunk['similarity']:.2f})")
-            answer_parts.append(f"   '{excerpt}'")
-        
-        return "\n".join(answer_parts), chunks
+            yield (f"{i+1}. ({chunk['product']}, similarity: {chunk['similarity']:.2f})\n"
+                   f"   '{excerpt}'")
 
 # Test function
 def test_rag_system():
@@ -110,13 +575,13 @@ def test_rag_system():
     print("\n🧪 Testing RAG System with 5 questions...")
     print("=" * 60)
     
+    # Retrieve chunks for all questions in one batch
+    all_chunks = rag.retrieve_batch(test_questions, k=4)
+    
     results = []
-    for question in test_questions:
+    for question, chunks in zip(test_questions, all_chunks):
         print(f"\nQuestion: {question}")
         
-        # Retrieve chunks
-        chunks = rag.retrieve_chunks(question, k=4)
-        
         # Generate answer
         answer, _ = rag.generate_answer(question, chunks)
         
@@ -139,6 +604,7 @@ if __name__ == "__main__":
     test_results = test_rag_system()
     
     # Save results to CSV for evaluation table
+    import pandas as pd
     results_df = pd.DataFrame(test_results)
     results_df.to_csv('../data/processed/test_results.csv', index=False)
     print(f"\n✅ Saved test results to: ../data/processed/test_results.csv")
\ No newline at end of file
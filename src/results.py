@@ -0,0 +1,116 @@
+# results.py - Lightweight retrieval result types
+import numpy as np
+from issue_tagger import default_tagger
+
+RESULT_FIELDS = ('text', 'product', 'similarity', 'chunk_index', 'complaint_id', 'issue_tags',
+                 'duplicate_count')
+
+
+class RetrievedChunk:
+    """One retrieved chunk; supports dict-style access (chunk['text'])"""
+
+    __slots__ = ('text', 'product', 'similarity', 'chunk_index', 'complaint_id', 'issue_tags',
+                 'duplicate_count', 'row')
+
+    def __init__(self, text, product, similarity, chunk_index, complaint_id, issue_tags, row,
+                 duplicate_count=1):
+        self.text = text
+        self.product = product
+        self.similarity = similarity
+        self.chunk_index = chunk_index
+        self.complaint_id = complaint_id
+        self.issue_tags = issue_tags  # bitmask, see issue_tagger.py
+        self.duplicate_count = duplicate_count  # chunks collapsed into this one, see dedup.py
+        self.row = row
+
+    def __getitem__(self, key):
+        if key not in RESULT_FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key, default=None):
+        return getattr(self, key) if key in RESULT_FIELDS else default
+
+    def keys(self):
+        return RESULT_FIELDS
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in RESULT_FIELDS}
+
+    def __repr__(self):
+        return (f"RetrievedChunk(product={self.product!r}, similarity={self.similarity:.3f}, "
+                f"complaint_id={self.complaint_id!r}, chunk_index={self.chunk_index})")
+
+
+class ResultBatch:
+    """Columnar view of one query's results; metadata is gathered per column on demand
+
+    Cheap even for k in the thousands: only the requested columns are
+    gathered, each with a single vectorized take.
+    """
+
+    def __init__(self, metadata, rows, similarities):
+        valid = np.asarray(rows) >= 0  # drop padding from batched search
+        self.metadata = metadata
+        self.rows = np.asarray(rows, dtype=np.int64)[valid]
+        self.similarities = np.asarray(similarities, dtype=np.float32)[valid]
+        self._columns = {}
+
+    def __len__(self):
+        return len(self.rows)
+
+    def column(self, name):
+        """One field for every result, as a NumPy array"""
+        if name == 'similarity':
+            return self.similarities
+        if name not in self._columns:
+            if name == 'issue_tags' and name not in self.metadata.columns:
+                # Store built before tags were precomputed: tag just these rows
+                self._columns[name] = default_tagger().tag_many(self.column('text'))
+            elif name == 'duplicate_count':
+                # Stores (or segments) written without dedup count every chunk once
+                if name in self.metadata.columns:
+                    counts = np.asarray(self.metadata.take(name, self.rows), dtype=np.float64)
+                    self._columns[name] = np.nan_to_num(counts, nan=1).astype(np.int64)
+                else:
+                    self._columns[name] = np.ones(len(self.rows), dtype=np.int64)
+            else:
+                self._columns[name] = self.metadata.take(name, self.rows)
+        return self._columns[name]
+
+    def chunks(self):
+        """Materialize RetrievedChunk objects (one column gather per field)"""
+        texts = self.column('text')
+        products = self.column('product')
+        chunk_indices = self.column('chunk_index').tolist()
+        complaint_ids = self.column('complaint_id').tolist()
+        issue_tags = self.column('issue_tags').tolist()
+        duplicate_counts = self.column('duplicate_count').tolist()
+        similarities = self.similarities.tolist()
+        rows = self.rows.tolist()
+        return [RetrievedChunk(*fields) for fields in
+                zip(texts, products, similarities, chunk_indices, complaint_ids, issue_tags, rows,
+                    duplicate_counts)]
+
+    def __iter__(self):
+        return iter(self.chunks())
+
+    def _chunk(self, i):
+        """RetrievedChunk for result i alone (columns are still gathered once)"""
+        def scalar(value):
+            return value.item() if isinstance(value, np.generic) else value
+        return RetrievedChunk(scalar(self.column('text')[i]), scalar(self.column('product')[i]),
+                              float(self.similarities[i]), scalar(self.column('chunk_index')[i]),
+                              scalar(self.column('complaint_id')[i]), scalar(self.column('issue_tags')[i]),
+                              int(self.rows[i]), scalar(self.column('duplicate_count')[i]))
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self._chunk(j) for j in range(*i.indices(len(self)))]
+        if not -len(self) <= i < len(self):
+            raise IndexError(f"result index {i} out of range")
+        return self._chunk(i % len(self))
+
+    def to_pandas(self, columns=RESULT_FIELDS):
+        import pandas as pd
+        return pd.DataFrame({name: self.column(name) for name in columns})
@@ -0,0 +1,258 @@
+# retrieval_service.py - Headless JSON retrieval API served by pre-forked workers
+#
+# The parent process binds the listening socket and forks N workers. Each
+# worker opens the vector store directory itself: embeddings and metadata are
+# memory-mapped read-only, so all workers share one copy in the page cache
+# instead of each holding a private matrix. Connections are HTTP/1.1
+# keep-alive.
+#
+# Sharing only holds for a single segment without tombstones: dropping
+# deleted rows or stitching several segments together gives every worker
+# its own float32 copy (VectorStore.open warns when it does). serve()
+# therefore compacts a fragmented store before forking; segments ingested
+# while running are copied per worker until the next compaction. Non-exact
+# indexes (ivf/sq8/pq) are also built separately in each worker.
+#
+# Endpoints:
+#   GET  /health        readiness (503 while the model loads), store version, chunks
+#   GET  /stats         request counts, stage timings and cache hit rates (this worker)
+#   GET  /metrics       the same in Prometheus text format
+#   POST /search        {"query": ..., "k": 5, "filters": {...}}
+#   POST /search/batch  {"queries": [...], "k": 5, "filters": {...}}
+#
+# Reload: workers pick up new manifest versions every `refresh_interval`
+# seconds; `kill -HUP <parent pid>` makes every worker check immediately.
+# SIGTERM/SIGINT drain in-flight requests and stop the workers.
+import argparse
+import json
+import os
+import signal
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+
+MAX_BATCH_QUERIES = 256
+MAX_K = 1000
+
+
+def to_json(value):
+    """json.dumps that understands NumPy scalars"""
+    return json.dumps(value, default=lambda o: o.item() if isinstance(o, np.generic) else str(o))
+
+
+class RetrievalHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive
+    server_version = 'CrediTrustRetrieval/1.0'
+
+    def log_message(self, format, *args):
+        pass  # access logs would dominate the cost of small requests
+
+    def _send(self, status, payload):
+        self._send_text(status, to_json(payload), 'application/json')
+
+    def _send_text(self, status, text, content_type):
+        body = text.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(length) or b'{}')
+
+    def do_GET(self):
+        rag = self.server.rag
+        if self.path == '/health':
+            status = rag.status()
+            # 503 until the model is loaded so load balancers hold traffic back
+            self._send(200 if status['ready'] else 503,
+                       {'status': 'ok' if status['ready'] else 'loading', 'pid': os.getpid(), **status})
+        elif self.path == '/stats':
+            self._send(200, {'pid': os.getpid(), 'version': rag.store.version,
+                             'requests': dict(self.server.request_counts), **rag.stats()})
+        elif self.path == '/metrics':
+            self._send_text(200, rag.prometheus_metrics(), 'text/plain; version=0.0.4')
+        else:
+            self._send(404, {'error': f"Unknown path: {self.path}"})
+
+    def do_POST(self):
+        rag = self.server.rag
+        try:
+            request = self._read_json()
+            k = int(request.get('k', 5))
+            if not 1 <= k <= MAX_K:
+                raise ValueError(f"k must be between 1 and {MAX_K}")
+            filters = request.get('filters')
+            if filters is not None and not isinstance(filters, dict):
+                raise ValueError("'filters' must be an object, e.g. {\"product\": \"Credit card\"}")
+
+            if self.path == '/search':
+                query = request.get('query')
+                if not isinstance(query, str) or not query.strip():
+                    raise ValueError("'query' must be a non-empty string")
+                chunks = rag.retrieve_chunks(query, k=k, filters=filters)
+                payload = {'version': rag.store.version, 'results': [c.to_dict() for c in chunks]}
+            elif self.path == '/search/batch':
+                queries = request.get('queries')
+                if not isinstance(queries, list) or not all(isinstance(q, str) for q in queries):
+                    raise ValueError("'queries' must be a list of strings")
+                if len(queries) > MAX_BATCH_QUERIES:
+                    raise ValueError(f"At most {MAX_BATCH_QUERIES} queries per batch")
+                results = rag.retrieve_batch(queries, k=k, filters=filters)
+                payload = {'version': rag.store.version,
+                           'results': [[c.to_dict() for c in chunks] for chunks in results]}
+            else:
+                self._send(404, {'error': f"Unknown path: {self.path}"})
+                return
+        except (ValueError, TypeError) as e:  # includes bad JSON and unknown filters
+            self._send(400, {'error': str(e)})
+            return
+        except Exception as e:
+            print(f"❌ [{os.getpid()}] {self.path} failed: {e}")
+            self._send(500, {'error': 'Internal error'})
+            return
+
+        with self.server.counts_lock:
+            self.server.request_counts[self.path] = self.server.request_counts.get(self.path, 0) + 1
+        self._send(200, payload)
+
+
+class RetrievalServer(ThreadingHTTPServer):
+    """HTTP server for one worker, on a listening socket inherited from the parent"""
+
+    daemon_threads = True
+
+    def __init__(self, listen_socket, rag):
+        super().__init__(listen_socket.getsockname()[:2], RetrievalHandler, bind_and_activate=False)
+        self.socket.close()
+        self.socket = listen_socket
+        self.rag = rag
+        self.request_counts = {}
+        self.counts_lock = threading.Lock()
+
+
+def run_worker(listen_socket, store_dir, threads_per_worker, rag_options, profile_slow_ms=None):
+    """Worker process body: open the store, serve until SIGTERM"""
+    try:
+        import torch
+        torch.set_num_threads(threads_per_worker)
+    except ImportError:
+        pass
+    from rag_pipeline import RAGSystem
+
+    rag = RAGSystem(store_dir, **rag_options)
+    if profile_slow_ms is not None:
+        rag.enable_profiler(f"slow_requests.{os.getpid()}.folded", threshold_ms=profile_slow_ms)
+    server = RetrievalServer(listen_socket, rag)
+
+    # Handlers only start threads: shutdown() and refresh() must not run on
+    # the thread that is inside serve_forever()
+    signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=server.shutdown).start())
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # the parent decides when to stop
+    signal.signal(signal.SIGHUP, lambda *_: threading.Thread(target=rag.refresh).start())
+
+    print(f"✅ Worker {os.getpid()} serving store v{rag.store.version} ({len(rag.store)} chunks)")
+    server.serve_forever()
+    server.server_close()
+
+
+def serve(store_dir, host='0.0.0.0', port=8000, workers=None, threads_per_worker=1,
+          refresh_interval=5.0, index_type='exact', query_cache_path=None, profile_slow_ms=None,
+          compact=True):
+    """Bind once, fork `workers` processes and supervise them (restarting crashes)"""
+    if not os.path.isdir(store_dir):
+        raise FileNotFoundError(f"Vector store directory not found: {store_dir} "
+                                f"(convert a parquet with vector_store.convert_parquet_to_store)")
+    workers = workers or os.cpu_count() or 1
+
+    # Workers share the mmap only for one tombstone-free segment
+    from vector_store import read_manifest
+    segments = read_manifest(store_dir)['segments']
+    if len(segments) > 1 or any(segment.get('deleted') for segment in segments):
+        if compact:
+            from ingestion import compact_segments
+            print(f"Compacting {len(segments)} segments so workers share one memory map...")
+            compact_segments(store_dir)
+        else:
+            print(f"⚠️ Store has {len(segments)} segments/tombstones: each worker holds its own copy "
+                  f"of the embeddings (run ingestion.compact_segments to share one)")
+    if index_type != 'exact':
+        print(f"⚠️ Each worker builds its own '{index_type}' index in private memory")
+    rag_options = {'index_type': index_type, 'refresh_interval': refresh_interval,
+                   'query_cache_path': query_cache_path, 'load_model': 'background'}
+
+    listen_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listen_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listen_socket.bind((host, port))
+    listen_socket.listen(1024)
+    print(f"🚀 Retrieval service on http://{host}:{port} with {workers} workers")
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                run_worker(listen_socket, store_dir, threads_per_worker, rag_options, profile_slow_ms)
+            except BaseException as e:
+                print(f"❌ Worker {os.getpid()} failed: {e}")
+                code = 1
+            finally:
+                os._exit(code)
+        return pid
+
+    children = {spawn() for _ in range(workers)}
+    stopping = False
+
+    def forward(signum, _frame):
+        nonlocal stopping
+        if signum in (signal.SIGTERM, signal.SIGINT):
+            stopping = True
+            signum = signal.SIGTERM
+        for pid in children:
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
+
+    for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+        signal.signal(signum, forward)
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        children.discard(pid)
+        if not stopping:
+            print(f"⚠️ Worker {pid} exited (status {status}); restarting")
+            time.sleep(1)  # avoid a tight crash loop
+            children.add(spawn())
+    listen_socket.close()
+    print("👋 Retrieval service stopped")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Headless retrieval API over a vector store")
+    parser.add_argument('--store', default='../vector_store/complaints_store')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--workers', type=int, default=None, help="Default: one per CPU")
+    parser.add_argument('--threads-per-worker', type=int, default=1)
+    parser.add_argument('--refresh-interval', type=float, default=5.0)
+    parser.add_argument('--index-type', default='exact', choices=['exact', 'ivf', 'sq8', 'pq'])
+    parser.add_argument('--query-cache', default=None, help="Shared sqlite query-embedding cache")
+    parser.add_argument('--profile-slow-ms', type=float, default=None,
+                        help="Dump sampled stacks of requests slower than this (per-worker .folded files)")
+    parser.add_argument('--no-compact', action='store_true',
+                        help="Do not compact a fragmented store before forking")
+    args = parser.parse_args()
+
+    serve(args.store, args.host, args.port, args.workers, args.threads_per_worker,
+          args.refresh_interval, args.index_type, args.query_cache, args.profile_slow_ms,
+          compact=not args.no_compact)
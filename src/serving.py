@@ -0,0 +1,186 @@
+# serving.py - Async serving layer with request micro-batching
+#
+# Concurrent requests are queued and collected while the previous batch runs
+# (for at most a few milliseconds, or until a batch is full), then encoded
+# and scored together with RAGSystem.retrieve_batch in a worker thread.
+# Each caller awaits its own future; the bounded queue pushes back on
+# callers when the system is saturated instead of letting latency grow
+# without limit.
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from caching import ResultCache
+
+
+class ServiceOverloaded(Exception):
+    """Raised when a request cannot be queued within `queue_timeout`"""
+
+
+class MicroBatcher:
+    """Collects concurrent retrieval requests into batches for a RAGSystem"""
+
+    def __init__(self, rag, max_batch_size=32, max_wait_ms=5, max_queue=256, queue_timeout=1.0):
+        self.rag = rag
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._queue = None
+        self._worker = None
+        self._running = None  # task of the batch currently being scored
+        # One thread: batches run back to back while the next one is collected
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='rag-batch')
+        self.batches = 0
+        self.requests = 0
+        self.rejected = 0
+
+    async def start(self):
+        """Start the batching loop on the running event loop"""
+        if self._worker is None:
+            self._queue = asyncio.Queue(maxsize=self.max_queue)
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        self._executor.shutdown(wait=False)
+
+    async def retrieve(self, query, k=5, filters=None):
+        """Top-k chunks for one query, batched with concurrent callers"""
+        await self.start()
+        future = asyncio.get_running_loop().create_future()
+        try:
+            await asyncio.wait_for(self._queue.put((query, k, filters, future)), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise ServiceOverloaded(f"Request queue full ({self.max_queue} waiting)") from None
+        return await future
+
+    async def answer(self, question, k=5, filters=None):
+        """Async counterpart of RAGSystem.answer (same result cache)"""
+        key = ResultCache.make_key(question, k, filters)
+        version = self.rag.store.version
+        cached = self.rag.result_cache.get(key, version)
+        if cached is not None:
+            return cached
+        chunks = await self.retrieve(question, k, filters)
+        result = self.rag.generate_answer(question, chunks, filters)
+        self.rag.result_cache.put(key, result, version)
+        return result
+
+    async def answer_stream(self, question, k=5, filters=None):
+        """Async counterpart of RAGSystem.answer_stream: yields (answer so far, chunks)
+
+        Retrieval is batched as usual; the answer sections are yielded one by
+        one so the caller can show the top hit while the rest is assembled.
+        """
+        start = time.perf_counter()
+        key = ResultCache.make_key(question, k, filters)
+        version = self.rag.store.version
+        cached = self.rag.result_cache.get(key, version)
+        if cached is not None:
+            yield cached
+            return
+        chunks = await self.retrieve(question, k, filters)
+        for update in self.rag.stream_sections(question, chunks, filters, start, key, version):
+            yield update
+            await asyncio.sleep(0)  # let the event loop flush this section first
+
+    async def _collect(self):
+        """Wait for one request, then take whatever else is queued
+
+        While a previous batch is still running, keep collecting for up to
+        `max_wait` (it could not start sooner anyway); an idle system
+        dispatches at once, so a lone request pays no batching delay.
+        """
+        batch = [await self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            timeout = deadline - time.monotonic()
+            if self._running is None or self._running.done() or timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            batch = [request for request in batch if not request[3].cancelled()]
+            if not batch:
+                continue
+            # At most one batch runs; the next one is collected meanwhile and
+            # everything else waits in the bounded queue
+            if self._running is not None:
+                await self._running
+            self._running = asyncio.get_running_loop().create_task(self._process(batch))
+
+    async def _process(self, batch):
+        loop = asyncio.get_running_loop()
+        try:
+            # Requests with the same filters share one retrieve_batch call
+            groups = {}
+            for request in batch:
+                groups.setdefault(ResultCache.make_key('', 0, request[2]), []).append(request)
+            for requests in groups.values():
+                queries = [request[0] for request in requests]
+                max_k = max(request[1] for request in requests)
+                try:
+                    results = await loop.run_in_executor(
+                        self._executor, self.rag.retrieve_batch, queries, max_k, requests[0][2])
+                except Exception as e:
+                    for request in requests:
+                        if not request[3].done():
+                            request[3].set_exception(e)
+                    continue
+                for (_, k, _, future), chunks in zip(requests, results):
+                    if not future.done():
+                        future.set_result(chunks[:k])
+        finally:
+            self.batches += 1
+            self.requests += len(batch)
+
+    def stats(self):
+        return {
+            'batches': self.batches,
+            'requests': self.requests,
+            'mean_batch_size': self.requests / self.batches if self.batches else 0.0,
+            'queued': self._queue.qsize() if self._queue is not None else 0,
+            'rejected': self.rejected,
+        }
+
+
+async def run_load_test(request_fn, queries, concurrency, n_requests):
+    """Drive `request_fn(query)` (async) from `concurrency` clients
+
+    Returns per-request latencies (ms), wall time and error count.
+    """
+    latencies = []
+    errors = 0
+    next_request = 0
+
+    async def client():
+        nonlocal next_request, errors
+        while next_request < n_requests:
+            query = queries[next_request % len(queries)]
+            next_request += 1
+            start = time.perf_counter()
+            try:
+                await request_fn(query)
+                latencies.append((time.perf_counter() - start) * 1000)
+            except ServiceOverloaded:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return latencies, time.perf_counter() - start, errors
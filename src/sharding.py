@@ -0,0 +1,270 @@
+# sharding.py - Sharded vector store with scatter-gather search
+#
+# build_shards_from_parquet() splits the parquet written by
+# create_embeddings into N ordinary store directories (see vector_store.py),
+# by hash of complaint_id (even sizes) or by product (a product filter then
+# only touches its own shard):
+#
+#   <shard_dir>/shards.json       strategy, shard names and products
+#   <shard_dir>/shard-000/ ...    one memory-mapped vector store per shard
+#
+# ShardedSearcher starts one worker process per shard (a local stand-in for
+# a remote node). A query is sent to every relevant shard, each returns its
+# own top-k, and the coordinator merges the sorted lists with a heap. Shards
+# that miss the deadline are skipped and the result is marked partial;
+# their late replies are recognized by query id and dropped.
+import heapq
+import itertools
+import json
+import os
+import threading
+import time
+import zlib
+import multiprocessing as mp
+from multiprocessing.connection import wait
+import numpy as np
+import pyarrow.parquet as pq
+from vector_store import load_vector_store, write_segment, write_manifest, segment_name
+from results import ResultBatch
+
+SHARDS_MANIFEST = 'shards.json'
+
+
+def shard_assignments(table, n_shards, by='hash'):
+    """Shard number for every row of a chunks table, plus shard -> products for 'product'"""
+    if by == 'hash':
+        ids = table.column('complaint_id').to_pylist()
+        # crc32 of the string form: stable across processes (unlike hash())
+        shards = np.fromiter((zlib.crc32(str(i).encode('utf-8')) % n_shards for i in ids),
+                             dtype=np.int64, count=len(ids))
+        return shards, None
+    if by == 'product':
+        products = table.column('product').to_pylist()
+        counts = {}
+        for product in products:
+            counts[product] = counts.get(product, 0) + 1
+        # Largest products first, each onto the currently smallest shard
+        sizes, owner = [0] * n_shards, {}
+        for product in sorted(counts, key=counts.get, reverse=True):
+            shard = sizes.index(min(sizes))
+            owner[product] = shard
+            sizes[shard] += counts[product]
+        shards = np.fromiter((owner[p] for p in products), dtype=np.int64, count=len(products))
+        shard_products = [sorted((p for p, s in owner.items() if s == shard), key=str)
+                          for shard in range(n_shards)]
+        return shards, shard_products
+    raise ValueError(f"Unknown sharding strategy: {by!r} (use 'hash' or 'product')")
+
+
+def build_shards_from_parquet(parquet_path, shard_dir, n_shards=4, by='hash'):
+    """Split a create_embeddings parquet into `n_shards` store directories"""
+    table = pq.read_table(parquet_path)
+    vectors = table.column('embedding').combine_chunks()
+    dim = len(vectors[0]) if len(vectors) else 0
+    embeddings = vectors.flatten().to_numpy().reshape(-1, dim).astype(np.float32, copy=False)
+    metadata = table.drop_columns(['embedding'])
+    shards, shard_products = shard_assignments(metadata, n_shards, by)
+
+    names = []
+    for shard in range(n_shards):
+        name = f"shard-{shard:03d}"
+        rows = np.flatnonzero(shards == shard)
+        store_dir = os.path.join(shard_dir, name)
+        segment = write_segment(store_dir, segment_name(1), embeddings[rows], metadata.take(rows))
+        write_manifest(store_dir, {'format': 1, 'version': 1, 'dim': dim, 'normalized': True,
+                                   'segments': [segment]})
+        names.append(name)
+        print(f"   {name}: {len(rows)} chunks")
+
+    manifest = {'by': by, 'shards': names, 'products': shard_products, 'dim': dim}
+    with open(os.path.join(shard_dir, SHARDS_MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    print(f"Saved {n_shards} shards ({len(metadata)} chunks, by {by}) to: {shard_dir}")
+    return manifest
+
+
+def _shard_worker(store_dir, conn, threads):
+    """Shard process: answer (query id, embeddings, k, filters) requests until None"""
+    try:
+        from threadpoolctl import threadpool_limits
+        threadpool_limits(threads)
+    except ImportError:
+        pass  # BLAS keeps its default thread count
+    from vector_index import ExactIndex
+
+    try:
+        store = load_vector_store(store_dir)
+        index = ExactIndex(store.embeddings, normalized=store.normalized)
+    except Exception as e:
+        conn.send(('failed', f"{type(e).__name__}: {e}"))
+        conn.close()
+        return
+    conn.send(('ready', len(store)))
+    while True:
+        request = conn.recv()
+        if request is None:
+            break
+        query_id, queries, k, filters = request
+        try:
+            rows = store.filter_index.lookup(filters) if filters else None
+            if rows is None:
+                indices, similarities = index.search_batch(queries, k)
+            elif len(rows) == 0:
+                indices = np.empty((len(queries), 0), dtype=np.int64)
+                similarities = np.empty((len(queries), 0), dtype=np.float32)
+            else:
+                pairs = [index.search_subset(query, k, rows) for query in queries]
+                indices = [p[0] for p in pairs]
+                similarities = [p[1] for p in pairs]
+            conn.send((query_id, indices, similarities, None))
+        except Exception as e:
+            conn.send((query_id, None, None, f"{type(e).__name__}: {e}"))
+    conn.close()
+
+
+class ShardedSearcher:
+    """Coordinator fanning queries out to one worker process per shard"""
+
+    def __init__(self, shard_dir, threads_per_shard=1, start_timeout=120):
+        with open(os.path.join(shard_dir, SHARDS_MANIFEST)) as f:
+            self.manifest = json.load(f)
+        self.shard_dir = shard_dir
+        # Metadata is memory-mapped here too, to materialize merged results
+        self.stores = [load_vector_store(os.path.join(shard_dir, name)) for name in self.manifest['shards']]
+        self._query_ids = itertools.count()
+        self._lock = threading.Lock()  # one scatter-gather in flight per coordinator
+        self.partial_results = 0
+        self.dead_shards = set()  # shards whose worker process has gone away
+
+        context = mp.get_context('spawn')  # no inherited threads or BLAS state
+        self._conns, self._processes = [], []
+        for name in self.manifest['shards']:
+            parent_conn, child_conn = context.Pipe()
+            process = context.Process(target=_shard_worker, daemon=True,
+                                      args=(os.path.join(shard_dir, name), child_conn, threads_per_shard))
+            process.start()
+            child_conn.close()
+            self._conns.append(parent_conn)
+            self._processes.append(process)
+        for name, conn in zip(self.manifest['shards'], self._conns):
+            if not conn.poll(start_timeout):
+                self.close()
+                raise TimeoutError(f"Shard {name} did not start within {start_timeout}s")
+            try:
+                state, detail = conn.recv()
+            except EOFError:
+                state, detail = 'failed', "worker exited during startup"
+            if state != 'ready':
+                self.close()
+                raise RuntimeError(f"Shard {name} failed to start: {detail}")
+
+    def __len__(self):
+        return sum(len(store) for store in self.stores)
+
+    def _target_shards(self, filters):
+        """All shards, or only those owning the requested products (product sharding)"""
+        if self.manifest['by'] != 'product' or not filters or filters.get('product') is None:
+            return list(range(len(self.stores)))
+        wanted = filters['product']
+        wanted = wanted if isinstance(wanted, (list, tuple, set)) else [wanted]
+        # Case-insensitive, like MetadataIndex filtering
+        wanted = {str(product).lower() for product in wanted}
+        return [shard for shard, products in enumerate(self.manifest['products'])
+                if wanted & {str(product).lower() for product in products}]
+
+    def search_batch(self, query_embeddings, k=5, filters=None, deadline_ms=None):
+        """Top-k (similarity, shard, row) lists per query, plus the shards that answered"""
+        queries = np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32))
+        targets = self._target_shards(filters)
+        with self._lock:
+            query_id = next(self._query_ids)
+            pending = {}
+            for shard in targets:
+                if shard in self.dead_shards:
+                    continue
+                try:
+                    self._conns[shard].send((query_id, queries, k, filters))
+                except (BrokenPipeError, OSError) as e:
+                    self._mark_dead(shard, e)
+                else:
+                    pending[self._conns[shard]] = shard
+
+            deadline = None if deadline_ms is None else time.monotonic() + deadline_ms / 1000
+            replies = {}
+            while pending:
+                timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+                ready = wait(list(pending), timeout)
+                if not ready:
+                    break  # deadline passed: go with the shards we have
+                for conn in ready:
+                    try:
+                        reply_id, indices, similarities, error = conn.recv()
+                    except (EOFError, OSError) as e:
+                        # The worker died: merge the shards that are still alive
+                        self._mark_dead(pending.pop(conn), e)
+                        continue
+                    if reply_id != query_id:
+                        continue  # late reply to an earlier, timed-out query
+                    shard = pending.pop(conn)
+                    if error:
+                        print(f"⚠️ Shard {self.manifest['shards'][shard]} failed: {error}")
+                    else:
+                        replies[shard] = (indices, similarities)
+            if len(replies) < len(targets):
+                self.partial_results += 1
+
+        # Each shard's list is sorted best-first: a k-way heap merge is enough
+        results = []
+        for q in range(len(queries)):
+            streams = [[(-float(sim), shard, int(row)) for row, sim in zip(indices[q], similarities[q])]
+                       for shard, (indices, similarities) in replies.items()]
+            results.append([(-negated, shard, row)
+                            for negated, shard, row in itertools.islice(heapq.merge(*streams), k)])
+        return results, sorted(replies)
+
+    def _mark_dead(self, shard, error):
+        if shard not in self.dead_shards:
+            self.dead_shards.add(shard)
+            print(f"⚠️ Shard {self.manifest['shards'][shard]} is down ({type(error).__name__}); "
+                  f"results no longer include it")
+
+    def search(self, query_embedding, k=5, filters=None, deadline_ms=None):
+        results, answered = self.search_batch(query_embedding, k, filters, deadline_ms)
+        return results[0], answered
+
+    def materialize(self, hits):
+        """RetrievedChunk objects for merged (similarity, shard, row) hits, best first"""
+        chunks = [None] * len(hits)
+        by_shard = {}
+        for position, (similarity, shard, row) in enumerate(hits):
+            by_shard.setdefault(shard, []).append((position, row, similarity))
+        for shard, entries in by_shard.items():
+            positions, rows, similarities = zip(*entries)
+            for position, chunk in zip(positions, ResultBatch(self.stores[shard].metadata, rows,
+                                                              similarities).chunks()):
+                chunks[position] = chunk
+        return chunks
+
+    def close(self):
+        for conn in self._conns:
+            try:
+                conn.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+        for process in self._processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        self._conns, self._processes = [], []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+if __name__ == "__main__":
+    # Example usage
+    build_shards_from_parquet('../vector_store/sample_embeddings.parquet',
+                              '../vector_store/complaints_shards', n_shards=4)
@@ -0,0 +1,296 @@
+# vector_index.py - Vector search indexes for the RAG system
+import os
+import numpy as np
+
+
+def normalize_rows(vectors):
+    """L2-normalize vectors into a contiguous float32 matrix"""
+    matrix = np.ascontiguousarray(vectors, dtype=np.float32)
+    if matrix.ndim == 1:
+        matrix = matrix.reshape(1, -1)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def top_k_indices(scores, k):
+    """Return indices of the k highest scores, best first, using partial selection"""
+    n = scores.shape[0]
+    if k <= 0 or n == 0:
+        return np.empty(0, dtype=np.int64)
+    if k >= n:
+        return np.argsort(-scores, kind='stable')
+
+    # argpartition is O(N); only the k winners get sorted
+    candidates = np.argpartition(-scores, k - 1)[:k]
+    return candidates[np.argsort(-scores[candidates], kind='stable')]
+
+
+def top_k_rows(scores, k):
+    """Row-wise top-k of a (queries x candidates) score matrix, best first"""
+    n = scores.shape[1]
+    k = min(k, n)
+    if k <= 0:
+        return np.empty((scores.shape[0], 0), dtype=np.int64)
+    if k < n:
+        candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        candidates = np.broadcast_to(np.arange(n), scores.shape)
+    candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+    order = np.argsort(-candidate_scores, axis=1, kind='stable')
+    return np.take_along_axis(candidates, order, axis=1)
+
+
+class ExactIndex:
+    """Exact cosine search over a pre-normalized float32 matrix"""
+
+    def __init__(self, embeddings, normalized=False):
+        # Normalize once at load time so each query is a single matrix-vector product
+        if normalized:
+            self.vectors = np.ascontiguousarray(embeddings, dtype=np.float32)
+        else:
+            self.vectors = normalize_rows(embeddings)
+
+    def __len__(self):
+        return self.vectors.shape[0]
+
+    @property
+    def dim(self):
+        return self.vectors.shape[1]
+
+    def search(self, query_embedding, k=5):
+        """Return (indices, similarities) of the top-k vectors for one query"""
+        query = normalize_rows(query_embedding)[0]
+        scores = self.vectors @ query
+        top = top_k_indices(scores, k)
+        return top, scores[top]
+
+    def search_subset(self, query_embedding, k, rows):
+        """Exact search restricted to `rows` (e.g. from a metadata filter)"""
+        query = normalize_rows(query_embedding)[0]
+        scores = self.vectors[rows] @ query
+        top = top_k_indices(scores, k)
+        return rows[top], scores[top]
+
+    def search_batch(self, query_embeddings, k=5, max_block_scores=1 << 25):
+        """Top-k for many queries with one matrix-matrix product per block
+        
+        Returns (indices, similarities), each shaped (num_queries, k). Queries
+        are processed in blocks so the score matrix stays under
+        `max_block_scores` floats.
+        """
+        queries = normalize_rows(query_embeddings)
+        k = min(k, len(self))
+        indices = np.empty((queries.shape[0], k), dtype=np.int64)
+        similarities = np.empty((queries.shape[0], k), dtype=np.float32)
+        block = max(1, max_block_scores // max(1, len(self)))
+        for start in range(0, queries.shape[0], block):
+            scores = queries[start:start + block] @ self.vectors.T
+            top = top_k_rows(scores, k)
+            indices[start:start + block] = top
+            similarities[start:start + block] = np.take_along_axis(scores, top, axis=1)
+        return indices, similarities
+
+    def search_subset_batch(self, query_embeddings, k, rows):
+        """search_batch restricted to `rows`; the subset is gathered once for all queries"""
+        indices, similarities = ExactIndex(self.vectors[rows], normalized=True).search_batch(query_embeddings, k)
+        return rows[indices], similarities
+
+    def save(self, path):
+        """Persist the normalized matrix as a single .npz file"""
+        np.savez(path, index_type='exact', vectors=self.vectors)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data['vectors'], normalized=True)
+
+
+def assign_to_centroids(data, centroids, spherical=False, batch_size=65536):
+    """Nearest centroid for every row (max dot product if spherical, else min L2)"""
+    assignments = np.empty(data.shape[0], dtype=np.int64)
+    centroid_norms = (centroids ** 2).sum(axis=1)
+    for start in range(0, data.shape[0], batch_size):
+        batch = data[start:start + batch_size]
+        products = batch @ centroids.T
+        if spherical:
+            assignments[start:start + batch_size] = products.argmax(axis=1)
+        else:
+            # ||x - c||^2 = ||x||^2 - 2 x.c + ||c||^2; ||x||^2 is constant per row
+            assignments[start:start + batch_size] = (centroid_norms - 2 * products).argmin(axis=1)
+    return assignments
+
+
+def kmeans(data, n_clusters, n_iter=20, spherical=False, sample_size=None, seed=42):
+    """Lloyd's k-means in NumPy; spherical mode keeps centroids unit length"""
+    rng = np.random.default_rng(seed)
+    data = np.ascontiguousarray(data, dtype=np.float32)
+    if sample_size is not None and data.shape[0] > sample_size:
+        data = data[rng.choice(data.shape[0], sample_size, replace=False)]
+    n_clusters = min(n_clusters, data.shape[0])
+
+    centroids = data[rng.choice(data.shape[0], n_clusters, replace=False)].copy()
+    for _ in range(n_iter):
+        assignments = assign_to_centroids(data, centroids, spherical)
+        counts = np.bincount(assignments, minlength=n_clusters)
+
+        # Per-cluster sums via one reduceat over rows sorted by cluster
+        order = np.argsort(assignments, kind='stable')
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        sums = np.zeros_like(centroids)
+        nonempty = counts > 0
+        sums[nonempty] = np.add.reduceat(data[order], starts[nonempty], axis=0)
+
+        # Re-seed empty clusters with random points
+        empty = counts == 0
+        if empty.any():
+            sums[empty] = data[rng.choice(data.shape[0], int(empty.sum()))]
+            counts[empty] = 1
+
+        centroids = (sums / counts[:, None]).astype(np.float32)
+        if spherical:
+            centroids = normalize_rows(centroids)
+    return centroids.astype(np.float32)
+
+
+class IVFIndex:
+    """Inverted-file ANN index with a k-means coarse quantizer
+    
+    Vectors are stored grouped by cluster so each probed list is a contiguous
+    slice; `nprobe` trades recall for latency.
+    """
+
+    def __init__(self, centroids, list_offsets, list_ids, vectors, nprobe=8):
+        self.centroids = centroids
+        self.list_offsets = list_offsets
+        self.list_ids = list_ids
+        self.vectors = vectors
+        self.nprobe = nprobe
+
+    def __len__(self):
+        return self.vectors.shape[0]
+
+    @property
+    def nlist(self):
+        return self.centroids.shape[0]
+
+    @classmethod
+    def build(cls, embeddings, nlist=None, nprobe=8, n_iter=20, seed=42):
+        """Train the coarse quantizer and bucket every vector into its list"""
+        vectors = normalize_rows(embeddings)
+        if nlist is None:
+            nlist = max(1, int(4 * np.sqrt(vectors.shape[0])))
+
+        # Train on a sample; ~64 points per list is enough for a coarse quantizer
+        centroids = kmeans(vectors, nlist, n_iter=n_iter, spherical=True,
+                           sample_size=nlist * 64, seed=seed)
+        assignments = assign_to_centroids(vectors, centroids, spherical=True)
+
+        order = np.argsort(assignments, kind='stable')
+        counts = np.bincount(assignments, minlength=centroids.shape[0])
+        list_offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        return cls(centroids, list_offsets, order.astype(np.int64),
+                   np.ascontiguousarray(vectors[order]), nprobe=nprobe)
+
+    def search(self, query_embedding, k=5, nprobe=None):
+        """Return (indices, similarities) of the approximate top-k vectors"""
+        query = normalize_rows(query_embedding)[0]
+        probes = top_k_indices(self.centroids @ query, nprobe or self.nprobe)
+
+        positions = [np.arange(self.list_offsets[p], self.list_offsets[p + 1]) for p in probes]
+        positions = np.concatenate(positions) if positions else np.empty(0, dtype=np.int64)
+        scores = self.vectors[positions] @ query
+
+        top = top_k_indices(scores, k)
+        return self.list_ids[positions[top]], scores[top]
+
+    def search_subset(self, query_embedding, k, rows):
+        """Exact search over `rows`; a filtered subset is usually small enough to scan"""
+        if not hasattr(self, '_positions'):
+            self._positions = np.argsort(self.list_ids)  # row id -> position in self.vectors
+        query = normalize_rows(query_embedding)[0]
+        scores = self.vectors[self._positions[rows]] @ query
+        top = top_k_indices(scores, k)
+        return rows[top], scores[top]
+
+    def search_batch(self, query_embeddings, k=5, nprobe=None):
+        """Per-query search; each query probes different lists so there is no shared GEMM"""
+        return stack_results([self.search(query, k, nprobe) for query in normalize_rows(query_embeddings)], k)
+
+    def save(self, path):
+        """Persist the index as a single .npz file"""
+        np.savez(path, index_type='ivf', centroids=self.centroids,
+                 list_offsets=self.list_offsets, list_ids=self.list_ids,
+                 vectors=self.vectors, nprobe=self.nprobe)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data['centroids'], data['list_offsets'], data['list_ids'],
+                       data['vectors'], nprobe=int(data['nprobe']))
+
+
+def stack_results(results, k):
+    """Stack per-query (indices, similarities) into (num_queries, k) arrays, padding with -1"""
+    indices = np.full((len(results), k), -1, dtype=np.int64)
+    similarities = np.full((len(results), k), -np.inf, dtype=np.float32)
+    for row, (ids, scores) in enumerate(results):
+        indices[row, :len(ids)] = ids
+        similarities[row, :len(ids)] = scores
+    return indices, similarities
+
+
+INDEX_TYPES = {
+    'exact': ExactIndex,
+    'ivf': IVFIndex,
+}
+QUANTIZED_TYPES = ('sq8', 'pq')
+
+
+def build_index(embeddings, index_type='exact', **params):
+    """Build an index of the given type over raw embeddings
+
+    'exact' is the fastest and exact; 'ivf' trades recall for speed on large
+    corpora. 'sq8' and 'pq' trade recall *and* speed for memory (slower than
+    exact at this corpus size, see quantization.QuantizedIndex); use them
+    only when the float32 matrix does not fit. PQ re-ranks by default.
+    """
+    if index_type in QUANTIZED_TYPES:
+        from quantization import QuantizedIndex
+        return QuantizedIndex.build(embeddings, quantizer=index_type, **params)
+    if index_type not in INDEX_TYPES:
+        valid = list(INDEX_TYPES) + list(QUANTIZED_TYPES)
+        raise ValueError(f"Unknown index type: {index_type}. Choose from {valid}")
+    index_cls = INDEX_TYPES[index_type]
+    if hasattr(index_cls, 'build'):
+        return index_cls.build(embeddings, **params)
+    return index_cls(embeddings, **params)
+
+
+def load_index(path, **params):
+    """Load a persisted index, dispatching on its stored type"""
+    with np.load(path) as data:
+        index_type = str(data['index_type'])
+    if index_type in QUANTIZED_TYPES:
+        from quantization import QuantizedIndex
+        return QuantizedIndex.load(path, **params)
+    return INDEX_TYPES[index_type].load(path, **params)
+
+
+def build_index_from_parquet(parquet_path, output_path, index_type='ivf', **params):
+    """Build an index from the parquet written by create_embeddings and save it"""
+    import pandas as pd
+    chunks_df = pd.read_parquet(parquet_path, columns=['embedding'])
+    embeddings = np.stack(chunks_df['embedding'].values)
+    index = build_index(embeddings, index_type, **params)
+
+    os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+    index.save(output_path)
+    print(f"Saved {index_type} index ({len(index)} vectors) to: {output_path}")
+    return index
+
+
+if __name__ == "__main__":
+    # Example usage
+    build_index_from_parquet('../vector_store/sample_embeddings.parquet',
+                             '../vector_store/ivf_index.npz', index_type='ivf')
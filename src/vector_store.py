@@ -0,0 +1,306 @@
+# vector_store.py - Memory-mapped columnar vector store
+#
+# Layout of a store directory:
+#   manifest.json                  version, dim, row counts, segment list
+#   segments/<name>/embeddings.npy normalized float32 matrix, np.memmap-ed
+#   segments/<name>/metadata.arrow text/product/... as uncompressed Arrow IPC
+#   segments/<name>/tombstones-*.npy deleted row numbers (see ingestion.py)
+#   segments/<name>/lexical.npz    BM25 inverted index over the text column
+#
+# Both files are memory-mapped, so opening a store costs almost nothing and
+# every worker process on the box shares the same page cache. Segment files
+# are immutable; writers publish changes by atomically replacing the
+# manifest and bumping its version.
+import json
+import os
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+from vector_index import normalize_rows
+from lexical_index import open_lexical_index, write_lexical_index
+
+MANIFEST_NAME = 'manifest.json'
+EMBEDDINGS_NAME = 'embeddings.npy'
+METADATA_NAME = 'metadata.arrow'
+
+
+# Low-cardinality string columns, gathered through a dictionary encoding
+CATEGORICAL_COLUMNS = ('product', 'company', 'state')
+
+
+class ColumnStore:
+    """Arrow-backed metadata columns, decoded to Python objects only on access"""
+
+    def __init__(self, table):
+        self.table = table
+        self._dense = {}  # column name -> NumPy array or (codes, categories)
+
+    def __len__(self):
+        return self.table.num_rows
+
+    @property
+    def columns(self):
+        return self.table.column_names
+
+    def column(self, name):
+        """Whole column as NumPy (zero-copy for numeric columns)"""
+        return self.table.column(name).to_numpy()
+
+    def value(self, name, idx):
+        """Decode a single cell"""
+        return self.table.column(name)[int(idx)].as_py()
+
+    def take(self, name, rows):
+        """Gather one column for many rows at once, as a NumPy array
+        
+        Numeric columns and CATEGORICAL_COLUMNS are converted to NumPy once
+        and then fancy-indexed; other (text) columns decode only `rows`.
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        dense = self._dense.get(name)
+        if dense is None:
+            column = self.table.column(name)
+            if pa.types.is_integer(column.type) or pa.types.is_floating(column.type):
+                dense = column.to_numpy()
+            elif name in CATEGORICAL_COLUMNS:
+                codes, categories = self.codes(name)
+                # Trailing None so missing values (code -1) gather as None
+                dense = (codes, np.array(categories + [None], dtype=object))
+            else:
+                return self.table.column(name).take(rows).to_numpy(zero_copy_only=False)
+            self._dense[name] = dense
+        if isinstance(dense, tuple):
+            codes, categories = dense
+            return categories[codes[rows]]
+        return dense[rows]
+
+    def codes(self, name):
+        """Dictionary-encode a string column: (int codes with -1 for missing, categories)"""
+        encoded = self.table.column(name).combine_chunks().dictionary_encode()
+        codes = encoded.indices.fill_null(-1).to_numpy(zero_copy_only=False).astype(np.int64)
+        return codes, encoded.dictionary.to_pylist()
+
+    def to_pandas(self):
+        return self.table.to_pandas()
+
+
+class VectorStore:
+    """Embeddings matrix plus lazily decoded metadata"""
+
+    def __init__(self, embeddings, metadata, version=0, normalized=False, path=None, segments=()):
+        self.embeddings = embeddings
+        self.metadata = metadata
+        self.version = version
+        self.normalized = normalized
+        self.path = path
+        # (segment dir, rows on disk, live row positions or None) per segment
+        self.segments = list(segments)
+        self._filter_index = None
+        self._lexical_index = None
+
+    def __len__(self):
+        return self.embeddings.shape[0]
+
+    @property
+    def dim(self):
+        return self.embeddings.shape[1]
+
+    @property
+    def filter_index(self):
+        """Inverted metadata indexes for pre-filtering, built on first use"""
+        if self._filter_index is None:
+            from metadata_index import MetadataIndex
+            self._filter_index = MetadataIndex(self.metadata)
+        return self._filter_index
+
+    @property
+    def lexical_index(self):
+        """BM25 searcher over chunk text, loaded on first use"""
+        if self._lexical_index is None:
+            self._lexical_index = open_lexical_index(self)
+        return self._lexical_index
+
+    @classmethod
+    def open(cls, store_dir, mmap=True):
+        """Open a store directory; vectors and metadata are memory-mapped"""
+        manifest = read_manifest(store_dir)
+        embeddings, tables, segments = [], [], []
+        for segment in manifest['segments']:
+            segment_dir = os.path.join(store_dir, 'segments', segment['name'])
+            segment_embeddings = np.load(os.path.join(segment_dir, EMBEDDINGS_NAME),
+                                         mmap_mode='r' if mmap else None)
+            table = read_arrow(os.path.join(segment_dir, METADATA_NAME), mmap)
+
+            # Drop deleted rows (copies this segment until it is compacted)
+            rows, live = len(segment_embeddings), None
+            if segment.get('tombstones'):
+                deleted = np.load(os.path.join(segment_dir, segment['tombstones']))
+                live = np.setdiff1d(np.arange(len(segment_embeddings)), deleted)
+                segment_embeddings = segment_embeddings[live]
+                table = table.take(live)
+
+            embeddings.append(segment_embeddings)
+            tables.append(table)
+            segments.append((segment_dir, rows, live))
+
+        # A single segment stays zero-copy; several are stitched together
+        if len(embeddings) == 1:
+            matrix = embeddings[0]
+        elif embeddings:
+            matrix = np.concatenate(embeddings)
+        else:
+            matrix = np.empty((0, manifest['dim']), dtype=np.float32)
+        copied = len(embeddings) > 1 or any(live is not None for _, _, live in segments)
+        if copied and mmap:
+            print(f"⚠️ {store_dir}: {len(segments)} segments/tombstones, embeddings copied into "
+                  f"process memory ({matrix.nbytes / (1024 * 1024):.0f} MB); compact the store to "
+                  f"share one memory map")
+        # Segments may differ in optional columns (e.g. deduplicated vs. not);
+        # missing columns read as null
+        table = pa.concat_tables(tables, promote_options='default') if tables else pa.table({})
+        return cls(matrix, ColumnStore(table), version=manifest['version'],
+                   normalized=manifest.get('normalized', False), path=store_dir, segments=segments)
+
+    @classmethod
+    def from_parquet(cls, parquet_path):
+        """Load a legacy create_embeddings parquet without per-row Python objects"""
+        table = pq.read_table(parquet_path)
+        vectors = table.column('embedding').combine_chunks()
+        dim = len(vectors[0]) if len(vectors) else 0
+        embeddings = vectors.flatten().to_numpy().reshape(-1, dim).astype(np.float32, copy=False)
+        return cls(embeddings, ColumnStore(table.drop_columns(['embedding'])))
+
+
+def read_arrow(path, mmap=True):
+    """Read an Arrow IPC file, memory-mapped when possible"""
+    source = pa.memory_map(path, 'r') if mmap else pa.OSFile(path, 'rb')
+    return pa.ipc.open_file(source).read_all()
+
+
+def write_arrow(table, path):
+    """Write an uncompressed Arrow IPC file (required for zero-copy reads)"""
+    with pa.OSFile(path, 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+
+
+def read_manifest(store_dir):
+    with open(os.path.join(store_dir, MANIFEST_NAME)) as f:
+        return json.load(f)
+
+
+def write_manifest(store_dir, manifest):
+    """Atomically replace the manifest so readers never see a partial file"""
+    path = os.path.join(store_dir, MANIFEST_NAME)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def write_segment(store_dir, name, embeddings, metadata):
+    """Write one segment: normalized float32 .npy plus Arrow metadata
+    
+    `metadata` is a DataFrame or an Arrow table with one row per vector.
+    """
+    segment_dir = os.path.join(store_dir, 'segments', name)
+    os.makedirs(segment_dir, exist_ok=True)
+    np.save(os.path.join(segment_dir, EMBEDDINGS_NAME), normalize_rows(embeddings))
+    if not isinstance(metadata, pa.Table):
+        metadata = pa.Table.from_pandas(metadata.reset_index(drop=True), preserve_index=False)
+    write_arrow(metadata, os.path.join(segment_dir, METADATA_NAME))
+    if 'text' in metadata.column_names:
+        write_lexical_index(segment_dir, metadata.column('text').to_pylist())
+    return {'name': name, 'rows': metadata.num_rows}
+
+
+class SegmentWriter:
+    """Stream vectors and metadata into a segment without holding them all in memory
+
+    Embeddings are appended to a raw scratch file and converted into the
+    final .npy (whose header needs the row count) on close.
+    """
+
+    def __init__(self, store_dir, name):
+        self.segment_dir = os.path.join(store_dir, 'segments', name)
+        os.makedirs(self.segment_dir, exist_ok=True)
+        self.name = name
+        self.rows = 0
+        self.dim = None
+        self._raw_path = os.path.join(self.segment_dir, 'embeddings.f32.tmp')
+        self._raw = open(self._raw_path, 'wb')
+        self._sink = None
+        self._writer = None
+
+    def append(self, embeddings, metadata_df):
+        vectors = normalize_rows(embeddings)
+        self.dim = vectors.shape[1]
+        self._raw.write(vectors.tobytes())
+
+        table = pa.Table.from_pandas(metadata_df.reset_index(drop=True), preserve_index=False)
+        if self._writer is None:
+            self._sink = pa.OSFile(os.path.join(self.segment_dir, METADATA_NAME), 'wb')
+            self._writer = pa.ipc.new_file(self._sink, table.schema)
+        self._writer.write_table(table)
+        self.rows += len(metadata_df)
+
+    def close(self):
+        """Finalize the segment files and return its manifest entry"""
+        self._raw.close()
+        if self._writer is not None:
+            self._writer.close()
+            self._sink.close()
+            table = read_arrow(os.path.join(self.segment_dir, METADATA_NAME))
+            if 'text' in table.column_names:
+                write_lexical_index(self.segment_dir, table.column('text').to_pylist())
+
+        path = os.path.join(self.segment_dir, EMBEDDINGS_NAME)
+        if self.rows:
+            raw = np.memmap(self._raw_path, dtype=np.float32, mode='r', shape=(self.rows, self.dim))
+            out = np.lib.format.open_memmap(path, mode='w+', dtype=np.float32, shape=raw.shape)
+            for start in range(0, self.rows, 65536):
+                out[start:start + 65536] = raw[start:start + 65536]
+            out.flush()
+            del raw, out
+        else:
+            np.save(path, np.empty((0, 0), dtype=np.float32))
+        os.remove(self._raw_path)
+        return {'name': self.name, 'rows': self.rows}
+
+
+def segment_name(version):
+    return f"seg-{version:06d}"
+
+
+def save_vector_store(chunks_df, store_dir):
+    """Write a chunks DataFrame (with an `embedding` column) as a new store"""
+    embeddings = np.stack(chunks_df['embedding'].values) if len(chunks_df) else np.empty((0, 0))
+    segment = write_segment(store_dir, segment_name(1), embeddings,
+                            chunks_df.drop(columns=['embedding']))
+    write_manifest(store_dir, {
+        'format': 1,
+        'version': 1,
+        'dim': int(embeddings.shape[1]),
+        'normalized': True,
+        'segments': [segment],
+    })
+    print(f"Saved vector store ({segment['rows']} chunks) to: {store_dir}")
+
+
+def load_vector_store(path, mmap=True):
+    """Open a store directory, or fall back to a legacy embeddings parquet"""
+    if os.path.isdir(path):
+        return VectorStore.open(path, mmap=mmap)
+    return VectorStore.from_parquet(path)
+
+
+def convert_parquet_to_store(parquet_path, store_dir):
+    """Convert the parquet written by create_embeddings into a store directory"""
+    import pandas as pd
+    save_vector_store(pd.read_parquet(parquet_path), store_dir)
+
+
+if __name__ == "__main__":
+    # Example usage
+    convert_parquet_to_store('../vector_store/sample_embeddings.parquet',
+                             '../vector_store/complaints_store')
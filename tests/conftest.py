@@ -0,0 +1,66 @@
+import os
+import re
+import sys
+import zlib
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import chunker  # noqa: E402
+
+
+class WordCounter:
+    """Token counts without the HF tokenizer: one token per word"""
+
+    def count(self, texts):
+        return np.fromiter((len(text.split()) for text in texts), dtype=np.int64, count=len(texts))
+
+
+class HashingEncoder:
+    """Deterministic bag-of-words embeddings standing in for the sentence model"""
+
+    dim = 64
+
+    def encode(self, texts, show_progress_bar=False, batch_size=None):
+        single = isinstance(texts, str)
+        texts = [texts] if single else texts
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for i, text in enumerate(texts):
+            for word in re.findall(r"[a-z0-9]+", text.lower()):
+                vectors[i, zlib.crc32(word.encode()) % self.dim] += 1.0
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        return vectors[0] if single else vectors
+
+    def get_sentence_embedding_dimension(self):
+        return self.dim
+
+
+@pytest.fixture(autouse=True)
+def word_chunker(monkeypatch):
+    monkeypatch.setattr(chunker, '_token_counter', WordCounter())
+
+
+@pytest.fixture
+def encoder():
+    return HashingEncoder()
+
+
+NARRATIVES = [
+    "I was charged a late fee on my credit card even though my payment was made on time.",
+    "I was charged a late fee on my credit card even though my payment was made on time!",
+    "Someone opened a loan in my name and the bank refuses to investigate the fraud.",
+    "My money transfer to my family has been pending for two weeks with no explanation.",
+]
+
+
+@pytest.fixture
+def complaints():
+    return pd.DataFrame({
+        'Complaint ID': [101, 102, 103, 104],
+        'Product': ['Credit card', 'Credit card', 'Personal loan', 'Money transfers'],
+        'Company': ['Bank A', 'Bank A', 'Bank B', None],
+        'Date received': ['2023-01-15', '2023-02-03', '2023-02-20', '2023-03-01'],
+        'Consumer complaint narrative': NARRATIVES,
+    })
@@ -0,0 +1,83 @@
+import pandas as pd
+from aggregates import AggregateCube, build_aggregates, open_aggregates, product_aliases
+from chunking_embedding import create_embeddings
+from ingestion import ingest_incremental
+
+
+def test_counts_trend_and_breakdown(complaints):
+    cube = build_aggregates(complaints)
+    assert len(cube) == 4
+    assert cube.count(product='Credit card') == 2
+    assert cube.count(issue='fraud') == 1
+    assert cube.count(issue=['fraud', 'billing']) == 3
+    assert cube.count(date_from='2023-02', date_to='2023-02') == 2
+    assert cube.trend(product='Credit card') == [('2023-01', 1), ('2023-02', 1)]
+    assert cube.breakdown('company') == {'Bank A': 2, 'Bank B': 1, None: 1}
+
+
+def test_update_moves_complaints_and_remove_uncounts(complaints):
+    cube = build_aggregates(complaints)
+    moved = complaints.iloc[[0]].assign(Product='Mortgage')
+    assert cube.update(moved) == {'added': 0, 'updated': 1}
+    assert cube.count(product='Credit card') == 1
+    assert cube.count(product='Mortgage') == 1
+    assert cube.remove([103, 999]) == 1
+    assert len(cube) == 3
+    assert cube.count(issue='fraud') == 0
+
+
+def test_missing_values_use_the_missing_code(complaints):
+    frame = complaints.astype({'Product': 'string', 'Company': 'string', 'Date received': 'string'})
+    frame.loc[0, ['Product', 'Company', 'Date received']] = pd.NA
+    cube = build_aggregates(frame)
+    assert len(cube) == 4
+    assert cube.products[0] is None
+    assert not any(pd.isna(product) for product in cube.products[1:])
+    assert sum(count for _, count in cube.trend()) == 3
+
+
+def test_save_and_load_round_trip(tmp_path, complaints):
+    path = str(tmp_path / 'aggregates.npz')
+    build_aggregates(complaints, path)
+    cube = AggregateCube.load(path)
+    assert cube.breakdown('product') == build_aggregates(complaints).breakdown('product')
+
+
+def test_cube_follows_incremental_ingestion(tmp_path, complaints, encoder):
+    store_dir = str(tmp_path / 'store')
+    create_embeddings(complaints.iloc[:3], str(tmp_path / 'chunks.parquet'), store_dir=store_dir,
+                      encoder=encoder)
+    assert len(open_aggregates(store_dir)) == 3
+
+    edited = complaints.copy()
+    edited.loc[0, 'Product'] = 'Mortgage'
+    edited.loc[0, 'Consumer complaint narrative'] = "My mortgage servicer lost my payment twice."
+    ingest_incremental(edited, store_dir, model=encoder, deleted_ids=[103])
+    cube = open_aggregates(store_dir)
+    assert len(cube) == 3
+    assert cube.breakdown('product') == {'Credit card': 1, 'Mortgage': 1, 'Money transfers': 1}
+
+
+def test_count_questions_are_labelled_by_issue_category(tmp_path, complaints, encoder):
+    from rag_pipeline import RAGSystem
+    store_dir = str(tmp_path / 'store')
+    create_embeddings(complaints, str(tmp_path / 'chunks.parquet'), store_dir=store_dir, encoder=encoder)
+    rag = RAGSystem(store_dir)
+    answer, _ = rag.generate_answer("How many complaints mention late payments?", [])
+    assert "**Complaints in issue categories payment (payment, payments, transaction, transactions, ...):** 3 of 4" in answer
+    assert rag.analyze("What are common credit card issues?") is None
+
+
+def test_products_are_matched_by_whole_word_aliases(complaints):
+    catalog = complaints.assign(Product=['Credit card or prepaid card', 'Credit card or prepaid card',
+                                         'Payday loan', 'Money transfer, virtual currency, or money service'])
+    cube = build_aggregates(pd.concat([catalog, complaints.assign(**{'Complaint ID': [201, 202, 203, 204]})]))
+    assert product_aliases('Credit card or prepaid card') == ['credit card', 'credit cards',
+                                                             'prepaid card', 'prepaid cards']
+    assert cube.products_in("How many complaints about credit cards mention late fees?") == \
+        ['Credit card or prepaid card', 'Credit card']
+    assert cube.products_in("Are money transfers getting slower?") == \
+        ['Money transfer, virtual currency, or money service', 'Money transfers']
+    assert cube.products_in("How many payday loans went to collections?") == ['Payday loan']
+    # Short names only match whole words: no 'loan' inside 'loaned', no product in 'cardinal'
+    assert cube.products_in("My cardinal bank loaned me money") == []
@@ -0,0 +1,19 @@
+import importlib
+import os
+import sys
+import pytest
+
+pytest.importorskip('gradio')
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+
+def test_importing_the_app_does_not_open_the_store(monkeypatch):
+    import rag_pipeline
+
+    def fail(*args, **kwargs):
+        raise AssertionError("RAGSystem built at import time")
+
+    monkeypatch.setattr(rag_pipeline, 'RAGSystem', fail)
+    app = importlib.import_module('app')
+    assert app._rag_system is None and app._loader is None
+    assert app.system_status().startswith("🟡")
@@ -0,0 +1,23 @@
+from caching import ResultCache
+
+
+def test_stale_put_does_not_wipe_or_roll_back_the_cache():
+    cache = ResultCache()
+    key, stale_key = ResultCache.make_key('late fee', 5), ResultCache.make_key('fraud', 5)
+    assert cache.get(stale_key, 1) is None   # request starts against v1
+    assert cache.get(key, 2) is None         # store refreshed; a new request sees v2
+    cache.put(key, 'fresh', 2)
+    cache.put(stale_key, 'stale', 1)         # the v1 request finishes late
+    assert cache.version == 2
+    assert cache.get(key, 2) == 'fresh'
+    assert cache.get(stale_key, 2) is None
+    assert cache.invalidations == 0
+
+
+def test_lookup_with_a_new_version_invalidates():
+    cache = ResultCache()
+    key = ResultCache.make_key('late fee', 5)
+    cache.get(key, 1)
+    cache.put(key, 'v1 answer', 1)
+    assert cache.get(key, 2) is None
+    assert len(cache) == 0 and cache.invalidations == 1
@@ -0,0 +1,54 @@
+import os
+import pandas as pd
+from chunker import BoilerplateFilter, BOILERPLATE_NAME, default_chunker, sentence_key
+from chunking_embedding import build_chunks, create_embeddings
+from ingestion import ingest_incremental
+from vector_store import VectorStore
+
+BOILERPLATE = "Thank you for your help."
+
+
+def complaints_with_boilerplate(ids):
+    return pd.DataFrame({
+        'Complaint ID': ids,
+        'Product': 'Credit card',
+        'Consumer complaint narrative': [f"My card number {i} was charged twice for one purchase. {BOILERPLATE}"
+                                         for i in ids],
+    })
+
+
+def test_chunking_does_not_depend_on_earlier_builds():
+    df = complaints_with_boilerplate(list(range(1, 6)))
+    first = build_chunks(df, default_chunker(BoilerplateFilter(min_count=2)))
+    assert first['text'].str.contains(BOILERPLATE).sum() == 2
+    # The counts stayed with that build: a new one starts from zero
+    assert default_chunker().boilerplate is not default_chunker().boilerplate
+    assert build_chunks(df)['text'].str.contains(BOILERPLATE).sum() == len(df)
+
+
+def test_counts_round_trip(tmp_path):
+    boilerplate = BoilerplateFilter(min_count=3, max_tokens=10)
+    boilerplate.observe([sentence_key(BOILERPLATE), sentence_key("Please help.")])
+    boilerplate.observe([sentence_key(BOILERPLATE)])
+    path = str(tmp_path / BOILERPLATE_NAME)
+    boilerplate.save(path)
+    loaded = BoilerplateFilter.load(path)
+    assert (loaded.min_count, loaded.max_tokens) == (3, 10)
+    assert loaded._counts == boilerplate._counts
+
+
+def test_incremental_ingest_continues_the_store_counts(tmp_path, encoder):
+    store_dir = str(tmp_path / 'store')
+    create_embeddings(complaints_with_boilerplate([1, 2]), str(tmp_path / 'chunks.parquet'),
+                      store_dir=store_dir, encoder=encoder, dedup=False)
+    path = os.path.join(store_dir, BOILERPLATE_NAME)
+    counts = BoilerplateFilter.load(path)
+    assert counts._counts[sentence_key(BOILERPLATE)] == 2
+    # Lower the threshold so the third complaint's boilerplate is already known
+    counts.min_count = 2
+    counts.save(path)
+
+    ingest_incremental(complaints_with_boilerplate([3]), store_dir, model=encoder)
+    assert BoilerplateFilter.load(path)._counts[sentence_key(BOILERPLATE)] == 3
+    texts = VectorStore.open(store_dir).metadata.to_pandas()
+    assert not texts.loc[texts['complaint_id'] == 3, 'text'].str.contains(BOILERPLATE).any()
@@ -0,0 +1,24 @@
+import numpy as np
+from evaluation import brute_force_top_k, compare_reports
+from vector_index import ExactIndex
+
+
+def test_brute_force_ground_truth_matches_exact_index():
+    rng = np.random.default_rng(1)
+    embeddings = rng.normal(size=(300, 24)).astype(np.float32)
+    index = ExactIndex(embeddings)
+    for query in rng.normal(size=(10, 24)).astype(np.float32):
+        assert list(brute_force_top_k(embeddings, query, 7)) == list(index.search(query, 7)[0])
+    rows = np.arange(0, 300, 3)
+    query = embeddings[9]
+    assert brute_force_top_k(embeddings, query, 3, rows)[0] == 9
+
+
+def test_compare_reports_flags_regressions():
+    def report(recall, p50, cache='off'):
+        return {'config': {'k': 5, 'query_set': 'synthetic', 'query_cache': cache},
+                'quality': {'recall@5': recall, 'mrr': None},
+                'latency': {'p50_ms': p50, 'p95_ms': p50, 'p99_ms': p50}, 'qps': 100.0, 'peak_rss_mb': 500.0}
+
+    _, regressions = compare_reports(report(0.95, 10.0), report(0.90, 10.5))
+    assert regressions == ['quality.recall@5']
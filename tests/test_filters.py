@@ -0,0 +1,85 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pytest
+from metadata_index import MetadataIndex
+from vector_store import ColumnStore
+
+PRODUCTS = ['Credit card', 'Mortgage', 'Personal loan', None]
+COMPANIES = ['Bank A', 'Bank B', 'Company C']
+STATES = ['CA', 'NY', 'TX', None]
+
+
+@pytest.fixture(scope='module')
+def metadata():
+    rng = np.random.default_rng(0)
+    n = 500
+    dates = pd.Timestamp('2022-01-01') + pd.to_timedelta(rng.integers(0, 730, n), unit='D')
+    frame = pd.DataFrame({
+        'complaint_id': rng.integers(1000, 1200, n),  # repeated: several chunks per complaint
+        'product': rng.choice(np.array(PRODUCTS, dtype=object), n),
+        'company': rng.choice(COMPANIES, n),
+        'state': rng.choice(np.array(STATES, dtype=object), n),
+        'date_received': [None if i % 50 == 0 else d.strftime('%Y-%m-%d') for i, d in enumerate(dates)],
+    })
+    return frame
+
+
+def expected_rows(frame, filters):
+    mask = np.ones(len(frame), dtype=bool)
+    for name in ('product', 'company', 'state', 'complaint_id'):
+        if filters.get(name) is not None:
+            values = filters[name] if isinstance(filters[name], list) else [filters[name]]
+            if name == 'complaint_id':
+                mask &= frame[name].isin(values).to_numpy()
+            else:
+                lowered = {str(v).lower() for v in values}
+                mask &= frame[name].str.lower().isin(lowered).to_numpy()
+    dates = pd.to_datetime(frame['date_received'])
+    if filters.get('date_from'):
+        mask &= (dates >= pd.Timestamp(filters['date_from'])).to_numpy()
+    if filters.get('date_to'):
+        mask &= (dates <= pd.Timestamp(filters['date_to'])).to_numpy()
+    return np.flatnonzero(mask)
+
+
+@pytest.mark.parametrize('filters', [
+    {'product': 'Credit card'},
+    {'product': 'credit CARD'},
+    {'product': ['Mortgage', 'Personal loan'], 'company': 'Bank B'},
+    {'state': 'NY', 'company': ['Bank A', 'Company C']},
+    {'complaint_id': [1001, 1050, 1199, 5000]},
+    {'date_from': '2022-06-01', 'date_to': '2022-06-30'},
+    {'date_from': '2023-06-01'},
+    {'date_to': '2022-02-01', 'product': 'Mortgage'},
+    {'product': 'Student loan'},
+])
+def test_lookup_matches_a_scan(metadata, filters):
+    index = MetadataIndex(ColumnStore(pa.Table.from_pandas(metadata, preserve_index=False)))
+    rows = index.lookup(filters)
+    assert np.all(np.diff(rows) > 0)
+    np.testing.assert_array_equal(rows, expected_rows(metadata, filters))
+
+
+def test_no_filters_and_unknown_filters(metadata):
+    index = MetadataIndex(ColumnStore(pa.Table.from_pandas(metadata, preserve_index=False)))
+    assert index.lookup({}) is None
+    assert index.lookup({'product': None}) is None
+    with pytest.raises(ValueError, match='Unknown filters'):
+        index.lookup({'issue': 'fraud'})
+    assert sorted(index.values('company')) == COMPANIES
+
+
+@pytest.mark.parametrize('filters', [{'product': []}, {'company': ()}, {'complaint_id': []},
+                                     {'product': [], 'state': 'CA'}])
+def test_empty_value_list_matches_nothing(metadata, filters):
+    index = MetadataIndex(ColumnStore(pa.Table.from_pandas(metadata, preserve_index=False)))
+    assert len(index.lookup(filters)) == 0
+
+
+@pytest.mark.parametrize('filters', [{'product': ['Credit card', 'credit card', 'CREDIT CARD']},
+                                     {'complaint_id': [1001, 1001, 1050]},
+                                     {'state': ['NY', 'ny'], 'company': ['Bank A', 'Bank A']}])
+def test_repeated_values_do_not_repeat_rows(metadata, filters):
+    index = MetadataIndex(ColumnStore(pa.Table.from_pandas(metadata, preserve_index=False)))
+    np.testing.assert_array_equal(index.lookup(filters), expected_rows(metadata, filters))
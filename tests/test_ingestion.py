@@ -0,0 +1,84 @@
+import numpy as np
+from chunking_embedding import create_embeddings
+from ingestion import ingest_incremental, load_live_catalog, compact_segments
+from vector_store import VectorStore, read_manifest
+
+
+def build_store(tmp_path, complaints, encoder):
+    store_dir = str(tmp_path / 'store')
+    create_embeddings(complaints, str(tmp_path / 'chunks.parquet'), store_dir=store_dir,
+                      encoder=encoder, dedup=True)
+    return store_dir
+
+
+def live_chunks(store_dir):
+    return VectorStore.open(store_dir).metadata.to_pandas()
+
+
+def test_dedup_collapses_near_duplicates(tmp_path, complaints, encoder):
+    chunks = live_chunks(build_store(tmp_path, complaints, encoder))
+    assert len(chunks) == 3
+    shared = chunks[chunks['complaint_id'] == 101].iloc[0]
+    assert shared['duplicate_count'] == 2
+    assert list(shared['member_ids']) == [101, 102]
+
+
+def test_reingesting_unchanged_data_embeds_nothing(tmp_path, complaints, encoder):
+    store_dir = build_store(tmp_path, complaints, encoder)
+    catalog = load_live_catalog(store_dir, read_manifest(store_dir))
+    assert set(catalog['complaint_id']) == {101, 102, 103, 104}
+
+    stats = ingest_incremental(complaints, store_dir, model=encoder)
+    assert stats['new'] == 0
+    assert stats['changed'] == 0
+    assert stats['chunks_embedded'] == 0
+    assert read_manifest(store_dir)['version'] == 1
+
+
+def test_deleting_a_member_updates_the_representative(tmp_path, complaints, encoder):
+    store_dir = build_store(tmp_path, complaints, encoder)
+    stats = ingest_incremental(complaints.iloc[:0], store_dir, model=encoder, deleted_ids=[102])
+    assert stats['deleted'] == 1
+    assert stats['chunks_embedded'] == 0
+
+    chunks = live_chunks(store_dir)
+    assert len(chunks) == 3
+    shared = chunks[chunks['complaint_id'] == 101].iloc[0]
+    assert shared['duplicate_count'] == 1
+    assert list(shared['member_ids']) == [101]
+
+
+def test_deleting_the_representative_hands_the_chunk_to_a_member(tmp_path, complaints, encoder):
+    store_dir = build_store(tmp_path, complaints, encoder)
+    ingest_incremental(complaints.iloc[:0], store_dir, model=encoder, deleted_ids=[101])
+
+    chunks = live_chunks(store_dir)
+    assert 101 not in set(chunks['complaint_id'])
+    shared = chunks[chunks['complaint_id'] == 102].iloc[0]
+    assert shared['duplicate_count'] == 1
+    # The member is still known, so re-ingesting the rest changes nothing
+    stats = ingest_incremental(complaints.iloc[1:], store_dir, model=encoder)
+    assert stats['chunks_embedded'] == 0
+
+
+def test_changed_member_is_reembedded_once(tmp_path, complaints, encoder):
+    store_dir = build_store(tmp_path, complaints, encoder)
+    edited = complaints.copy()
+    edited.loc[1, 'Consumer complaint narrative'] = "The bank closed my savings account without any notice."
+    stats = ingest_incremental(edited, store_dir, model=encoder)
+    assert (stats['new'], stats['changed'], stats['chunks_embedded']) == (0, 1, 1)
+
+    chunks = live_chunks(store_dir)
+    assert chunks.groupby('complaint_id')['duplicate_count'].sum().to_dict() == {101: 1, 102: 1, 103: 1, 104: 1}
+    assert ingest_incremental(edited, store_dir, model=encoder)['chunks_embedded'] == 0
+
+
+def test_compaction_keeps_live_rows(tmp_path, complaints, encoder):
+    store_dir = build_store(tmp_path, complaints, encoder)
+    ingest_incremental(complaints.iloc[:0], store_dir, model=encoder, deleted_ids=[103])
+    before = live_chunks(store_dir).sort_values('complaint_id')['text'].tolist()
+    compact_segments(store_dir)
+    store = VectorStore.open(store_dir)
+    assert len(read_manifest(store_dir)['segments']) == 1
+    assert store.metadata.to_pandas().sort_values('complaint_id')['text'].tolist() == before
+    assert np.allclose(np.linalg.norm(store.embeddings, axis=1), 1.0)
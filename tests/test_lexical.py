@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+from lexical_index import B, K1, BM25Searcher, LexicalIndex, tokenize
+
+WORDS = ['late', 'fee', 'payment', 'card', 'loan', 'fraud', 'transfer', 'account', 'interest', 'bank',
+         'refund', 'dispute', 'mortgage', 'credit', 'report', 'collection', 'debt', 'escrow']
+
+
+def random_texts(n, seed):
+    rng = np.random.default_rng(seed)
+    # Skewed word frequencies give long and short posting lists, as in real text
+    p = 1.0 / np.arange(1, len(WORDS) + 1)
+    return [' '.join(rng.choice(WORDS, size=rng.integers(1, 30), p=p / p.sum())) for _ in range(n)]
+
+
+def brute_force_bm25(texts, query, live=None):
+    """Score every live document directly from the BM25 formula"""
+    docs = [tokenize(text) for text in texts]
+    live = np.ones(len(docs), dtype=bool) if live is None else live
+    avg_length = np.mean([len(doc) for doc, alive in zip(docs, live) if alive])
+    scores = np.zeros(len(docs))
+    for term in dict.fromkeys(tokenize(query)):
+        df = sum(term in doc for doc in docs)
+        idf = np.log(1 + (len(docs) - df + 0.5) / (df + 0.5))
+        for i, doc in enumerate(docs):
+            tf = doc.count(term)
+            scores[i] += idf * tf * (K1 + 1) / (tf + K1 * (1 - B + B * len(doc) / avg_length))
+    scores[~live] = 0
+    return scores
+
+
+def assert_top_k(rows, scores, expected, k):
+    expected_top = np.sort(expected)[::-1][:k]
+    expected_top = expected_top[expected_top > 0]
+    np.testing.assert_allclose(scores, expected_top, rtol=1e-5)
+    np.testing.assert_allclose(expected[rows], scores, rtol=1e-5)
+
+
+@pytest.mark.parametrize('query', ['late fee', 'fraud loan escrow', 'late payment card bank refund',
+                                   'debt collection report'])
+@pytest.mark.parametrize('k', [1, 5, 20])
+def test_maxscore_matches_brute_force(query, k):
+    texts = random_texts(300, seed=1)
+    rows, scores = BM25Searcher([(LexicalIndex.build(texts), None)]).search(query, k=k)
+    assert_top_k(rows, scores, brute_force_bm25(texts, query), k)
+
+
+def test_segments_and_tombstones_match_brute_force():
+    texts = random_texts(200, seed=2)
+    live = np.ones(len(texts), dtype=bool)
+    live[::7] = False
+    parts, offset = [], 0
+    for size in (80, 70, 50):
+        row_map = np.arange(offset, offset + size)
+        row_map[~live[offset:offset + size]] = -1
+        parts.append((LexicalIndex.build(texts[offset:offset + size]), row_map))
+        offset += size
+    # Store rows of live docs are their positions among the live docs
+    store_rows = np.cumsum(live) - 1
+    for part in parts:
+        part[1][part[1] >= 0] = store_rows[part[1][part[1] >= 0]]
+
+    searcher = BM25Searcher(parts)
+    assert len(searcher) == live.sum()
+    query = 'late fee interest dispute'
+    rows, scores = searcher.search(query, k=10)
+    expected = brute_force_bm25(texts, query, live)[live]
+    assert_top_k(rows, scores, expected, 10)
+
+
+def test_row_restriction():
+    texts = random_texts(150, seed=3)
+    allowed = np.arange(0, 150, 3)
+    query = 'payment card fraud'
+    rows, scores = BM25Searcher([(LexicalIndex.build(texts), None)]).search(query, k=5, rows=allowed)
+    assert set(rows) <= set(allowed)
+    expected = np.zeros(len(texts))
+    expected[allowed] = brute_force_bm25(texts, query)[allowed]
+    assert_top_k(rows, scores, expected, 5)
+
+
+def test_stopword_only_query_returns_nothing():
+    rows, scores = BM25Searcher([(LexicalIndex.build(['the late fee']), None)]).search('what is the')
+    assert len(rows) == 0 and len(scores) == 0
@@ -0,0 +1,31 @@
+import time
+import rag_pipeline
+from chunking_embedding import create_embeddings
+
+
+class SlowLoadingEncoder:
+    def __init__(self, encoder, delay):
+        time.sleep(delay)
+        self.encoder = encoder
+
+    def encode(self, texts, **kwargs):
+        return self.encoder.encode(texts, **kwargs)
+
+
+def test_model_load_is_not_counted_as_encoding(tmp_path, monkeypatch, complaints, encoder):
+    store_dir = str(tmp_path / 'store')
+    create_embeddings(complaints, str(tmp_path / 'chunks.parquet'), store_dir=store_dir, encoder=encoder)
+    monkeypatch.setattr(rag_pipeline, 'load_encoder', lambda *args, **kwargs: SlowLoadingEncoder(encoder, 0.2))
+    rag = rag_pipeline.RAGSystem(store_dir)
+
+    chunks = rag.retrieve_chunks("late fee on my credit card", k=2)
+    assert chunks[0].complaint_id == 101
+    stages = rag.stats()['stages']
+    assert stages['model_load']['count'] == 1
+    assert stages['model_load']['max_ms'] >= 200
+    assert stages['encode']['max_ms'] < 200
+
+    view = rag.retrieve_view("money transfer pending", k=3)
+    assert len(view) == 3
+    assert rag.stats()['counters']['retrieve_view_requests'] == 1
+    assert rag.stats()['stages']['model_load']['count'] == 1
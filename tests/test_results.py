@@ -0,0 +1,48 @@
+import numpy as np
+import pyarrow as pa
+import pytest
+from results import ResultBatch
+from vector_store import ColumnStore
+
+
+class CountingStore(ColumnStore):
+    def __init__(self, table):
+        super().__init__(table)
+        self.takes = 0
+
+    def take(self, name, rows):
+        self.takes += 1
+        return super().take(name, rows)
+
+
+@pytest.fixture
+def batch():
+    n = 50
+    metadata = CountingStore(pa.table({
+        'text': [f"complaint text {i}" for i in range(n)],
+        'product': ['Credit card', 'Mortgage'] * (n // 2),
+        'chunk_index': np.arange(n) % 3,
+        'complaint_id': np.arange(1000, 1000 + n),
+        'issue_tags': np.arange(n, dtype=np.int64) % 7,
+    }))
+    rows = np.array([7, 3, 41, -1, 19])  # -1 is padding from a batched search
+    return ResultBatch(metadata, rows, np.array([0.9, 0.8, 0.7, -np.inf, 0.6], dtype=np.float32))
+
+
+def test_indexing_matches_materialized_chunks(batch):
+    chunks = batch.chunks()
+    assert len(batch) == 4
+    for i in range(-len(batch), len(batch)):
+        assert batch[i].to_dict() == chunks[i].to_dict()
+        assert batch[i].row == chunks[i].row
+    assert [c.to_dict() for c in batch[1:3]] == [c.to_dict() for c in chunks[1:3]]
+    assert type(batch[0].complaint_id) is int and type(batch[0].similarity) is float
+    with pytest.raises(IndexError):
+        batch[4]
+
+
+def test_indexing_gathers_each_column_once(batch):
+    for i in range(len(batch)):
+        batch[i]
+    # text, product, chunk_index, complaint_id, issue_tags (duplicate_count is absent)
+    assert batch.metadata.takes == 5
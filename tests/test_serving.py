@@ -0,0 +1,104 @@
+import asyncio
+import threading
+import pytest
+import rag_pipeline
+from chunking_embedding import create_embeddings
+from serving import MicroBatcher, ServiceOverloaded
+
+QUERIES = ["late fee on my credit card", "loan opened in my name", "money transfer pending",
+           "bank refuses to investigate fraud", "payment made on time"]
+
+
+@pytest.fixture
+def store_dir(tmp_path, monkeypatch, complaints, encoder):
+    store_dir = str(tmp_path / 'store')
+    create_embeddings(complaints, str(tmp_path / 'chunks.parquet'), store_dir=store_dir, encoder=encoder)
+    monkeypatch.setattr(rag_pipeline, 'load_encoder', lambda *args, **kwargs: encoder)
+    return store_dir
+
+
+@pytest.fixture
+def rag(store_dir):
+    return rag_pipeline.RAGSystem(store_dir)
+
+
+def ids(chunks):
+    return [chunk.complaint_id for chunk in chunks]
+
+
+@pytest.mark.parametrize('hybrid', [False, True])
+@pytest.mark.parametrize('filters', [None, {'product': ['Credit card', 'Personal loan']}])
+def test_batch_scores_all_queries_in_one_index_call(store_dir, hybrid, filters):
+    rag = rag_pipeline.RAGSystem(store_dir, hybrid=hybrid, hybrid_depth=2)
+    results = rag.retrieve_batch(QUERIES, k=2, filters=filters)
+    stages = rag.stats()['stages']
+    assert stages['search_batch']['count'] == 1
+    assert 'search' not in stages
+    for query, chunks in zip(QUERIES, results):
+        expected = rag.retrieve_chunks(query, k=2, filters=filters)
+        assert ids(chunks) == ids(expected)
+        assert [c.similarity for c in chunks] == pytest.approx([c.similarity for c in expected])
+
+
+def test_concurrent_requests_are_batched_with_per_request_k_and_filters(rag):
+    requests = [(query, 1 + i % 3, {'product': 'Credit card'} if i % 2 else None)
+                for i, query in enumerate(QUERIES * 4)]
+
+    async def run():
+        batcher = MicroBatcher(rag, max_batch_size=8, max_wait_ms=20)
+        try:
+            return await asyncio.gather(*(batcher.retrieve(q, k, f) for q, k, f in requests)), batcher.stats()
+        finally:
+            await batcher.stop()
+
+    results, stats = asyncio.run(run())
+    for (query, k, filters), chunks in zip(requests, results):
+        assert ids(chunks) == ids(rag.retrieve_chunks(query, k=k, filters=filters))
+    assert stats['requests'] == len(requests)
+    assert stats['batches'] < len(requests)
+
+
+def test_answer_and_stream_match_the_synchronous_answer(rag):
+    question = QUERIES[0]
+    expected_answer, expected_chunks = rag.generate_answer(question, rag.retrieve_chunks(question, k=3))
+
+    async def run():
+        batcher = MicroBatcher(rag)
+        try:
+            streamed = [update async for update in batcher.answer_stream(question, k=3)]
+            return streamed, await batcher.answer(question, k=3)
+        finally:
+            await batcher.stop()
+
+    streamed, (answer, chunks) = asyncio.run(run())
+    assert streamed[-1][0] == expected_answer == answer
+    assert ids(chunks) == ids(expected_chunks)
+    # Sections arrive one at a time, each extending the previous text
+    assert len(streamed) > 1
+    assert all(later[0].startswith(earlier[0]) for earlier, later in zip(streamed, streamed[1:]))
+
+
+def test_full_queue_rejects_requests(rag, monkeypatch):
+    release = threading.Event()
+    retrieve_batch = rag.retrieve_batch
+
+    def blocked(*args, **kwargs):
+        release.wait(5)
+        return retrieve_batch(*args, **kwargs)
+
+    monkeypatch.setattr(rag, 'retrieve_batch', blocked)
+
+    async def run():
+        batcher = MicroBatcher(rag, max_batch_size=1, max_queue=1, queue_timeout=0.05)
+        try:
+            tasks = [asyncio.ensure_future(batcher.retrieve(q)) for q in QUERIES]
+            await asyncio.sleep(0.2)
+            release.set()
+            return await asyncio.gather(*tasks, return_exceptions=True), batcher.stats()
+        finally:
+            await batcher.stop()
+
+    results, stats = asyncio.run(run())
+    rejected = [r for r in results if isinstance(r, ServiceOverloaded)]
+    assert rejected and stats['rejected'] == len(rejected)
+    assert all(isinstance(r, list) for r in results if r not in rejected)
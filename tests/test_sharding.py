@@ -0,0 +1,71 @@
+import multiprocessing as mp
+import numpy as np
+import pandas as pd
+import pytest
+from sharding import build_shards_from_parquet, ShardedSearcher, _shard_worker
+from vector_index import ExactIndex
+
+PRODUCTS = ['Credit card', 'Mortgage', 'Personal loan', 'Money transfers', 'Savings account']
+
+
+@pytest.fixture(scope='module')
+def corpus(tmp_path_factory):
+    rng = np.random.default_rng(0)
+    n, dim = 400, 16
+    embeddings = rng.normal(size=(n, dim)).astype(np.float32)
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+    path = str(tmp_path_factory.mktemp('shards') / 'chunks.parquet')
+    pd.DataFrame({'text': [f"chunk {i}" for i in range(n)], 'embedding': list(embeddings),
+                  'complaint_id': np.arange(n), 'product': [PRODUCTS[i % 5] for i in range(n)],
+                  'chunk_index': 0}).to_parquet(path)
+    return path, embeddings
+
+
+@pytest.mark.parametrize('by', ['hash', 'product'])
+def test_merged_results_match_exact_search(tmp_path, corpus, by):
+    path, embeddings = corpus
+    shard_dir = str(tmp_path / by)
+    build_shards_from_parquet(path, shard_dir, n_shards=3, by=by)
+    queries = embeddings[:5] + 0.1
+    exact = ExactIndex(embeddings)
+    with ShardedSearcher(shard_dir) as searcher:
+        results, answered = searcher.search_batch(queries, k=10)
+        assert answered == [0, 1, 2]
+        for query, hits in zip(queries, results):
+            similarities = [similarity for similarity, _, _ in hits]
+            assert similarities == sorted(similarities, reverse=True)
+            ids = [chunk.complaint_id for chunk in searcher.materialize(hits)]
+            assert ids == list(exact.search(query, 10)[0])
+
+
+def test_product_routing_is_case_insensitive(tmp_path, corpus):
+    path, _ = corpus
+    shard_dir = str(tmp_path / 'product')
+    build_shards_from_parquet(path, shard_dir, n_shards=3, by='product')
+    with ShardedSearcher(shard_dir) as searcher:
+        hits, answered = searcher.search(np.ones(16, dtype=np.float32), k=5, filters={'product': 'credit card'})
+        assert len(answered) == 1
+        assert {chunk.product for chunk in searcher.materialize(hits)} == {'Credit card'}
+
+
+def test_worker_reports_startup_failure(tmp_path):
+    parent_conn, child_conn = mp.Pipe()
+    _shard_worker(str(tmp_path / 'missing'), child_conn, 1)
+    state, detail = parent_conn.recv()
+    assert state == 'failed'
+    assert detail
+
+
+def test_dead_shard_is_skipped_and_survivors_are_merged(tmp_path, corpus):
+    path, embeddings = corpus
+    shard_dir = str(tmp_path / 'hash')
+    build_shards_from_parquet(path, shard_dir, n_shards=3, by='hash')
+    with ShardedSearcher(shard_dir) as searcher:
+        searcher._processes[1].kill()
+        searcher._processes[1].join()
+        for _ in range(2):
+            results, answered = searcher.search_batch(embeddings[:3], k=10)
+            assert answered == [0, 2]
+            assert all(len(hits) == 10 and {shard for _, shard, _ in hits} <= {0, 2} for hits in results)
+        assert searcher.dead_shards == {1}
+        assert searcher.partial_results == 2